@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""Headless ingestion of many LLRP readers from one asyncio event loop.
+
+    python IngestService.py 10.220.12.61 10.220.12.62:5084 --db tags.db
+    python IngestService.py --config ingest.json
+    python IngestService.py 10.220.12.61 10.220.12.62 --db tags.db --shards 4
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import time
+
+from sllurp.llrp import LLRPReaderConfig
+
+from db.create_tables import create_tags_table
+from db.sharded import SHARD_BY_EPC, SHARD_KEYS, ShardedTagWriter
+from db.writer import BatchedTagWriter
+from pipeline import metrics
+from pipeline.aggregator import TagAggregator
+from pipeline.aio_ingest import IngestionService
+from pipeline.recent import RecentReads, start_query_server
+from pipeline.reporting import REPORT_MODES, REPORT_N_TAGS, REPORT_PER_TAG, ReportProfile
+from pipeline.startup import parse_args_with_config
+
+logger = logging.getLogger("ingest")
+
+BATCH_SIZE = 1000        # Max tags handed to the sinks at once
+STATUS_INTERVAL = 30.0   # Seconds between reader status lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("hosts", nargs="*", help="reader address as host[:port]")
+    parser.add_argument("--db", default="tags.db", help="SQLite database file")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="write through this many writer processes, one database"
+                             " file each, instead of one writer thread (default: 0)")
+    parser.add_argument("--shard-by", choices=SHARD_KEYS, default=SHARD_BY_EPC,
+                        help="what picks a read's shard (default: epc)")
+    parser.add_argument("--antennas", default="1",
+                        help="comma-separated antenna IDs (default: 1)")
+    parser.add_argument("--tx-power", type=int, default=0,
+                        help="transmit power table index, 0 = max (default: 0)")
+    parser.add_argument("--report-mode", choices=REPORT_MODES,
+                        help="when readers send tag reports (default: n_tags if"
+                             " --report-every-n-tags is above 1, else per_tag)")
+    parser.add_argument("--report-every-n-tags", type=int, default=1,
+                        help="reads per report in n_tags mode")
+    parser.add_argument("--report-timeout-ms", type=int, default=200,
+                        help="longest a read waits for its report to fill (default: 200)")
+    parser.add_argument("--keepalive", type=int, default=10000,
+                        help="keepalive interval in ms, 0 to disable (default: 10000)")
+    parser.add_argument("--dedup-window", type=float, default=5.0,
+                        help="seconds before a tag still in view is stored again")
+    parser.add_argument("--queue-size", type=int, default=10000,
+                        help="max pending tag reports across all readers")
+    parser.add_argument("--fast-decode", action="store_true",
+                        help="decode tag reports without sllurp's generic decoder")
+    parser.add_argument("--metrics-port", type=int, default=9108,
+                        help="local /metrics endpoint port, 0 to disable (default: 9108)")
+    parser.add_argument("--query-port", type=int, default=9109,
+                        help="local recent-reads JSON API port, 0 to disable (default: 9109)")
+    parser.add_argument("--recent-horizon", type=float, default=300.0,
+                        help="seconds of reads the recent-reads API can answer for"
+                             " (default: 300)")
+    args = parse_args_with_config(parser, argv)
+    if not args.hosts:
+        parser.error("no reader hosts given")
+    if args.shards < 0:
+        parser.error("--shards cannot be negative")
+    if args.report_mode is None:
+        args.report_mode = REPORT_N_TAGS if args.report_every_n_tags > 1 else REPORT_PER_TAG
+    try:
+        args.report_profile = ReportProfile(args.report_mode,
+                                            n_tags=args.report_every_n_tags,
+                                            timeout_ms=args.report_timeout_ms)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def make_config_factory(args):
+    antennas = [int(x.strip()) for x in args.antennas.split(",")]
+
+    def config_factory():
+        config = LLRPReaderConfig(dict(
+            antennas=antennas,
+            tx_power=args.tx_power,
+            keepalive_interval=args.keepalive,
+            start_inventory=True,
+            reset_on_connect=True,
+            tag_content_selector={
+                'EnableROSpecID': False,
+                'EnableSpecIndex': False,
+                'EnableInventoryParameterSpecID': False,
+                'EnableAntennaID': True,
+                'EnableChannelIndex': True,
+                'EnablePeakRSSI': True,
+                'EnableFirstSeenTimestamp': True,
+                'EnableLastSeenTimestamp': True,
+                'EnableTagSeenCount': True,
+                'EnableAccessSpecID': False,
+            },
+        ))
+        return args.report_profile.apply(config)
+    return config_factory
+
+
+def make_consumer(aggregator, writer, recent=None, storage=None):
+    def store(batch):
+        if recent is not None:
+            recent.add_many(batch)
+        emitted = aggregator.update_many(batch)
+        if emitted:
+            metrics.TAGS_EMITTED.inc(len(emitted))
+            writer.put_many(emitted)
+
+    async def consume_reports(reports):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, batch = await reports.get()
+            start = time.perf_counter()
+            # Take whatever else is already waiting without yielding
+            while len(batch) < BATCH_SIZE and not reports.empty():
+                batch.extend(reports.get_nowait()[1])
+            # store() takes locks and waits while the writer's queue is
+            # full; off the loop, the readers' keepalive and idle timers
+            # keep running, and a slow disk fills the reports queue instead
+            await loop.run_in_executor(storage, store, batch)
+            metrics.BATCH_SECONDS.observe(time.perf_counter() - start)
+    return consume_reports
+
+
+async def log_status(service, aggregator, writer):
+    while True:
+        await asyncio.sleep(STATUS_INTERVAL)
+        for status in service.status():
+            logger.info("%(reader)s %(state)s connects=%(connects)d reports=%(reports)d",
+                        status)
+        logger.info("tags: %s | db: %s", aggregator.summary(), writer.format_stats())
+
+
+async def run(args):
+    aggregator = TagAggregator(window=args.dedup_window)
+    if args.shards:
+        writer = ShardedTagWriter(args.db, shards=args.shards, key=args.shard_by)
+    else:
+        writer = BatchedTagWriter(args.db)
+    writer.start()
+    # One thread, so batches reach the writer in the order they came in
+    storage = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="tag-storage")
+    recent = None
+    if args.query_port:
+        recent = RecentReads(horizon=args.recent_horizon)
+        start_query_server(recent, args.query_port)
+    service = IngestionService(args.hosts, make_config_factory(args),
+                               make_consumer(aggregator, writer, recent, storage),
+                               queue_size=args.queue_size,
+                               fast_decode=args.fast_decode,
+                               report_profile=args.report_profile)
+    if args.metrics_port:
+        metrics.start_metrics_server(args.metrics_port)
+    status = asyncio.ensure_future(log_status(service, aggregator, writer))
+    try:
+        await service.run()
+    finally:
+        status.cancel()
+        # Let a batch already handed off reach the writer before it closes
+        storage.shutdown(wait=True)
+        writer.close()
+        logger.info("db: %s", writer.format_stats())
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if not args.shards:
+        # Each shard sets up its own file
+        create_tags_table(args.db)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        logger.info("Exit detected, readers stopped.")
+
+
+if __name__ == "__main__":
+    # Needed by the shard processes in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
+    main()
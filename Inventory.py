@@ -1,67 +1,110 @@
 """Inventory command.
+
+    python Inventory.py 10.220.12.61 --time 10
+    python Inventory.py 10.220.12.61 --time 30 --benchmark --nth-unique 32 --json inv.json
+    python Inventory.py 10.220.12.61 --time 10 --no-reconnect  # a dropped reader stays down
 """
 
 from __future__ import print_function, division
+import argparse
 import logging
 import pprint
 import time
 
-from sllurp.util import monotonic
-from sllurp.llrp import LLRPReaderConfig, LLRPReaderClient, LLRPReaderState
+from sllurp.llrp import LLRP_DEFAULT_PORT, LLRPReaderConfig, LLRPReaderClient, LLRPReaderState
 from sllurp.log import get_logger
-from sllurp.log import is_general_debug_enabled, set_general_debug
 
-start_time = None
+from pipeline.results import write_results
+from pipeline.startup import parse_args_with_config
+from pipeline.supervisor import ReaderSupervisor
+from pipeline.throughput import ThroughputStats
 
-numtags = 0
 logger = get_logger(__name__)
+stats = None
+benchmark = False
+
 
 def finish_cb(reader):
-    runtime = monotonic() - start_time
-    logger.info('total # of tags seen: %d (%d tags/second)', numtags,
-                numtags/runtime)
+    s = stats.summary()
+    logger.info('%s done: %d tags so far (%s tags/second)', reader.get_peername(),
+                s['reads'], '%d' % s['tags_per_s'] if s['tags_per_s'] else 'n/a')
+
 
 def inventory_start_cb(reader, state):
-    global start_time
-    start_time = monotonic()
+    # Only the first reader to start inventorying starts the clock
+    stats.start()
 
 
 def tag_report_cb(reader, tags):
     """Function to run each time the reader reports seeing tags."""
-    global numtags
+    stats.record(tags)
+    # pformat is costly enough to skew the run, even when nothing is logged
+    if benchmark or not logger.isEnabledFor(logging.INFO):
+        return
     if len(tags):
         logger.info('saw tag(s): %s', pprint.pformat(tags))
-        for tag in tags:
-            numtags += tag['TagSeenCount']
     else:
         logger.info('no tags seen')
-        return
 
-def main():
-    class Args:
-        host = ['10.220.12.61']
-        antennas = '1'
-        frequencies = '0'
-        time = 10
-        every_n = 1
-        tx_power = 3000
-        tari = 0
-        session = 1
-        mode_identifier = 1002
-        population = 32
-        reconnect = False
-        reconnect_retries = 0
-        tag_filter_mask = None
-        hoptable_id = 0
-        keepalive_interval = 0
-        impinj_extended_configuration = None
-        impinj_search_mode = None
-        impinj_reports = False
-        port = 5084
-
-    args = Args()
-
-    global start_time
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run an inventory and report'
+                                                 ' how many tags were seen.')
+    parser.add_argument('host', nargs='*', default=['10.220.12.61'],
+                        help='reader address as host[:port]')
+    parser.add_argument('-p', '--port', type=int, default=LLRP_DEFAULT_PORT)
+    parser.add_argument('-t', '--time', type=float, default=10,
+                        help='seconds to inventory, 0 = until Ctrl-C (default: 10)')
+    parser.add_argument('-n', '--every-n', type=int, default=1,
+                        help='report every N tags (default: 1)')
+    parser.add_argument('-a', '--antennas', default='1',
+                        help='comma-separated antenna IDs (default: 1)')
+    parser.add_argument('-X', '--tx-power', type=int, default=3000,
+                        help='transmit power table index, 0 = max (default: 3000)')
+    parser.add_argument('-T', '--tari', type=int, default=0)
+    parser.add_argument('-s', '--session', type=int, default=1)
+    parser.add_argument('--mode-identifier', type=int, default=1002)
+    parser.add_argument('-P', '--population', type=int, default=32,
+                        help='expected tag population (default: 32)')
+    parser.add_argument('-f', '--frequencies', default='0',
+                        help='comma-separated channel indexes, 0 = automatic')
+    parser.add_argument('--hoptable-id', type=int, default=0)
+    parser.add_argument('--keepalive-interval', type=int, default=0,
+                        help='reader keepalives in ms, 0 = none (default: 1000,'
+                             ' 0 with --no-reconnect)')
+    parser.add_argument('--no-reconnect', dest='reconnect', action='store_false',
+                        help='stop a reader for good when its connection drops'
+                             ' instead of reconnecting with backoff')
+    parser.add_argument('--impinj-reports', action='store_true')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='quiet run with a throughput breakdown at the end')
+    parser.add_argument('--window', type=float, default=1.0,
+                        help='sliding window for the tags/s figures in seconds'
+                             ' (default: 1.0)')
+    parser.add_argument('--nth-unique', default=None,
+                        help='comma-separated N to time the Nth unique EPC for'
+                             ' (default with --benchmark: the population)')
+    parser.add_argument('--json', metavar='PATH',
+                        help="also write the summary as JSON ('-' for stdout)")
+    args = parse_args_with_config(parser, argv)
+    if args.nth_unique is None:
+        args.nth_unique = [args.population] if args.benchmark else []
+    else:
+        args.nth_unique = [int(x.strip()) for x in str(args.nth_unique).split(',')]
+    return args
+
+
+def main(argv=None):
+    global stats
+    global benchmark
+
+    args = parse_args(argv)
+    benchmark = args.benchmark
+    stats = ThroughputStats(window=args.window, nth_unique=args.nth_unique)
+    if benchmark:
+        # Per-report logging costs more than the decoding it would measure
+        logging.getLogger('sllurp').setLevel(logging.WARNING)
+        logger.setLevel(logging.WARNING)
 
     if not args.host:
         logger.info('No readers specified.')
@@ -81,14 +124,15 @@ def main():
         tag_population=args.population,
         start_inventory=True,
         disconnect_when_done=args.time and args.time > 0,
-        reconnect=args.reconnect,
-        reconnect_retries=args.reconnect_retries,
-        tag_filter_mask=args.tag_filter_mask,
+        reconnect=False,
+        reconnect_retries=0,
+        tag_filter_mask=None,
         tag_content_selector={
             'EnableROSpecID': False,
             'EnableSpecIndex': False,
             'EnableInventoryParameterSpecID': False,
-            'EnableAntennaID': False,
+            # For the per-antenna breakdown
+            'EnableAntennaID': args.benchmark,
             'EnableChannelIndex': True,
             'EnablePeakRSSI': False,
             'EnableFirstSeenTimestamp': False,
@@ -106,8 +150,8 @@ def main():
             'Automatic': False
         },
         keepalive_interval=args.keepalive_interval,
-        impinj_extended_configuration=args.impinj_extended_configuration,
-        impinj_search_mode=args.impinj_search_mode,
+        impinj_extended_configuration=None,
+        impinj_search_mode=None,
         impinj_tag_content_selector=None,
     )
     if args.impinj_reports:
@@ -122,6 +166,7 @@ def main():
 
 
     reader_clients = []
+    supervisors = {}
     for host in args.host:
         if ':' in host:
             host, port = host.split(':', 1)
@@ -135,40 +180,87 @@ def main():
         reader.add_tag_report_callback(tag_report_cb)
         reader.add_state_callback(LLRPReaderState.STATE_INVENTORYING, inventory_start_cb)
         reader_clients.append(reader)
+        if args.reconnect:
+            supervisors[reader] = ReaderSupervisor(
+                reader, keepalive_interval=args.keepalive_interval / 1000.0 or 1.0)
 
+    def is_alive(reader):
+        # A supervised reader is alive while it is being reconnected, too
+        if reader in supervisors:
+            return supervisors[reader].is_alive()
+        return reader.is_alive()
+
+    def disconnect(reader):
+        if reader in supervisors:
+            supervisors[reader].stop()
+        reader.disconnect()
 
-    start_time = monotonic()
     try:
         for reader in reader_clients:
-            reader.connect()
+            if reader in supervisors:
+                supervisors[reader].start()
+            else:
+                reader.connect()
     except Exception:
         if reader:
             logger.error("Failed to establish a connection with: %r",
                          reader.get_peername())
         # On one error, abort all
         for reader in reader_clients:
-            reader.disconnect()
+            disconnect(reader)
 
+    stopping = False
     while True:
         try:
             # Join all threads using a timeout so it doesn't block
             # Filter out threads which have been joined or are None
-            alive_readers = [reader for reader in reader_clients if reader.is_alive()]
+            alive_readers = [reader for reader in reader_clients if is_alive(reader)]
             if not alive_readers:
                 break
+            # sllurp ignores disconnect_when_done: the reader ends the
+            # ROSpec after --time but the connection stays up
+            if (args.time and not stopping and stats.started_at is not None
+                    and time.monotonic() - stats.started_at >= args.time):
+                stopping = True
+                # The reader stopped reading at the deadline, not when we noticed
+                stats.stop(stats.started_at + args.time)
+                for reader in alive_readers:
+                    disconnect(reader)
             for reader in alive_readers:
-                reader.join(1)
+                if reader.is_alive():
+                    reader.join(1)
+                else:
+                    # Between reconnect attempts: nothing to join yet
+                    time.sleep(1.0 / len(alive_readers))
         except (KeyboardInterrupt, SystemExit):
             # catch ctrl-C and stop inventory before disconnecting
             logger.info("Exit detected! Stopping readers...")
             for reader in reader_clients:
                 try:
-                    reader.disconnect()
+                    disconnect(reader)
                 except:
                     logger.exception("Error during disconnect. Ignoring...")
             break
 
     LLRPReaderClient.disconnect_all_readers()
+    for reader, supervisor in supervisors.items():
+        if supervisor.reconnects:
+            logger.info('%s: %s', reader.get_peername(), supervisor.format_stats())
+
+    if stats.stopped_at is None:
+        stats.stop()
+    if benchmark:
+        print(stats.format_table())
+    else:
+        s = stats.summary()
+        logger.info('total # of tags seen: %d (%s tags/second)', s['reads'],
+                    '%d' % s['tags_per_s'] if s['tags_per_s'] else 'n/a')
+    if args.json:
+        params = {k: getattr(args, k) for k in
+                  ('host', 'time', 'every_n', 'antennas', 'tx_power', 'session',
+                   'mode_identifier', 'population', 'window', 'nth_unique')}
+        write_results(args.json, 'inventory', [stats.summary()], params)
+    return 0
 
 if __name__ == "__main__":
     main()
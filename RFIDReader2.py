@@ -1,15 +1,39 @@
 #!/usr/bin/env python
+"""Read tags from an LLRP reader to the console, a text log and SQLite.
 
+    python RFIDReader2.py                                  # prompts
+    python RFIDReader2.py --headless --host 192.168.1.100 --log-file tags.txt
+    python RFIDReader2.py --headless --config reader.json
+"""
+
+import sys
 import time
+import datetime
 import logging
+import argparse
 import threading
-import sqlite3
-from queue import Queue, Empty
 from typing import Optional
 from collections import deque
-import tkinter as tk
-from tkinter import filedialog
 
+from db import queries
+from db.connection import get_connection
+from db.create_tables import create_tags_table
+from db.writer import BatchedTagWriter
+from pipeline.aggregator import TagAggregator
+from pipeline.commands import (
+    format_zone_event, format_zone_log, parse_reader_args, print_antenna_reads,
+    print_recent, print_where, print_zones)
+from pipeline.consumer import drain_batch
+from pipeline import metrics
+from pipeline.epc import epc_from_hex, epc_from_report, epc_hex
+from pipeline.fastreport import FastReportClient
+from pipeline.journal import TagJournal
+from pipeline.recent import RecentReads, start_query_server
+from pipeline.reporting import REPORT_AUTO, AdaptiveReporting
+from pipeline.startup import ReaderReady, wait_for_shutdown
+from pipeline.supervisor import ReaderSupervisor
+from pipeline.tagqueue import POLICY_SPILL, TagQueue
+from pipeline.textlog import TagLogWriter, FSYNC_NEVER
 from sllurp.llrp import (
     LLRP_DEFAULT_PORT,
     LLRPReaderClient,
@@ -20,12 +44,59 @@ from sllurp.llrp import (
 # -------- RFID CONFIGURATION -------- #
 PORT = LLRP_DEFAULT_PORT
 
+READY_TIMEOUT = 30.0  # Seconds to wait for the reader to finish its setup
+REPORT_MODE = REPORT_AUTO  # per_tag/n_tags/timed/auto; auto batches by read rate
+REPORT_N_TAGS = 100       # Reads per report in n_tags mode
+REPORT_TIMEOUT_MS = 200   # Longest a read waits for its batch (n_tags/timed/auto)
+RECONNECT = True          # Reconnect with backoff when the connection drops
+KEEPALIVE_INTERVAL = 1.0  # Seconds between reader keepalives; 3 missed = dead link
+FAST_RESUME = True        # Re-enable the reader's ROSpec instead of reconfiguring it
+
 # -------- GLOBALS -------- #
+STARTED_AT = time.monotonic()  # For the time-to-first-tag report
+FIRST_TAG_AT: Optional[float] = None
 READER: Optional[LLRPReaderClient] = None
-TAG_QUEUE = Queue()
+SUPERVISOR: Optional[ReaderSupervisor] = None
+ADAPTIVE_REPORTING: Optional[AdaptiveReporting] = None
+TAG_QUEUE_SIZE = 10000     # Reads held in memory for the consumer thread
+TAG_QUEUE_POLICY = POLICY_SPILL  # When full: block/drop_oldest/drop_duplicates/spill
+TAG_SPILL_DIR = "tag_spill"  # Overflow segments, replayed into the DB on catch-up
+TAG_QUEUE: Optional[TagQueue] = None  # Built in main(): the spill policy replays TAG_SPILL_DIR
+STOP_PROCESSING = threading.Event()  # Set on shutdown: drain TAG_QUEUE, then exit
 SEEN_TAGS = deque(maxlen=100)  # Keep latest 100 for reference
 LOG_FILE_PATH = "tag_reads.txt"
+LOG_WRITER: Optional[TagLogWriter] = None
+LOG_FLUSH_INTERVAL = 1.0         # Seconds between buffered log flushes...
+LOG_FLUSH_BYTES = 64 * 1024      # ...or flush once this much is pending
+LOG_FSYNC = FSYNC_NEVER          # FSYNC_ON_FLUSH / FSYNC_ALWAYS for audit lanes
+LOG_MAX_BYTES = 100 * 1024 ** 2  # Rotate past this size (None to disable)
+LOG_ROTATE_DAILY = True
+LOG_COMPRESS = True              # gzip rotated log segments
+LOG_FORMAT = "text"              # or "journal": binary segments, see TagJournal.py
+LOG_JOURNAL_DIR = "tag_journal"  # Default journal directory
+BATCH_SIZE = 500  # Max tags handed to the sinks at once
+DEDUP_WINDOW = 5.0         # Re-emit a tag still in the field every N seconds
+DEDUP_BY_ANTENNA = False   # Track each EPC separately per antenna
+MAX_TRACKED_TAGS = 100000  # LRU bound on tracked EPCs
+TAG_TTL = 600.0            # Forget tags not read for this many seconds
+AGGREGATOR = TagAggregator(window=DEDUP_WINDOW, by_antenna=DEDUP_BY_ANTENNA,
+                           max_tags=MAX_TRACKED_TAGS, ttl=TAG_TTL)
+METRICS_PORT = 9108        # Local /metrics endpoint (None to disable)
+RECENT_HORIZON = 300.0     # Seconds of reads kept for `recent`/`ant`/`where`...
+RECENT_BUCKET = 5.0        # ...in buckets this wide
+RECENT_READS = RecentReads(horizon=RECENT_HORIZON, bucket=RECENT_BUCKET)
+QUERY_PORT = 9109          # Local recent-reads JSON API (None to disable)
+ZONES = None               # e.g. {"dock": [1], "aisle": [2]}: arrival/departure events
+ZONE_ENTER_RSSI = -65.0    # dBm a tag's smoothed RSSI must reach to arrive...
+ZONE_EXIT_RSSI = -72.0     # ...and stay above to stay (hysteresis)
+ZONE_TIMEOUT = 3.0         # Seconds without a strong read before a tag departs
+PRESENCE = None            # PresenceEngine, when ZONES are set
+FAST_DECODE = True         # Decode tag reports without sllurp's generic parser
 DB_FILE = "tags.db"
+DB_WRITER: Optional[BatchedTagWriter] = None
+DB_BATCH_SIZE = 500        # Commit once this many reads are pending...
+DB_FLUSH_INTERVAL = 0.5    # ...or this many seconds after the first one
+DB_SYNCHRONOUS = "NORMAL"  # FULL for audit-grade durability
 
 # -------- LOGGING SETUP -------- #
 logging.basicConfig(level=logging.INFO)
@@ -36,54 +107,84 @@ sllurp_logger.addHandler(logging.StreamHandler())
 
 # -------- DATABASE SETUP -------- #
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS tag_reads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            epc TEXT NOT NULL,
-            antenna INTEGER,
-            channel INTEGER,
-            seen_count INTEGER,
-            last_seen TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    create_tags_table(DB_FILE)
+
+
+def start_db_writer():
+    global DB_WRITER
+    DB_WRITER = BatchedTagWriter(DB_FILE,
+                                 batch_size=DB_BATCH_SIZE,
+                                 flush_interval=DB_FLUSH_INTERVAL,
+                                 synchronous=DB_SYNCHRONOUS)
+    DB_WRITER.start()
 
 
 def save_tag_to_db(tag_data):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO tag_reads (epc, antenna, channel, seen_count, last_seen)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
-        tag_data["epc"],
-        tag_data["antenna"],
-        tag_data["channel"],
-        tag_data["seen_count"],
-        tag_data["last_seen"]
-    ))
-    conn.commit()
-    conn.close()
+    DB_WRITER.put(tag_data)
+
+
+def save_tags_to_db(tags):
+    DB_WRITER.put_many(tags)
+
+
+def print_last_seen(epc):
+    try:
+        last_seen = queries.last_seen(get_connection(DB_FILE), epc_from_hex(epc))
+    except ValueError:
+        print(f"❌ Not a hex EPC: {epc}")
+        return
+    if last_seen is None:
+        print(f"🔍 {epc} was never seen.")
+    else:
+        seen_at = datetime.datetime.fromtimestamp(last_seen / 1e6)
+        print(f"🔍 {epc} last seen at {seen_at:%Y-%m-%d %H:%M:%S.%f}")
+
+
+def print_db_stats():
+    if DB_WRITER:
+        print(f"💾 DB writer: {DB_WRITER.format_stats()}")
 
 
 # -------- CALLBACKS -------- #
-def tag_report_cb(_reader, tag_reports):
+def tag_report_cb(reader, tag_reports):
     """Callback for tag reads"""
+    start = time.perf_counter()
+    reports, tag_reads = metrics.reader_counters(reader)
+    reports.inc()
+    tag_reads.inc(len(tag_reports))
+    # Same `reader` as the records the fast path builds
+    peer = metrics.reader_label(reader)
+    if ADAPTIVE_REPORTING is not None:
+        ADAPTIVE_REPORTING.observe(len(tag_reports))
     for tag in tag_reports:
         try:
             tag_data = {
-                "epc": tag["EPC"].decode("ascii"),
+                "epc": epc_from_report(tag["EPC"]),
                 "channel": tag.get("ChannelIndex"),
                 "antenna": tag.get("AntennaID"),
+                "rssi": tag.get("PeakRSSI"),
+                "first_seen": tag.get("FirstSeenTimestampUTC"),
                 "last_seen": tag.get("LastSeenTimestampUTC"),
                 "seen_count": tag.get("TagSeenCount"),
+                "reader": peer,
             }
             TAG_QUEUE.put(tag_data)
         except Exception as e:
+            metrics.PARSE_ERRORS.inc()
             print(f"⚠️ Error parsing tag: {e}")
+    metrics.CALLBACK_SECONDS.observe(time.perf_counter() - start)
+
+
+def tag_records_cb(reader, records):
+    """Callback for reports decoded by the fast path, already tag dicts"""
+    start = time.perf_counter()
+    reports, tag_reads = metrics.reader_counters(reader)
+    reports.inc()
+    tag_reads.inc(len(records))
+    if ADAPTIVE_REPORTING is not None:
+        ADAPTIVE_REPORTING.observe(len(records))
+    TAG_QUEUE.put_many(records)
+    metrics.CALLBACK_SECONDS.observe(time.perf_counter() - start)
 
 
 def connection_event_cb(_reader, event):
@@ -97,6 +198,10 @@ def connection_event_cb(_reader, event):
 # -------- COMMAND FUNCTIONS -------- #
 def clear_tag_data():
     SEEN_TAGS.clear()
+    AGGREGATOR.clear()
+    RECENT_READS.clear()
+    if PRESENCE is not None:
+        PRESENCE.clear()
     print("🧹 Tag data cleared.")
 
 
@@ -117,35 +222,153 @@ def print_reader_state():
     if READER and READER.is_alive():
         print(
             f"📊 Reader state: {LLRPReaderState.getStateName(READER.llrp.state)}")
+        print(f"📨 Reports: every {READER.config.report_every_n_tags} tags"
+              f" or {READER.config.report_timeout_ms} ms ({REPORT_MODE})")
     else:
         print("🔌 Reader not connected.")
+    if SUPERVISOR is not None:
+        print(f"🔁 Connection: {SUPERVISOR.format_stats()}")
+    print(f"🏷️ Tags: {AGGREGATOR.summary()}")
+    print(f"📥 Queue: {TAG_QUEUE.format_stats()}")
+
+
+# -------- METRICS -------- #
+def start_metrics():
+    """Serve /metrics on localhost so queue depth and latencies can be scraped"""
+    metrics.QUEUE_DEPTH.set_function(TAG_QUEUE.qsize)
+    if METRICS_PORT:
+        try:
+            metrics.start_metrics_server(METRICS_PORT)
+            print(f"📈 Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ Metrics endpoint disabled: {e}")
+
+
+# -------- RECENT READS -------- #
+def start_query_api():
+    """Serve the recent reads as JSON on localhost, for other local tools"""
+    if QUERY_PORT:
+        try:
+            start_query_server(RECENT_READS, QUERY_PORT)
+            print(f"🔎 Recent reads on http://127.0.0.1:{QUERY_PORT}/recent")
+        except OSError as e:
+            print(f"⚠️ Recent reads API disabled: {e}")
+
+
+# -------- ZONES -------- #
+def start_presence(zones, enter_rssi, exit_rssi, timeout):
+    """Track zone presence; NumPy is only loaded when zones are configured"""
+    global PRESENCE
+    from pipeline.presence import PresenceEngine
+
+    PRESENCE = PresenceEngine(zones, enter_rssi=enter_rssi, exit_rssi=exit_rssi,
+                              timeout=timeout)
+    print("🚪 Zones: " + ", ".join(f"{name} (antennas {', '.join(map(str, antennas))})"
+                                  for name, antennas in zones.items()))
+
+
+def handle_zone_events(events):
+    if not events:
+        return
+    print("\n".join(format_zone_event(event) for event in events))
+    # The journal holds tag reads only
+    if LOG_FORMAT == "text":
+        LOG_WRITER.write_lines(format_zone_log(event) for event in events)
+
+
+# -------- TAG LOG -------- #
+def open_log_writer():
+    global LOG_WRITER
+    if LOG_FORMAT == "journal":
+        LOG_WRITER = TagJournal(LOG_FILE_PATH,
+                                flush_interval=LOG_FLUSH_INTERVAL,
+                                flush_bytes=LOG_FLUSH_BYTES,
+                                max_bytes=LOG_MAX_BYTES,
+                                rotate_daily=LOG_ROTATE_DAILY,
+                                fsync=LOG_FSYNC)
+        return
+    LOG_WRITER = TagLogWriter(LOG_FILE_PATH,
+                              flush_interval=LOG_FLUSH_INTERVAL,
+                              flush_bytes=LOG_FLUSH_BYTES,
+                              max_bytes=LOG_MAX_BYTES,
+                              rotate_daily=LOG_ROTATE_DAILY,
+                              compress=LOG_COMPRESS,
+                              fsync=LOG_FSYNC)
 
 
 # -------- THREAD: TAG DISPLAY -------- #
-def process_tags_console():
+def format_tag_display(tag):
+    return (f"\n📦 New tag:\n"
+            f" - EPC: {epc_hex(tag['epc'])} | Antenna: {tag['antenna']} |"
+            f" Ch: {tag['channel']} | Seen: {tag['seen_count']}x | Time: {tag['last_seen']}")
+
+
+def format_tag_log(tag):
+    return (f"{tag['last_seen']}, EPC: {epc_hex(tag['epc'])}, Antenna: {tag['antenna']},"
+            f" Channel: {tag['channel']}, SeenCount: {tag['seen_count']}\n")
+
+
+def handle_tag_batch(tags):
+    """Send a batch of tags to the console, the log file and SQLite"""
+    # Every read, before deduplication, for the live queries
+    RECENT_READS.add_many(tags)
+    if PRESENCE is not None:
+        handle_zone_events(PRESENCE.update(tags))
+    # Only new tags and tags whose dedup window expired go any further
+    tags = AGGREGATOR.update_many(tags)
+    if not tags:
+        return
+    metrics.TAGS_EMITTED.inc(len(tags))
+    SEEN_TAGS.extend(tags)
+    print("\n".join(format_tag_display(tag) for tag in tags))
+    if LOG_FORMAT == "journal":
+        LOG_WRITER.write_tags(tags)
+    else:
+        LOG_WRITER.write_lines(format_tag_log(tag) for tag in tags)
+    save_tags_to_db(tags)  # Save to SQLite
+
+
+def report_first_tag():
+    global FIRST_TAG_AT
+    FIRST_TAG_AT = time.monotonic()
+    print(f"⏱️ First tag {FIRST_TAG_AT - STARTED_AT:.2f}s after start")
+
+
+def process_tags_console(tag_queue):
+    while not STOP_PROCESSING.is_set():
+        try:
+            tags = drain_batch(tag_queue, BATCH_SIZE, timeout=0.2)
+            if tags:
+                if FIRST_TAG_AT is None:
+                    report_first_tag()
+                start = time.perf_counter()
+                handle_tag_batch(tags)
+                metrics.BATCH_SECONDS.observe(time.perf_counter() - start)
+            else:
+                if PRESENCE is not None:
+                    # Departures still happen when nothing is being read
+                    handle_zone_events(PRESENCE.poll())
+                LOG_WRITER.poll()
+        except Exception as e:
+            metrics.PROCESSING_ERRORS.inc()
+            print(f"❌ Error in tag processing thread: {e}")
+    # Shutting down: what is still queued reaches the sinks before they close
     while True:
+        tags = drain_batch(tag_queue, BATCH_SIZE, timeout=0)
+        if not tags:
+            break
         try:
-            tag = TAG_QUEUE.get(timeout=0.2)
-            epc = tag["epc"]
-            SEEN_TAGS.append(tag)
-            print(f"\n📦 New tag:")
-            print(f" - EPC: {epc} | Antenna: {tag['antenna']} |"
-                  f" Ch: {tag['channel']} | Seen: {tag['seen_count']}x | Time: {tag['last_seen']}")
-            with open(LOG_FILE_PATH, "a") as f:
-                f.write(f"{tag['last_seen']}, EPC: {epc}, Antenna: {tag['antenna']},"
-                        f" Channel: {tag['channel']}, SeenCount: {tag['seen_count']}\n")
-            save_tag_to_db(tag)  # Save to SQLite
-        except Empty:
-            continue
+            handle_tag_batch(tags)
         except Exception as e:
+            metrics.PROCESSING_ERRORS.inc()
             print(f"❌ Error in tag processing thread: {e}")
-        time.sleep(0.05)
 
 
 # -------- USER INTERFACE LOOP -------- #
 def user_interface():
     while True:
-        print("\nCommands: [start] [stop] [clear] [state] [exit]")
+        print("\nCommands: [start] [stop] [clear] [state] [db] [seen <EPC>] [recent [s]]"
+              " [ant <N> [s]] [where <EPC> [s]] [zones] [exit]")
         cmd = input(">> ").strip().lower()
         if cmd == "start":
             start_reading()
@@ -155,6 +378,18 @@ def user_interface():
             clear_tag_data()
         elif cmd == "state":
             print_reader_state()
+        elif cmd == "db":
+            print_db_stats()
+        elif cmd.startswith("seen "):
+            print_last_seen(cmd.split(None, 1)[1])
+        elif cmd == "recent" or cmd.startswith("recent "):
+            print_recent(RECENT_READS, cmd.split()[1:])
+        elif cmd.startswith("ant "):
+            print_antenna_reads(RECENT_READS, cmd.split()[1:])
+        elif cmd.startswith("where "):
+            print_where(RECENT_READS, cmd.split()[1:])
+        elif cmd == "zones":
+            print_zones(PRESENCE)
         elif cmd == "exit":
             stop_reading()
             break
@@ -162,17 +397,50 @@ def user_interface():
             print("❓ Unknown command.")
 
 
+# -------- COMMAND LINE -------- #
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log-file", help="tag log path (prompted for if omitted)")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database file")
+    parser.add_argument("--headless", action="store_true",
+                        help="no prompt or command loop: start inventory on connect"
+                             " and run until Ctrl-C or SIGTERM")
+    return parse_reader_args(
+        parser, argv, port=PORT, log_format=LOG_FORMAT, ready_timeout=READY_TIMEOUT,
+        reconnect=RECONNECT, keepalive=KEEPALIVE_INTERVAL, fast_resume=FAST_RESUME,
+        report_mode=REPORT_MODE, report_n=REPORT_N_TAGS,
+        report_timeout_ms=REPORT_TIMEOUT_MS, zones=ZONES,
+        zone_enter_rssi=ZONE_ENTER_RSSI, zone_exit_rssi=ZONE_EXIT_RSSI,
+        zone_timeout=ZONE_TIMEOUT)
+
+
 # -------- MAIN -------- #
-def main():
+def main(argv=None):
     global READER
+    global SUPERVISOR
+    global REPORT_MODE
+    global ADAPTIVE_REPORTING
     global LOG_FILE_PATH
+    global LOG_FORMAT
+    global TAG_QUEUE
+    global DB_FILE
+
+    args = parse_args(argv)
+    REPORT_MODE = args.report_mode
+    profile = args.report_profile
+    DB_FILE = args.db
 
     # Setup SQLite
     init_db()
 
-    # File save dialog
-    log_path = input(
-        "📁 Enter file path to save tag logs (or press Enter to use default: tag_reads.txt): ").strip()
+    LOG_FORMAT = args.log_format
+    log_path = args.log_file
+    if LOG_FORMAT == "journal":
+        # A directory, not a file to pick
+        log_path = log_path or LOG_JOURNAL_DIR
+    if log_path is None and not args.headless:
+        log_path = input(
+            "📁 Enter file path to save tag logs (or press Enter to use default: tag_reads.txt): ").strip()
 
     if log_path:
         LOG_FILE_PATH = log_path
@@ -180,20 +448,29 @@ def main():
     else:
         print("ℹ️ Using default log file: tag_reads.txt")
 
-    reader_ip = input(
+    reader_ip = args.host or input(
         "🔧 Enter RFID reader IP address (e.g., 192.168.1.100): ").strip()
     if not reader_ip:
         print("❌ No IP address entered. Exiting...")
-        return
+        return 1
+
+    TAG_QUEUE = TagQueue(TAG_QUEUE_SIZE, TAG_QUEUE_POLICY, spill_dir=TAG_SPILL_DIR)
+    open_log_writer()
+    if args.zones:
+        start_presence(args.zones, args.zone_enter_rssi, args.zone_exit_rssi,
+                       args.zone_timeout)
+    start_metrics()
+    start_query_api()
+    start_db_writer()
 
     print("🚀 Initializing RFID Reader...")
 
     config = LLRPReaderConfig()
     config.reset_on_connect = True
-    config.start_inventory = False
+    config.start_inventory = args.headless  # Nobody will type "start"
     config.tx_power = {0: 0, 1: 0}
     config.antennas = [0, 1]
-    config.report_every_n_tags = 1
+    profile.apply(config)  # Report trigger: every tag, every N or timed
     config.reader_mode = None
     config.search_mode = None
     config.tag_content_selector = {
@@ -209,25 +486,59 @@ def main():
         'EnableAccessSpecID': False,
     }
 
-    READER = LLRPReaderClient(reader_ip, PORT, config)
+    if FAST_DECODE:
+        READER = FastReportClient(reader_ip, args.port, config)
+        READER.add_tag_record_callback(tag_records_cb)
+    else:
+        READER = LLRPReaderClient(reader_ip, args.port, config)
+    # Reports the fast path cannot decode still arrive here
     READER.add_tag_report_callback(tag_report_cb)
     READER.add_event_callback(connection_event_cb)
-    READER.connect()
-
-    time.sleep(2)
-
-    print("✅ Reader connected. Ready for commands.")
+    if REPORT_MODE == REPORT_AUTO:
+        ADAPTIVE_REPORTING = AdaptiveReporting(READER, profile)
+    if args.reconnect:
+        SUPERVISOR = ReaderSupervisor(READER, keepalive_interval=args.keepalive,
+                                      fast_resume=args.fast_resume)
+    ready = ReaderReady(READER)
+    if SUPERVISOR is not None:
+        SUPERVISOR.start()
+    else:
+        READER.connect()
 
-    tag_thread = threading.Thread(target=process_tags_console, daemon=True)
+    tag_thread = threading.Thread(target=process_tags_console, args=(TAG_QUEUE,),
+                                  daemon=True)
     tag_thread.start()
 
-    user_interface()
+    is_ready = ready.wait(args.ready_timeout)
+    if is_ready:
+        print(f"✅ Reader ready after {time.monotonic() - STARTED_AT:.2f}s.")
+        if args.headless:
+            print("📡 Inventory running. Ctrl-C to stop.")
+            wait_for_shutdown(SUPERVISOR.is_alive if SUPERVISOR else READER.is_alive)
+        else:
+            user_interface()
+    else:
+        print(f"❌ Reader not ready after {args.ready_timeout:.0f}s. Exiting...")
 
+    if SUPERVISOR is not None:
+        SUPERVISOR.stop()
+        print(f"🔁 Connection: {SUPERVISOR.format_stats()}")
     if READER and READER.is_alive():
         READER.llrp.stopPolitely()
-        READER.disconnect()
+        # Wait for it, so no report arrives after the queue is drained
+        READER.disconnect(timeout=5)
         print("👋 Reader disconnected. Exiting...")
 
+    STOP_PROCESSING.set()
+    tag_thread.join()
+
+    # Flush pending reads before the process goes away
+    LOG_WRITER.close()
+    DB_WRITER.close()
+    TAG_QUEUE.close()
+    print_db_stats()
+    return 0 if is_ready else 1
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
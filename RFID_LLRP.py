@@ -3,7 +3,6 @@
 import time
 import logging
 import threading
-from queue import Queue
 from typing import Optional
 
 from sllurp.llrp import (
@@ -13,12 +12,14 @@ from sllurp.llrp import (
     LLRPReaderState,
 )
 
+from pipeline.tagqueue import POLICY_DROP_OLDEST, TagQueue
+
 # -------- RFID CONFIGURATION -------- #
 PORT = LLRP_DEFAULT_PORT
 
 # -------- GLOBALS -------- #
 READER: Optional[LLRPReaderClient] = None
-TAG_QUEUE = Queue()
+TAG_QUEUE = TagQueue(1000, POLICY_DROP_OLDEST)  # Whole reports; the console keeps the newest
 TAG_DATA = []
 
 # -------- LOGGING SETUP -------- #
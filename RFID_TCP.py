@@ -1,20 +1,21 @@
-import paramiko
-import tkinter as tk
-from tkinter import filedialog
+"""Save the output of a reader CLI command (`show tags`) over SSH.
 
-# _______Ask user to choose output file path__________
-root = tk.Tk()
-root.withdraw()
+    python RFID_TCP.py                                   # file dialog
+    python RFID_TCP.py --output tags.txt --host 10.220.12.61
+    python RFID_TCP.py --host 10.220.12.61,10.220.12.62 --output "tags-{host}.txt" --interval 30
+    python RFID_TCP.py --output tags.txt --db tags.db        # also parsed into SQLite
+    python RFID_TCP.py --config ssh.json
+"""
 
-output_file = filedialog.asksaveasfilename(
-    defaultextension=".txt",
-    filetypes=[("Text files", "*.txt")],
-    title="Save RFID output as..."
-)
+import argparse
+import os
+import sys
 
-if not output_file:
-    print("No file selected. Exiting.")
-    exit(1)
+from db.create_tables import create_tags_table
+from db.writer import BatchedTagWriter
+from pipeline.showtags import ShowTagsParser
+from pipeline.sshfleet import SSHCollector, SSHSession
+from pipeline.startup import parse_args_with_config
 
 # _____ SSH Config_____
 hostname = "10.220.12.61"
@@ -22,29 +23,135 @@ username = "admin"
 password = "Eneo@1234"
 command = "show tags"
 
-# Initialize SSH Client
 
-client = paramiko.SSHClient()
-client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=hostname,
+                        help="reader address as host[:port], comma-separated for a fleet")
+    parser.add_argument("--username", default=username)
+    parser.add_argument("--password", default=os.environ.get("RFID_SSH_PASSWORD", password),
+                        help="SSH password (default: $RFID_SSH_PASSWORD)")
+    parser.add_argument("--command", default=command, help="CLI command to run")
+    parser.add_argument("--output",
+                        help="file to save the output to (chosen in a file dialog if omitted);"
+                             " {host} in the name is replaced by the reader, which"
+                             " several hosts need (added before the extension if missing)")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="poll every this many seconds, 0 = once (default: 0)")
+    parser.add_argument("--polls", type=int,
+                        help="stop after this many polls (default: 1, or forever with"
+                             " --interval)")
+    parser.add_argument("--workers", type=int,
+                        help="readers polled at once (default: all of them)")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="SSH connect and read timeout in seconds (default: 10)")
+    parser.add_argument("--db",
+                        help="also parse the output into tag records in this SQLite database")
+    args = parse_args_with_config(parser, argv)
+    hosts = args.host if isinstance(args.host, list) else str(args.host).split(",")
+    args.hosts = [h.strip() for h in hosts if h.strip()]
+    if not args.hosts:
+        parser.error("no reader host given")
+    if args.polls is None and not args.interval:
+        args.polls = 1
+    return args
 
-try:
-    client.connect(hostname, username=username, password=password)
-    print("[INFO] SSH CONNECTION SUCCESSFUL.")
 
-    stdin, stdout, stderr = client.exec_command(command)
-    with open(output_file, "w") as f:
-        print(f"[INFO] Connected to {hostname}. Output from `{command}`:\n")
-        for line in stdout:
+def ask_output_file():
+    """Ask for the output file in a Tk dialog; tkinter is only loaded here"""
+    import tkinter as tk
+    from tkinter import filedialog
+
+    # _______Ask user to choose output file path__________
+    root = tk.Tk()
+    root.withdraw()
+
+    output_file = filedialog.asksaveasfilename(
+        defaultextension=".txt",
+        filetypes=[("Text files", "*.txt")],
+        title="Save RFID output as..."
+    )
+    root.destroy()
+    return output_file
+
+
+def output_path(template, host):
+    return template.replace("{host}", host.replace(":", "_"))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    output_file = args.output or ask_output_file()
+    if not output_file:
+        print("No file selected. Exiting.")
+        return 1
+    if len(args.hosts) > 1 and "{host}" not in output_file:
+        # One file per reader
+        root, ext = os.path.splitext(output_file)
+        output_file = root + "-{host}" + ext
+
+    sessions = [SSHSession(host, args.username, args.password, timeout=args.timeout)
+                for host in args.hosts]
+    files = {s.name: open(output_path(output_file, s.name), "w") for s in sessions}
+    # A single one-off run echoes the output like it always did
+    echo = len(sessions) == 1 and args.polls == 1
+
+    writer = None
+    parsers = {}
+    if args.db:
+        create_tags_table(args.db)
+        writer = BatchedTagWriter(args.db)
+        writer.start()
+        parsers = {s.name: ShowTagsParser(reader=s.name) for s in sessions}
+
+    def on_line(session, line):
+        files[session.name].write(line)
+        if echo:
             print(line.strip())
-            f.write(line)
+        if writer is not None:
+            records = parsers[session.name].feed(line)
+            if records:
+                writer.put_many(records)
 
-    error_output = stderr.read().decode()
-    if error_output:
-        print(f"[ERROR] {error_output}")
+    collector = SSHCollector(sessions, args.command, on_line, workers=args.workers)
+    failed = False
+    try:
+        if echo:
+            print(f"[INFO] Output from `{args.command}` on {args.hosts[0]}:\n")
+        for poll in collector.run(args.interval, args.polls):
+            failed = False
+            for result in poll["results"]:
+                files[result["host"]].flush()
+                if writer is not None:
+                    # The last key/value record ends with the output
+                    writer.put_many(parsers[result["host"]].flush())
+                if result["error"]:
+                    failed = True
+                    print(f"[ERROR] {result['host']}: FAILED: {result['error']}")
+                    continue
+                if result["stderr"]:
+                    print(f"[ERROR] {result['host']}: {result['stderr']}")
+                print(f"[INFO] {result['host']}: {result['lines']} lines"
+                      f" in {result['seconds']:.2f}s")
+                if writer is not None:
+                    print(f"[INFO] {result['host']}: {parsers[result['host']].records}"
+                          f" tag records parsed so far")
+            if len(sessions) > 1:
+                slowest = max(r["seconds"] for r in poll["results"])
+                print(f"[INFO] Poll {poll['poll']}: {len(sessions)} readers in"
+                      f" {poll['seconds']:.2f}s (slowest reader {slowest:.2f}s)")
+    except KeyboardInterrupt:
+        print("[INFO] Stopped.")
+    finally:
+        collector.close()
+        for f in files.values():
+            f.close()
+        if writer is not None:
+            writer.close()
+            print(f"[INFO] DB: {writer.format_stats()}")
+    return 1 if failed else 0
 
-except Exception as e:
-    print(f"[ERROR] FAILED TO CONNECT: {e}")
-    exit(1)
 
-finally:
-    client.close()
+if __name__ == "__main__":
+    sys.exit(main())
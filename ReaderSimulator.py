@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Local LLRP reader simulator for load testing the tag pipeline.
+
+    python ReaderSimulator.py --rate 10000 --population 2000 --antennas 4
+    python RFIDReader.py        # then enter 127.0.0.1 as the reader IP
+    python ReaderSimulator.py --drop-every 20      # reset connections every 20 s
+    python ReaderSimulator.py --stall-every 30 --stall-for 5
+
+Any sllurp client (RFIDReader*, logger.py, Inventory.py, IngestService.py)
+can connect to it as if it were a real reader on port 5084.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from pipeline.simulator import ReaderSimulator
+
+logger = logging.getLogger("simulator")
+
+STATS_INTERVAL = 5.0   # Seconds between throughput lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=5084)
+    parser.add_argument("--readers", type=int, default=1,
+                        help="number of simulated readers on consecutive ports")
+    parser.add_argument("--population", type=int, default=500,
+                        help="number of distinct tags in the field")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="tag reads per second per connection")
+    parser.add_argument("--antennas", type=int, default=4)
+    parser.add_argument("--channels", type=int, default=50)
+    parser.add_argument("--rssi-mean", type=float, default=-55.0,
+                        help="mean RSSI of the population in dBm")
+    parser.add_argument("--rssi-std", type=float, default=6.0,
+                        help="spread of per-tag mean RSSI in dB")
+    parser.add_argument("--rssi-jitter", type=float, default=2.0,
+                        help="read-to-read RSSI noise in dB")
+    parser.add_argument("--report-interval", type=float, default=0.2,
+                        help="seconds between reports when the client sets no N")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--response-delay", type=float, default=0.0, metavar="SECONDS",
+                        help="wait before answering each request, like a real reader")
+    parser.add_argument("--drop-every", type=float, metavar="SECONDS",
+                        help="reset every client connection this often")
+    parser.add_argument("--stall-every", type=float, metavar="SECONDS",
+                        help="stop sending to the clients this often, for --stall-for")
+    parser.add_argument("--stall-for", type=float, default=5.0, metavar="SECONDS",
+                        help="how long each stall lasts (default: 5)")
+    return parser.parse_args(argv)
+
+
+async def log_stats(sim):
+    last = sim.stats()
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        stats = sim.stats()
+        logger.info("%d connections | %.0f tags/s in %.0f reports/s | %.1f MB sent",
+                    stats["connections"],
+                    (stats["tags"] - last["tags"]) / STATS_INTERVAL,
+                    (stats["reports"] - last["reports"]) / STATS_INTERVAL,
+                    stats["bytes"] / 1e6)
+        last = stats
+
+
+async def inject_faults(interval, fault, description):
+    while True:
+        await asyncio.sleep(interval)
+        count = fault()
+        if count:
+            logger.warning("Injected fault: %s (%d connections)", description, count)
+
+
+async def run(args):
+    sim = ReaderSimulator(
+        host=args.host, port=args.port, readers=args.readers,
+        population=args.population, rate=args.rate, antennas=args.antennas,
+        rssi_mean=args.rssi_mean, rssi_std=args.rssi_std,
+        rssi_jitter=args.rssi_jitter, channels=args.channels,
+        report_interval=args.report_interval, seed=args.seed,
+        response_delay=args.response_delay)
+    tasks = [asyncio.ensure_future(log_stats(sim))]
+    if args.drop_every:
+        tasks.append(asyncio.ensure_future(inject_faults(
+            args.drop_every, sim.drop_connections, "connections reset")))
+    if args.stall_every:
+        tasks.append(asyncio.ensure_future(inject_faults(
+            args.stall_every, lambda: sim.stall_connections(args.stall_for),
+            "link stalled for %.1fs" % args.stall_for)))
+    try:
+        await sim.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        logger.info("Simulator stopped.")
+
+
+if __name__ == "__main__":
+    main()
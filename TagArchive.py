@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Export closed days of the tag database to the memory-mapped column archive.
+
+    python TagArchive.py --db tags.db --dir archive
+    python TagArchive.py --db tags.db --dir archive --interval 3600 --prune
+    python TagArchive.py --dir archive --stats 2026-10-17
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import time
+
+import numpy as np
+
+from db.archive import MISSING_RSSI, ArchiveDay, archive_closed_days
+from pipeline.startup import parse_args_with_config
+
+logger = logging.getLogger("archive")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="tags.db", help="SQLite database file")
+    parser.add_argument("--dir", default="archive", help="archive directory (default: archive)")
+    parser.add_argument("--grace", type=float, default=300.0,
+                        help="seconds after midnight UTC before a day is exported,"
+                             " for late reads (default: 300)")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="keep running and export every N seconds (default: once)")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete archived reads from the database")
+    parser.add_argument("--stats", metavar="DAY", type=datetime.date.fromisoformat,
+                        help="print analytics of an archived day (YYYY-MM-DD) and exit")
+    return parse_args_with_config(parser, argv)
+
+
+def _time_of(timestamp_us):
+    return datetime.datetime.fromtimestamp(timestamp_us / 1e6, datetime.timezone.utc).time()
+
+
+def print_stats(archive_dir, day):
+    start = time.perf_counter()
+    archived = ArchiveDay(os.path.join(archive_dir, day.isoformat()))
+    print("📦 %s: %d reads, %s .. %s UTC" % (
+        day, len(archived),
+        _time_of(archived.index["first_read_us"]),
+        _time_of(archived.index["last_read_us"])))
+    print("🏷️  %d unique EPCs" % len(np.unique(archived.epc_keys)))
+
+    print("📡 Reads per antenna:")
+    antennas = np.bincount(archived.antenna)
+    for antenna in np.flatnonzero(antennas):
+        print("   %-6s %10d" % (antenna or "?", antennas[antenna]))
+
+    print("🖧  Reads per reader:")
+    readers = np.bincount(archived.reader, minlength=len(archived.readers) + 1)
+    for code in np.flatnonzero(readers):
+        print("   %-21s %10d" % (archived.reader_of(code) or "?", readers[code]))
+
+    rssi = archived.rssi[archived.rssi != MISSING_RSSI]
+    if rssi.size:
+        print("📶 RSSI: min %d / median %d / max %d dBm"
+              % (rssi.min(), np.median(rssi), rssi.max()))
+
+    print("🕐 Reads per hour (UTC):")
+    offsets = archived.index["hour_offsets"]
+    for hour in range(24):
+        count = offsets[hour + 1] - offsets[hour]
+        if count:
+            print("   %02d:00 %10d" % (hour, count))
+    print("⏱️  %.2fs" % (time.perf_counter() - start))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.stats:
+        print_stats(args.dir, args.stats)
+        return
+    try:
+        while True:
+            exported = archive_closed_days(args.db, args.dir, grace=args.grace,
+                                           prune=args.prune)
+            if not exported:
+                logger.info("No closed day left to archive")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Exit detected, archiving stopped.")
+
+
+if __name__ == "__main__":
+    main()
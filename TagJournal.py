@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Convert a binary tag journal to the text log or CSV, or summarise it.
+
+    python TagJournal.py tag_journal > tag_reads.txt
+    python TagJournal.py tag_journal --format csv --day 2026-10-17 -o reads.csv
+    python TagJournal.py tag_journal --stats
+"""
+
+import argparse
+import csv
+import datetime
+import logging
+import os
+import sys
+import time
+
+from pipeline.journal import (
+    CSV_HEADER, JournalSegment, csv_row, iter_journal, segment_names, text_line)
+from pipeline.startup import parse_args_with_config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("journal", help="journal directory")
+    parser.add_argument("--format", choices=("text", "csv"), default="text",
+                        help="tag_reads.txt lines or logger.py CSV (default: text)")
+    parser.add_argument("--day", type=datetime.date.fromisoformat,
+                        help="only the segments started on this day (YYYY-MM-DD)")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--no-verify", dest="verify", action="store_false",
+                        help="do not check record CRCs")
+    parser.add_argument("--stats", action="store_true",
+                        help="print records, readers and damage per segment")
+    return parse_args_with_config(parser, argv)
+
+
+def print_stats(directory, day, verify):
+    total = 0
+    start = time.perf_counter()
+    for name in segment_names(directory, day):
+        try:
+            segment = JournalSegment(os.path.join(directory, name))
+        except ValueError as e:
+            print(f"❌ {e}")
+            continue
+        with segment:
+            reads = sum(1 for _ in segment.iter_tags(verify))
+            readers = ", ".join(segment.readers().values()) or "-"
+            damage = ""
+            if segment.skipped:
+                damage += f" | ⚠️ {segment.skipped} unreadable records"
+            if segment.torn_bytes:
+                damage += f" | ✂️ {segment.torn_bytes} torn bytes"
+            print(f"📼 {name}: {reads} reads, EPC width {segment.epc_width},"
+                  f" readers: {readers}{damage}")
+            total += reads
+    print(f"📦 {total} reads in {time.perf_counter() - start:.2f}s")
+
+
+def convert(directory, day, fmt, out, verify):
+    tags = iter_journal(directory, day, verify)
+    if fmt == "csv":
+        writer = csv.writer(out, dialect="excel")
+        writer.writerow(CSV_HEADER)
+        writer.writerows(csv_row(tag) for tag in tags)
+    else:
+        out.writelines(text_line(tag) for tag in tags)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if not os.path.isdir(args.journal):
+        print(f"❌ No journal at {args.journal}")
+        return 1
+    if args.stats:
+        print_stats(args.journal, args.day, args.verify)
+        return 0
+    if args.output:
+        with open(args.output, "w", newline="") as out:
+            convert(args.journal, args.day, args.format, out, args.verify)
+    else:
+        convert(args.journal, args.day, args.format, sys.stdout, args.verify)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Columnar archive: per-day analytics from SQLite against NumPy over the memmaps.
+
+    python -m benchmarks.archive
+    python -m benchmarks.archive --reads 2000000 --json archive.json
+
+A temporary database is filled with `reads` reads spread over `days` UTC
+days and exported with archive_closed_days(). The same per-day questions
+(reads per antenna, unique EPCs, reads per hour, mean RSSI of one antenna)
+are then answered by SQL on the database and by NumPy on freshly opened
+ArchiveDay columns; both must agree before anything is timed.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from db import queries
+from db.archive import HOUR_US, MISSING_RSSI, ArchiveDay, archive_closed_days, day_start_us
+from db.connection import close_connection, get_connection
+from pipeline.results import write_results
+
+FIRST_DAY = datetime.date(2026, 1, 1)
+
+SQL = {
+    "antennas": "SELECT antenna, COUNT(*) FROM tag_reads"
+                " WHERE last_seen >= ? AND last_seen < ? GROUP BY antenna",
+    "unique_epcs": "SELECT COUNT(DISTINCT epc) FROM tag_reads"
+                   " WHERE last_seen >= ? AND last_seen < ?",
+    "hours": "SELECT (last_seen - ?) / %d AS hour, COUNT(*) FROM tag_reads"
+             " WHERE last_seen >= ? AND last_seen < ? GROUP BY hour" % HOUR_US,
+    "antenna_rssi": "SELECT AVG(rssi) FROM tag_reads"
+                    " WHERE last_seen >= ? AND last_seen < ? AND antenna = 1"
+                    " AND rssi IS NOT NULL",
+}
+
+
+def fill(db_path, args):
+    conn = get_connection(db_path)
+    rng = random.Random(1)
+    epcs = [b"\xe2\x80\x11\x60" + i.to_bytes(8, "big") for i in range(args.population)]
+    start = day_start_us(FIRST_DAY)
+    span = args.days * 86400 * 1000000
+    chunk = 100000
+    for offset in range(0, args.reads, chunk):
+        rows = []
+        for _ in range(min(chunk, args.reads - offset)):
+            t = start + rng.randrange(span)
+            rows.append((rng.choice(epcs), rng.randint(1, args.antennas), rng.randint(0, 49),
+                         1, rng.randint(-80, -40), t - 1000, t, "10.0.0.1:5084"))
+        with conn:
+            conn.executemany(queries.INSERT_TAG_READ, rows)
+    return conn
+
+
+def sql_day(conn, start_us, end_us):
+    return {
+        "antennas": dict(conn.execute(SQL["antennas"], (start_us, end_us)).fetchall()),
+        "unique_epcs": conn.execute(SQL["unique_epcs"], (start_us, end_us)).fetchone()[0],
+        "hours": dict(conn.execute(SQL["hours"], (start_us, start_us, end_us)).fetchall()),
+        "antenna_rssi": conn.execute(SQL["antenna_rssi"], (start_us, end_us)).fetchone()[0],
+    }
+
+
+def numpy_day(path):
+    day = ArchiveDay(path)
+    antennas = np.bincount(day.antenna)
+    hours = np.diff(day.index["hour_offsets"])
+    rssi = day.rssi[(day.antenna == 1) & (day.rssi != MISSING_RSSI)]
+    return {
+        "antennas": {int(a): int(antennas[a]) for a in np.flatnonzero(antennas)},
+        "unique_epcs": len(np.unique(day.epc_keys)),
+        "hours": {h: int(hours[h]) for h in np.flatnonzero(hours)},
+        "antenna_rssi": float(rssi.mean()) if rssi.size else None,
+    }
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="archive-bench-")
+    try:
+        db_path = os.path.join(workdir, "tags.db")
+        archive_dir = os.path.join(workdir, "archive")
+        start = time.perf_counter()
+        conn = fill(db_path, args)
+        print("filled %d reads over %d days in %.1fs"
+              % (args.reads, args.days, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        last_day = FIRST_DAY + datetime.timedelta(days=args.days)
+        archive_closed_days(db_path, archive_dir, grace=0,
+                            now=day_start_us(last_day) / 1e6)
+        export_s = time.perf_counter() - start
+
+        days = [FIRST_DAY + datetime.timedelta(days=d) for d in range(args.days)]
+        ranges = [(day_start_us(d), day_start_us(d) + 86400 * 1000000) for d in days]
+        paths = [os.path.join(archive_dir, d.isoformat()) for d in days]
+        for (start_us, end_us), path in zip(ranges, paths):
+            want, got = sql_day(conn, start_us, end_us), numpy_day(path)
+            if abs((want["antenna_rssi"] or 0) - (got["antenna_rssi"] or 0)) < 1e-6:
+                want["antenna_rssi"] = got["antenna_rssi"]
+            if want != got:
+                raise SystemExit("SQLite and archive disagree for %s:\n%s\n%s"
+                                 % (path, want, got))
+
+        sql_s = best_of(lambda: [sql_day(conn, *r) for r in ranges], args.repeat)
+        numpy_s = best_of(lambda: [numpy_day(p) for p in paths], args.repeat)
+        size = sum(os.path.getsize(os.path.join(p, f)) for p in paths for f in os.listdir(p))
+        close_connection(db_path)
+        result = {"reads": args.reads, "days": args.days,
+                  "export_s": export_s, "export_reads_per_s": args.reads / export_s,
+                  "sqlite_s_per_day": sql_s / args.days,
+                  "numpy_s_per_day": numpy_s / args.days,
+                  "speedup": sql_s / numpy_s,
+                  "db_bytes": os.path.getsize(db_path), "archive_bytes": size}
+    finally:
+        shutil.rmtree(workdir)
+    print("export  %9.0f reads/s | db %.1f MB -> archive %.1f MB"
+          % (result["export_reads_per_s"], result["db_bytes"] / 1e6,
+             result["archive_bytes"] / 1e6))
+    print("per day: sqlite %.3fs | numpy %.3fs | speedup %.1fx"
+          % (result["sqlite_s_per_day"], result["numpy_s_per_day"], result["speedup"]))
+    return [result]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reads", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=4)
+    parser.add_argument("--population", type=int, default=20000, help="distinct EPCs")
+    parser.add_argument("--antennas", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs, best is kept")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        params = {k: getattr(args, k) for k in
+                  ("reads", "days", "population", "antennas", "repeat")}
+        write_results(args.json, "archive", results, params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
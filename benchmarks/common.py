@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def now_us():
+    return int(time.time() * 1000000)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1,
+                      int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(samples_us):
+    """p50/p99/max in milliseconds of a list of latencies in microseconds."""
+    values = sorted(samples_us)
+    if not values:
+        return {"count": 0, "p50_ms": None, "p99_ms": None, "max_ms": None}
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) / 1000.0,
+        "p99_ms": percentile(values, 99) / 1000.0,
+        "max_ms": values[-1] / 1000.0,
+    }
+
+
+def rss_bytes():
+    """Current resident set size of this process, or None if unknown."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    """Highest resident set size this process has reached, or None."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    return None
+
+
+class PeakSampler(object):
+    """Polls `fn` from a daemon thread and keeps the largest value seen."""
+
+    def __init__(self, fn, interval=0.005):
+        self.fn = fn
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-sampler",
+                                        daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            value = self.fn()
+            if value is not None and value > self.peak:
+                self.peak = value
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, key, metric, tolerance=0.1, higher_is_better=True):
+    """Return the results that got more than `tolerance` worse than baseline.
+
+    Results are matched on the tuple of fields in `key`; each regression is
+    reported as (key, baseline value, current value).
+    """
+    def index(document):
+        return {tuple(r.get(k) for k in key): r for r in document["results"]}
+
+    before = index(baseline)
+    regressions = []
+    for k, result in index(current).items():
+        old = before.get(k, {}).get(metric)
+        new = result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append((k, old, new))
+    return regressions
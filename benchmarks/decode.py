@@ -0,0 +1,167 @@
+"""RO_ACCESS_REPORT decoding: sllurp's generic decoder against the fast path.
+
+    python -m benchmarks.decode --report-sizes 1,10,100 --json decode.json
+    python -m benchmarks.decode --compare decode.json   # fail on a >10% tags/s drop
+
+Reports are built by the simulator's TagReportEncoder for a few content
+selectors and decoded to pipeline tag records both ways:
+
+    sllurp  LLRPMessage(msgbytes) -> tag_from_report() per TagReportData
+    fast    decode_tag_reports(body)
+
+Both must produce the same records before anything is timed.
+"""
+
+import argparse
+import sys
+import time
+
+from sllurp.llrp import LLRPMessage
+
+from benchmarks.common import compare, load_results
+from pipeline.fastreport import decode_tag_reports
+from pipeline.records import tag_from_report
+from pipeline.results import write_results
+from pipeline.simulator import DEFAULT_CONTENT_FLAGS, TagPopulation, TagReportEncoder
+
+SELECTORS = {
+    "epc": 0,                           # EPC only
+    "default": DEFAULT_CONTENT_FLAGS,   # what the entry points ask for
+    "full": 0b1111111111000000,         # every TagReportContentSelector field
+}
+READER = "bench:5084"
+
+
+def make_reports(encoder, population, report_size, count):
+    """`count` distinct messages of `report_size` reads each."""
+    messages = []
+    read = 0
+    for msg_id in range(count):
+        reads = []
+        for _ in range(report_size):
+            index = read % len(population.epcs)
+            reads.append((index, 1 + read % 4, population.rssi(index), 1 + read % 50,
+                          1700000000000000 + read))
+            read += 1
+        messages.append(encoder.message(reads, msg_id))
+    return messages
+
+
+def decode_sllurp(message):
+    lmsg = LLRPMessage(msgbytes=message)
+    return [tag_from_report(tag, READER)
+            for tag in lmsg.msgdict["RO_ACCESS_REPORT"]["TagReportData"]]
+
+
+def decode_fast(message):
+    return decode_tag_reports(memoryview(message)[10:], READER)
+
+
+def time_decoder(decode, messages, min_time, repeat):
+    """Best-of-`repeat` seconds per message, each run lasting at least `min_time`."""
+    best = None
+    for _ in range(repeat):
+        decoded = 0
+        start = time.perf_counter()
+        while True:
+            for message in messages:
+                decode(message)
+            decoded += len(messages)
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_message = elapsed / decoded
+        if best is None or per_message < best:
+            best = per_message
+    return best
+
+
+def run(args):
+    population = TagPopulation(args.population, seed=1)
+    results = []
+    for selector in args.selectors.split(","):
+        encoder = TagReportEncoder(population.epcs, SELECTORS[selector])
+        for report_size in (int(x) for x in args.report_sizes.split(",")):
+            messages = make_reports(encoder, population, report_size, args.messages)
+            for message in messages:
+                if decode_fast(message) != decode_sllurp(message):
+                    raise SystemExit("decoders disagree on a %s report of %d tags"
+                                     % (selector, report_size))
+            for decoder, decode in (("sllurp", decode_sllurp), ("fast", decode_fast)):
+                seconds = time_decoder(decode, messages, args.min_time, args.repeat)
+                result = {
+                    "decoder": decoder,
+                    "selector": selector,
+                    "report_size": report_size,
+                    "report_bytes": len(messages[0]),
+                    "us_per_report": seconds * 1e6,
+                    "us_per_tag": seconds * 1e6 / report_size,
+                    "tags_per_s": report_size / seconds,
+                }
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def print_result(r):
+    print("%-6s %-7s %4d tags/report (%5d B) | %9.2f us/report | %6.2f us/tag |"
+          " %9.0f tags/s" % (r["decoder"], r["selector"], r["report_size"],
+                             r["report_bytes"], r["us_per_report"], r["us_per_tag"],
+                             r["tags_per_s"]))
+
+
+def print_speedups(results):
+    by_key = {(r["decoder"], r["selector"], r["report_size"]): r for r in results}
+    for (decoder, selector, report_size), r in sorted(by_key.items()):
+        if decoder != "fast":
+            continue
+        slow = by_key[("sllurp", selector, report_size)]
+        print("speedup %-7s %4d tags/report: %.1fx"
+              % (selector, report_size, slow["us_per_report"] / r["us_per_report"]))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--selectors", default=",".join(SELECTORS),
+                        help="comma-separated subset of %s" % (tuple(SELECTORS),))
+    parser.add_argument("--report-sizes", default="1,10,100",
+                        help="tags per report, comma-separated")
+    parser.add_argument("--messages", type=int, default=100,
+                        help="distinct reports decoded per run")
+    parser.add_argument("--population", type=int, default=1000,
+                        help="distinct EPCs the reads cycle through")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="seconds each timing run lasts at least")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs, best is kept")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="exit non-zero if tags/s dropped against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed tags/s drop for --compare (default: 0.1 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print_speedups(results)
+    params = {k: getattr(args, k) for k in
+              ("selectors", "report_sizes", "messages", "population", "min_time", "repeat")}
+    document = None
+    if args.json:
+        document = write_results(args.json, "decode", results, params)
+    if args.compare:
+        baseline = load_results(args.compare)
+        current = document or {"results": results}
+        regressions = compare(baseline, current, ("decoder", "selector", "report_size"),
+                              "tags_per_s", args.tolerance)
+        for (decoder, selector, report_size), old, new in regressions:
+            print("REGRESSION %s %s %d tags/report: %.0f -> %.0f tags/s"
+                  % (decoder, selector, report_size, old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""End-to-end throughput and latency of the tag pipeline.
+
+    python -m benchmarks.e2e --tags 200000 --batch-sizes 1,10,100 --json e2e.json
+    python -m benchmarks.e2e --compare e2e.json     # fail on a >10% tags/s drop
+    python -m benchmarks.e2e --queue-policy spill   # TAG_QUEUE overflow behaviour
+
+Synthetic RO_ACCESS_REPORT batches are fed straight into each entry point's
+report callback, with no reader or network involved:
+
+    rfidreader   tag_report_cb -> TAG_QUEUE -> process_tags_console -> text log
+    rfidreader2  tag_report_cb -> TAG_QUEUE -> process_tags_console -> text log + SQLite
+    logger       CsvLogger.tag_cb -> CSV writer thread -> CSV file
+
+Every report carries the feed time as its LastSeenTimestampUTC, so a sink
+can tell how long a read took from the callback to being persisted (SQLite
+commit, text log flush, CSV rows written). Each scenario runs in its own
+process so peak RSS belongs to that run alone.
+"""
+
+import argparse
+import contextlib
+import importlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import (
+    PeakSampler,
+    compare,
+    latency_summary,
+    load_results,
+    now_us,
+    peak_rss_bytes,
+    rss_bytes,
+)
+from pipeline.results import write_results
+
+SCENARIOS = ("rfidreader", "rfidreader2", "logger")
+DONE_TIMEOUT = 120.0  # Give up waiting for the sinks after this many seconds
+
+
+class FakeReader(object):
+    """Stands in for LLRPReaderClient in report callbacks."""
+
+    def get_peername(self):
+        return ("bench", 5084)
+
+
+def make_population(size):
+    """Report dicts shaped like sllurp's TagReportData, one per tag."""
+    tags = []
+    for i in range(size):
+        epc = ("e2801160%016x" % i).encode("ascii")
+        tags.append({
+            "EPC-96": epc,
+            "EPC": epc,
+            "AntennaID": i % 4 + 1,
+            "PeakRSSI": -40 - i % 30,
+            "ChannelIndex": i % 50 + 1,
+            "TagSeenCount": 1,
+        })
+    return tags
+
+
+def feed(callback, population, total, batch_size, rate):
+    """Call `callback` with `total` reads in batches; returns the feed time."""
+    reader = FakeReader()
+    interval = batch_size / rate if rate else 0.0
+    size = len(population)
+    started = time.monotonic()
+    sent = 0
+    batch_no = 0
+    while sent < total:
+        n = min(batch_size, total - sent)
+        ts = now_us()
+        batch = []
+        for j in range(sent, sent + n):
+            tag = dict(population[j % size])
+            tag["FirstSeenTimestampUTC"] = tag["LastSeenTimestampUTC"] = ts
+            batch.append(tag)
+        callback(reader, batch)
+        sent += n
+        batch_no += 1
+        if interval:
+            delay = started + batch_no * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    return time.monotonic() - started
+
+
+def wait_for(condition, timeout=DONE_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError("sinks did not catch up within %.0fs" % timeout)
+        time.sleep(0.001)
+
+
+# -------- TIMED SINKS -------- #
+def timed_tag_log_writer(base):
+    class TimedTagLogWriter(base):
+        """Records feed-to-flush latency from the timestamp each line starts with."""
+
+        def __init__(self, *args, **kwargs):
+            self.latencies = []
+            self.lines = 0
+            self.last_persist = None
+            super().__init__(*args, **kwargs)
+
+        def _flush(self):
+            stamps = [int(line.split(",", 1)[0]) for line in self._buffer]
+            super()._flush()
+            now = now_us()
+            self.latencies.extend(now - ts for ts in stamps)
+            if stamps:
+                self.lines += len(stamps)
+                self.last_persist = time.monotonic()
+
+    return TimedTagLogWriter
+
+
+def timed_tag_writer(base):
+    class TimedTagWriter(base):
+        """Records feed-to-commit latency from each row's last_seen."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.latencies = []
+            self.last_persist = None
+
+        def _commit(self, conn, rows):
+            super()._commit(conn, rows)
+            now = now_us()
+            self.latencies.extend(now - row[6] for row in rows)
+            self.last_persist = time.monotonic()
+
+    return TimedTagWriter
+
+
+class _TimedCsvWriter(object):
+    def __init__(self, writer, owner):
+        self.writer = writer
+        self.owner = owner
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def writerows(self, rows):
+        self.writer.writerows(rows)
+        now = time.time()
+        self.owner.latencies.extend(int((now - row[0]) * 1000000) for row in rows)
+        self.owner.last_persist = time.monotonic()
+
+
+def timed_csv_logger(base):
+    class TimedCsvLogger(base):
+        """Records feed-to-write latency from the reader timestamp column."""
+
+        def __init__(self, *args, **kwargs):
+            self.latencies = []
+            self.last_persist = None
+            super().__init__(*args, **kwargs)
+
+        def _open_writer(self):
+            return _TimedCsvWriter(super()._open_writer(), self)
+
+    return TimedCsvLogger
+
+
+# -------- SCENARIOS -------- #
+def run_reader_scenario(module_name, workdir, args):
+    from pipeline.aggregator import TagAggregator
+    from pipeline.tagqueue import TagQueue
+
+    mod = importlib.import_module(module_name)
+    mod.TAG_QUEUE = TagQueue(mod.TAG_QUEUE_SIZE, args.queue_policy,
+                             spill_dir=os.path.join(workdir, "spill"))
+    # Pass every read through so the sinks see the full rate
+    mod.AGGREGATOR = TagAggregator(window=args.dedup_window,
+                                   max_tags=mod.MAX_TRACKED_TAGS, ttl=mod.TAG_TTL)
+    mod.LOG_FILE_PATH = os.path.join(workdir, "tag_reads.txt")
+    mod.LOG_WRITER = timed_tag_log_writer(mod.TagLogWriter)(
+        mod.LOG_FILE_PATH,
+        flush_interval=mod.LOG_FLUSH_INTERVAL,
+        flush_bytes=mod.LOG_FLUSH_BYTES,
+        max_bytes=mod.LOG_MAX_BYTES,
+        rotate_daily=mod.LOG_ROTATE_DAILY,
+        compress=mod.LOG_COMPRESS,
+        fsync=mod.LOG_FSYNC)
+    sinks = {"log": mod.LOG_WRITER}
+
+    if hasattr(mod, "DB_WRITER"):
+        mod.DB_FILE = os.path.join(workdir, "tags.db")
+        mod.init_db()
+        mod.DB_WRITER = timed_tag_writer(mod.BatchedTagWriter)(
+            mod.DB_FILE,
+            batch_size=mod.DB_BATCH_SIZE,
+            flush_interval=mod.DB_FLUSH_INTERVAL,
+            synchronous=mod.DB_SYNCHRONOUS)
+        mod.DB_WRITER.start()
+        sinks["sqlite"] = mod.DB_WRITER
+
+    threading.Thread(target=mod.process_tags_console, args=(mod.TAG_QUEUE,),
+                     daemon=True).start()
+    depth = PeakSampler(mod.TAG_QUEUE.qsize).start()
+    rss = PeakSampler(rss_bytes, interval=0.05).start()
+
+    population = make_population(args.population)
+    start = time.monotonic()
+    feed_s = feed(mod.tag_report_cb, population, args.tags, args.batch_size, args.rate)
+
+    aggregator = mod.AGGREGATOR
+    wait_for(lambda: aggregator.reads_in + mod.TAG_QUEUE.dropped >= args.tags)
+    wait_for(lambda: mod.LOG_WRITER.lines + len(mod.LOG_WRITER._buffer) >= aggregator.emitted)
+    # Shutdown flushes the log tail; SQLite commits it on its own timer
+    mod.LOG_WRITER.close()
+    if "sqlite" in sinks:
+        wait_for(lambda: mod.DB_WRITER.rows_written >= aggregator.emitted)
+        mod.DB_WRITER.close()
+
+    end = max(sink.last_persist or start for sink in sinks.values())
+    result = finish(args, start, end, feed_s, depth, rss, sinks)
+    result["queue"] = mod.TAG_QUEUE.stats()
+    return result
+
+
+def run_logger_scenario(workdir, args):
+    import logger as logger_module
+
+    path = os.path.join(workdir, "tags.csv")
+    csv_logger = timed_csv_logger(logger_module.CsvLogger)(
+        open(path, "w", newline=""), reader_timestamp=True)
+    depth = PeakSampler(csv_logger._queue.qsize).start()
+    rss = PeakSampler(rss_bytes, interval=0.05).start()
+
+    population = make_population(args.population)
+    start = time.monotonic()
+    feed_s = feed(csv_logger.tag_cb, population, args.tags, args.batch_size, args.rate)
+    csv_logger.flush()
+    csv_logger.filehandle.close()
+
+    return finish(args, start, csv_logger.last_persist or start, feed_s, depth, rss,
+                  {"csv": csv_logger})
+
+
+def finish(args, start, end, feed_s, depth, rss, sinks):
+    elapsed = end - start
+    sampled_rss = rss.stop()
+    result = {
+        "scenario": args.scenario,
+        "batch_size": args.batch_size,
+        "tags": args.tags,
+        "rate": args.rate,
+        "feed_tags_per_s": args.tags / feed_s if feed_s else None,
+        "tags_per_s": args.tags / elapsed if elapsed > 0 else None,
+        "elapsed_s": elapsed,
+        "peak_queue_depth": depth.stop(),
+        "peak_rss_mb": (peak_rss_bytes() or sampled_rss) / 1e6,
+        "latency": {name: latency_summary(sink.latencies) for name, sink in sinks.items()},
+    }
+    return result
+
+
+def run_child(args):
+    """Run one scenario in this process and print its result as JSON."""
+    workdir = tempfile.mkdtemp(prefix="rfid-bench-")
+    real_stdout = sys.stdout
+    try:
+        # The entry points print every tag and log every report; measure
+        # the pipeline, not the terminal.
+        logging.disable(logging.INFO)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if args.scenario == "logger":
+                result = run_logger_scenario(workdir, args)
+            else:
+                result = run_reader_scenario(
+                    "RFIDReader" if args.scenario == "rfidreader" else "RFIDReader2",
+                    workdir, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    real_stdout.write(json.dumps(result) + "\n")
+
+
+# -------- DRIVER -------- #
+def run_all(args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for scenario in args.scenarios.split(","):
+        for batch_size in (int(x) for x in args.batch_sizes.split(",")):
+            cmd = [sys.executable, "-m", "benchmarks.e2e", "--child",
+                   "--scenario", scenario, "--batch-size", str(batch_size),
+                   "--tags", str(args.tags), "--rate", str(args.rate),
+                   "--population", str(args.population),
+                   "--dedup-window", str(args.dedup_window),
+                   "--queue-policy", args.queue_policy]
+            proc = subprocess.run(cmd, cwd=root, capture_output=True, text=True)
+            if proc.returncode != 0:
+                sys.stderr.write(proc.stderr)
+                raise SystemExit("%s (batch %d) failed" % (scenario, batch_size))
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print_result(result)
+    return results
+
+
+def print_result(r):
+    latency = " ".join("%s p50 %.1f/p99 %.1f ms" % (name, l["p50_ms"], l["p99_ms"])
+                       for name, l in sorted(r["latency"].items()) if l["count"])
+    print("%-12s batch %4d | %8.0f tags/s (fed %8.0f/s) | queue peak %7d |"
+          " RSS %6.1f MB | %s" % (r["scenario"], r["batch_size"], r["tags_per_s"],
+                                 r["feed_tags_per_s"], r["peak_queue_depth"],
+                                 r["peak_rss_mb"], latency))
+    queue = r.get("queue")
+    if queue and (queue["dropped"] or queue["spilled"]):
+        print("%-12s queue %s: %d dropped, %d spilled" % ("", queue["policy"],
+                                                        queue["dropped"], queue["spilled"]))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of %s" % (SCENARIOS,))
+    parser.add_argument("--batch-sizes", default="1,10,100",
+                        help="tags per synthetic report, comma-separated")
+    parser.add_argument("--tags", type=int, default=100000, help="reads per run")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="offered tags/s, 0 to feed as fast as possible")
+    parser.add_argument("--population", type=int, default=1000,
+                        help="distinct EPCs the reads cycle through")
+    parser.add_argument("--dedup-window", type=float, default=0.0,
+                        help="aggregator window; 0 passes every read to the sinks")
+    parser.add_argument("--queue-policy", default="block",
+                        help="TAG_QUEUE overflow policy for the reader scenarios")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="exit non-zero if tags/s dropped against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed tags/s drop for --compare (default: 0.1 = 10%%)")
+    # Internal: run a single scenario in this process
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--batch-size", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        run_child(args)
+        return 0
+
+    results = run_all(args)
+    params = {k: getattr(args, k) for k in
+              ("scenarios", "batch_sizes", "tags", "rate", "population", "dedup_window",
+               "queue_policy")}
+    document = None
+    if args.json:
+        document = write_results(args.json, "e2e", results, params)
+    if args.compare:
+        baseline = load_results(args.compare)
+        current = document or {"results": results}
+        regressions = compare(baseline, current, ("scenario", "batch_size"),
+                              "tags_per_s", args.tolerance)
+        for (scenario, batch_size), old, new in regressions:
+            print("REGRESSION %s batch %d: %.0f -> %.0f tags/s"
+                  % (scenario, batch_size, old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
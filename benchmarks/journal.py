@@ -0,0 +1,179 @@
+"""Binary journal against the text log: cost to write a read, speed to scan them back.
+
+    python -m benchmarks.journal
+    python -m benchmarks.journal --reads 2000000 --json journal.json
+
+The same tag dicts are written in consumer-sized batches through
+TagLogWriter (RFIDReader's f-string lines) and through TagJournal. Each
+file is then scanned back: the text log by parsing its lines, the journal
+through JournalSegment (with and without CRC checks) and as a NumPy array.
+A plain read() of each file, already in the page cache, is the "disk speed"
+the scans are compared to.
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from pipeline.epc import epc_from_hex
+from pipeline.journal import JournalSegment, TagJournal, segment_names, text_line
+from pipeline.results import write_results
+from pipeline.textlog import TagLogWriter
+
+BATCH = 500
+READ_CHUNK = 1024 * 1024
+
+
+def make_tags(args):
+    rng = random.Random(1)
+    epcs = [b"\xe2\x80\x11\x60" + i.to_bytes(8, "big") for i in range(args.population)]
+    start = 1760000000 * 1000000
+    return [{"epc": rng.choice(epcs), "antenna": rng.randint(1, 4),
+             "channel": rng.randint(1, 50), "rssi": rng.randint(-80, -40),
+             "seen_count": 1, "first_seen": start + i * 100, "last_seen": start + i * 100,
+             "reader": "10.0.0.%d:5084" % rng.randint(1, 2)}
+            for i in range(args.reads)]
+
+
+def write_text(path, tags):
+    log = TagLogWriter(path, flush_interval=3600)
+    for i in range(0, len(tags), BATCH):
+        log.write_lines(text_line(tag) for tag in tags[i:i + BATCH])
+    log.close()
+
+
+def write_journal(directory, tags):
+    journal = TagJournal(directory, flush_interval=3600, rotate_daily=False)
+    for i in range(0, len(tags), BATCH):
+        journal.write_tags(tags[i:i + BATCH])
+    journal.close()
+    return journal.path
+
+
+def parse_text(path):
+    """Tag dicts back from text log lines."""
+    count = 0
+    with open(path) as f:
+        for line in f:
+            last_seen, epc, antenna, channel, seen_count = line.rstrip("\n").split(", ")
+            {"last_seen": int(last_seen), "epc": epc_from_hex(epc[5:]),
+             "antenna": int(antenna[9:]), "channel": int(channel[9:]),
+             "seen_count": int(seen_count[11:])}
+            count += 1
+    return count
+
+
+def scan_journal(path, verify):
+    with JournalSegment(path) as segment:
+        return sum(1 for _ in segment.iter_tags(verify))
+
+
+def scan_array(path):
+    segment = JournalSegment(path)
+    records = segment.array()
+    # Touch every page: reads per antenna
+    reads = records[records["kind"] == 0]
+    count = int(sum((reads["antenna"] == a).sum() for a in (1, 2, 3, 4)))
+    del records, reads
+    segment.close()
+    return count
+
+
+def read_file(path):
+    with open(path, "rb", buffering=0) as f:
+        while f.read(READ_CHUNK):
+            pass
+    return 0
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(args):
+    tags = make_tags(args)
+    workdir = tempfile.mkdtemp(prefix="journal-bench-")
+    results = []
+    try:
+        text_path = os.path.join(workdir, "tag_reads.txt")
+
+        def text_once():
+            if os.path.exists(text_path):
+                os.remove(text_path)
+            write_text(text_path, tags)
+
+        def journal_once():
+            journal_dir = os.path.join(workdir, "journal")
+            shutil.rmtree(journal_dir, ignore_errors=True)
+            return write_journal(journal_dir, tags)
+
+        text_s, _ = best_of(text_once, args.repeat)
+        journal_s, journal_path = best_of(journal_once, args.repeat)
+        assert len(segment_names(os.path.dirname(journal_path))) == 1
+        sizes = {"text": os.path.getsize(text_path), "journal": os.path.getsize(journal_path)}
+        for name, seconds in (("text", text_s), ("journal", journal_s)):
+            results.append({"step": "write", "format": name, "reads": len(tags),
+                            "us_per_read": seconds * 1e6 / len(tags), "bytes": sizes[name]})
+
+        scans = [
+            ("text", "read()", text_path, lambda: read_file(text_path)),
+            ("text", "parse", text_path, lambda: parse_text(text_path)),
+            ("journal", "read()", journal_path, lambda: read_file(journal_path)),
+            ("journal", "iter+crc", journal_path, lambda: scan_journal(journal_path, True)),
+            ("journal", "iter", journal_path, lambda: scan_journal(journal_path, False)),
+        ]
+        if importlib.util.find_spec("numpy") is not None:
+            scans.append(("journal", "numpy", journal_path, lambda: scan_array(journal_path)))
+        for name, how, path, fn in scans:
+            seconds, count = best_of(fn, args.repeat)
+            if how != "read()" and count != len(tags):
+                raise SystemExit("%s %s found %d reads, wrote %d" % (name, how, count, len(tags)))
+            results.append({"step": "scan", "format": name, "how": how, "seconds": seconds,
+                            "reads_per_s": len(tags) / seconds,
+                            "mb_per_s": sizes[name] / seconds / 1e6})
+    finally:
+        shutil.rmtree(workdir)
+
+    for r in results:
+        if r["step"] == "write":
+            print("write %-7s %6.2f us/read | %6.1f MB (%d B/read)"
+                  % (r["format"], r["us_per_read"], r["bytes"] / 1e6, r["bytes"] // r["reads"]))
+    print("write speedup: %.1fx" % (results[0]["us_per_read"] / results[1]["us_per_read"]))
+    for r in results:
+        if r["step"] == "scan":
+            print("scan  %-7s %-8s %10.0f reads/s | %8.0f MB/s"
+                  % (r["format"], r["how"], r["reads_per_s"], r["mb_per_s"]))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reads", type=int, default=500000)
+    parser.add_argument("--population", type=int, default=5000, help="distinct EPCs")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs, best is kept")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        params = {k: getattr(args, k) for k in ("reads", "population", "repeat")}
+        write_results(args.json, "journal", results, params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
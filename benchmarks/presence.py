@@ -0,0 +1,190 @@
+"""Presence/zone engine: tag-state updates per second, NumPy against per-tag Python.
+
+    python -m benchmarks.presence
+    python -m benchmarks.presence --population 5000 --batch 1000 --json presence.json
+
+A portal is simulated: `population` tags walk past `zones` zones of
+`antennas_per_zone` antennas each, so RSSI rises and falls and tags arrive
+in and depart from every zone. The same reads, in `batch`-read batches,
+go through PresenceEngine as configured ("engine": read by read below
+VECTOR_MIN_BATCH, NumPy from there on), through PresenceEngine always
+using NumPy ("vector") and through a straightforward per-tag Python
+implementation of the same rules; all must emit the same events before
+anything is timed.
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+
+from pipeline.presence import ARRIVE, DEPART, PresenceEngine
+from pipeline.results import write_results
+
+TARGET_UPDATES_PER_S = 100000
+
+
+class PythonPresence(object):
+    """PresenceEngine's rules with a dict of per-tag state, read by read."""
+
+    def __init__(self, zones, enter_rssi, exit_rssi, alpha, timeout, sweep_interval):
+        self.zone_of = {a: name for name, antennas in zones.items() for a in antennas}
+        self.zones = zones
+        self.enter = enter_rssi
+        self.exit = exit_rssi
+        self.alpha = alpha
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.ema = {}           # (epc, antenna) -> smoothed RSSI
+        self.last_strong = {}   # (epc, antenna) -> time
+        self.present = {}       # (epc, zone) -> arrival time
+        self.last_sweep = None
+
+    def update(self, tags, now):
+        touched = {}
+        a = self.alpha
+        for tag in tags:
+            zone = self.zone_of.get(tag["antenna"])
+            if zone is None:
+                continue
+            key = (tag["epc"], tag["antenna"])
+            rssi = tag["rssi"] if tag["rssi"] is not None else self.enter
+            old = self.ema.get(key)
+            self.ema[key] = rssi if old is None else old + a * (rssi - old)
+            touched[key] = zone
+        events = []
+        best = {}
+        for key, zone in touched.items():
+            ema = self.ema[key]
+            present = (key[0], zone) in self.present
+            if ema >= (self.exit if present else self.enter):
+                self.last_strong[key] = now
+                # Strongest antenna; ties go to the one listed first
+                rank = (ema, -self.zones[zone].index(key[1]))
+                if not present and rank > best.get((key[0], zone), ((-math.inf, 0),))[0]:
+                    best[(key[0], zone)] = (rank, key[1])
+        for (epc, zone), (_, antenna) in best.items():
+            self.present[(epc, zone)] = now
+            events.append((ARRIVE, epc, zone, antenna))
+        if self.last_sweep is None or now - self.last_sweep >= self.sweep_interval:
+            self.last_sweep = now
+            for (epc, zone) in list(self.present):
+                last = max(self.last_strong.get((epc, a), -math.inf)
+                           for a in self.zones[zone])
+                if last < now - self.timeout:
+                    del self.present[(epc, zone)]
+                    events.append((DEPART, epc, zone, None))
+        return events
+
+
+def make_batches(args):
+    """(now, reads) batches of a portal pass, `args.rate` reads per second."""
+    rng = random.Random(1)
+    zones = args.zones
+    antennas = zones * args.antennas_per_zone
+    epcs = [b"\xe2\x80\x11\x60" + i.to_bytes(8, "big") for i in range(args.population)]
+    # Each tag crosses all zones once during the run, starting at a random time
+    start = [rng.uniform(0, args.duration * 0.5) for _ in epcs]
+    speed = zones / (args.duration * 0.4)   # zones per second
+    interval = args.batch / args.rate
+    batches = []
+    now = 0.0
+    while now < args.duration:
+        reads = []
+        for _ in range(args.batch):
+            i = rng.randrange(len(epcs))
+            antenna = rng.randrange(antennas)
+            # Distance in zones between the tag and the antenna's zone
+            position = (now - start[i]) * speed
+            distance = abs(position - (antenna // args.antennas_per_zone + 0.5))
+            rssi = -45 - 25 * distance + rng.gauss(0, 3)
+            if rssi < -85:
+                continue
+            reads.append({"epc": epcs[i], "antenna": antenna + 1, "rssi": int(rssi)})
+        batches.append((now, reads))
+        now += interval
+    return batches
+
+
+def run(args):
+    zones = {"zone%d" % z: list(range(z * args.antennas_per_zone + 1,
+                                      (z + 1) * args.antennas_per_zone + 1))
+             for z in range(args.zones)}
+    settings = dict(enter_rssi=-60.0, exit_rssi=-70.0, alpha=0.3, timeout=1.0,
+                    sweep_interval=0.25)
+    batches = make_batches(args)
+    reads = sum(len(b) for _, b in batches)
+
+    engines = (("engine", lambda: PresenceEngine(zones, **settings)),
+               ("vector", lambda: PresenceEngine(zones, vector_min_batch=0, **settings)),
+               ("python", lambda: PythonPresence(zones, **settings)))
+    for name, make in engines[:2]:
+        engine = make()
+        reference = PythonPresence(zones, **settings)
+        events = 0
+        for now, batch in batches:
+            got = sorted((e["event"], e["epc"], e["zone"],
+                          e["antenna"] if e["event"] == ARRIVE else None)
+                         for e in engine.update(batch, now))
+            want = sorted(reference.update(batch, now))
+            if got != want:
+                raise SystemExit("%s and Python engines disagree at t=%.2f:\n%s\n%s"
+                                 % (name, now, got, want))
+            events += len(got)
+
+    results = []
+    for name, make in engines:
+        best = None
+        for _ in range(args.repeat):
+            state = make()
+            start = time.perf_counter()
+            for now, batch in batches:
+                state.update(batch, now)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result = {"engine": name, "batch": args.batch, "population": args.population,
+                  "reads": reads, "events": events, "seconds": best,
+                  "updates_per_s": reads / best,
+                  "us_per_batch": best * 1e6 / len(batches)}
+        results.append(result)
+        print("%-6s %7d reads in %5d-read batches -> %5d events | %9.0f updates/s |"
+              " %8.1f us/batch%s"
+              % (name, reads, args.batch, events, result["updates_per_s"],
+                 result["us_per_batch"],
+                 "" if name != "engine" or result["updates_per_s"] >= TARGET_UPDATES_PER_S
+                 else "  (below %d/s)" % TARGET_UPDATES_PER_S))
+    print("speedup over python: %.1fx (always NumPy: %.1fx)"
+          % (results[2]["seconds"] / results[0]["seconds"],
+             results[2]["seconds"] / results[1]["seconds"]))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--population", type=int, default=2000, help="distinct EPCs")
+    parser.add_argument("--zones", type=int, default=3)
+    parser.add_argument("--antennas-per-zone", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=20000,
+                        help="simulated reads per second")
+    parser.add_argument("--duration", type=float, default=20.0,
+                        help="simulated seconds")
+    parser.add_argument("--batch", type=int, default=500, help="reads per update() call")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs, best is kept")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        params = {k: getattr(args, k) for k in
+                  ("population", "zones", "antennas_per_zone", "rate", "duration",
+                   "batch", "repeat")}
+        write_results(args.json, "presence", results, params)
+    return 0 if results[0]["updates_per_s"] >= TARGET_UPDATES_PER_S else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
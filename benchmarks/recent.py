@@ -0,0 +1,101 @@
+"""Recent-reads store: insert rate and query latency over a full horizon.
+
+    python -m benchmarks.recent --population 1000 --rate 2000
+    python -m benchmarks.recent --json recent.json
+
+The store is filled with `horizon` seconds of simulated reads (`rate`
+reads/s over `population` tags and `antennas` antennas, added in consumer
+sized batches), then each query is timed against it.
+"""
+
+import argparse
+import sys
+import time
+
+from pipeline.recent import RecentReads
+from pipeline.results import write_results
+
+BATCH = 100
+
+
+def fill(store, population, antennas, rate, horizon, start):
+    """Add `horizon` seconds of reads; returns (reads, seconds spent adding)."""
+    epcs = [b"\xe2\x80\x11\x60" + i.to_bytes(8, "big") for i in range(population)]
+    batches = int(rate * horizon / BATCH)
+    step = horizon / batches
+    spent = 0.0
+    read = 0
+    for i in range(batches):
+        tags = []
+        for _ in range(BATCH):
+            tags.append({"epc": epcs[read % population], "antenna": 1 + read % antennas,
+                         "rssi": -40 - read % 30, "seen_count": 1})
+            read += 1
+        t = time.perf_counter()
+        store.add_many(tags, start + i * step)
+        spent += time.perf_counter() - t
+    return read, spent
+
+
+def time_query(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(args):
+    store = RecentReads(horizon=args.horizon, bucket=args.bucket)
+    start = 1700000000.0
+    reads, spent = fill(store, args.population, args.antennas, args.rate,
+                        args.horizon, start)
+    now = start + args.horizon
+    present = b"\xe2\x80\x11\x60" + (0).to_bytes(8, "big")
+    absent = b"\xe2\x80\x11\x60" + (args.population + 1).to_bytes(8, "big")
+    results = [{"query": "add_many", "reads": reads,
+                "us": spent * 1e6 / reads, "reads_per_s": reads / spent}]
+    queries = [
+        ("last_seen present", lambda: store.last_seen(present, 5, now=now)),
+        ("last_seen on antenna", lambda: store.last_seen(present, 30, antennas=(2,), now=now)),
+        ("last_seen absent", lambda: store.last_seen(absent, 30, now=now)),
+        ("epc 30s", lambda: store.epc(present, 30, now=now)),
+        ("antenna 30s", lambda: store.antenna(2, 30, now=now)),
+        ("overview 30s", lambda: store.overview(30, now=now)),
+    ]
+    for name, fn in queries:
+        results.append({"query": name, "us": time_query(fn, args.repeat) * 1e6})
+    for r in results:
+        extra = " (%.0f reads/s)" % r["reads_per_s"] if "reads_per_s" in r else ""
+        print("%-22s %10.1f us%s" % (r["query"], r["us"], extra))
+    print(store.format_stats(now))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--population", type=int, default=1000, help="distinct EPCs")
+    parser.add_argument("--antennas", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2000, help="reads per second")
+    parser.add_argument("--horizon", type=float, default=300.0, help="seconds kept")
+    parser.add_argument("--bucket", type=float, default=5.0, help="bucket width in seconds")
+    parser.add_argument("--repeat", type=int, default=20, help="timing runs, best is kept")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        params = {k: getattr(args, k) for k in
+                  ("population", "antennas", "rate", "horizon", "bucket", "repeat")}
+        write_results(args.json, "recent", results, params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
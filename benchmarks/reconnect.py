@@ -0,0 +1,149 @@
+"""Reconnects: tag blackout per connection loss, fast resume against a full reconnect.
+
+    python -m benchmarks.reconnect
+    python -m benchmarks.reconnect --drops 20 --response-delay 0.1 --json reconnect.json
+
+The reader simulator runs in this process and answers every request after
+`response-delay` seconds, standing in for a real reader's processing time.
+For each resume mode a FastReportClient under a ReaderSupervisor connects,
+then the simulator resets the connection `drops` times, `interval` seconds
+apart, and finally stalls it once so that the keepalive watchdog has to
+notice. The client asks for one report per tag, so the blackout (the last
+message before a loss to the first tag report after it) is not hidden
+behind report batching.
+"""
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+
+from sllurp.llrp import LLRPReaderConfig
+
+from benchmarks.common import percentile
+from pipeline.fastreport import FastReportClient
+from pipeline.results import write_results
+from pipeline.simulator import ReaderSimulator
+from pipeline.startup import ReaderReady
+from pipeline.supervisor import RESUME_FAST, RESUME_FULL, ReaderSupervisor
+
+MISSED_KEEPALIVES = 3
+
+
+def start_simulator(args):
+    sim = ReaderSimulator("127.0.0.1", args.port, rate=args.rate,
+                          response_delay=args.response_delay)
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(sim.serve_forever(),),
+                     name="bench-simulator", daemon=True).start()
+    time.sleep(0.2)
+    return sim, loop
+
+
+def summary_ms(values):
+    values = sorted(v * 1000.0 for v in values if v is not None)
+    if not values:
+        return {"count": 0, "p50_ms": None, "max_ms": None}
+    return {"count": len(values), "p50_ms": percentile(values, 50), "max_ms": values[-1]}
+
+
+def run_mode(mode, sim, loop, args):
+    config = LLRPReaderConfig()
+    config.start_inventory = True
+    config.report_every_n_tags = 1
+    config.report_timeout_ms = 0
+    config.tag_content_selector = {'EnableLastSeenTimestamp': True}
+
+    reader = FastReportClient("127.0.0.1", args.port, config)
+    reader.add_tag_record_callback(lambda _reader, _records: None)
+    supervisor = ReaderSupervisor(reader, keepalive_interval=args.keepalive,
+                                  missed_keepalives=MISSED_KEEPALIVES,
+                                  fast_resume=mode == RESUME_FAST)
+    ready = ReaderReady(reader)
+    start = time.monotonic()
+    supervisor.start()
+    try:
+        if not ready.wait(30):
+            raise SystemExit("%s: reader not ready" % mode)
+        connect_s = time.monotonic() - start
+        for _ in range(args.drops):
+            time.sleep(args.interval)
+            loop.call_soon_threadsafe(sim.drop_connections)
+        time.sleep(args.interval)
+        loop.call_soon_threadsafe(sim.stall_connections,
+                                  args.keepalive * MISSED_KEEPALIVES * 2)
+        time.sleep(args.keepalive * MISSED_KEEPALIVES + args.interval)
+    finally:
+        supervisor.stop()
+        reader.disconnect(timeout=5)
+        if reader.is_alive():
+            reader.hard_disconnect()
+            reader.join(5)
+
+    drops = [r for r in supervisor.reconnects if r["reason"] != "no keepalive"]
+    stalls = [r for r in supervisor.reconnects if r["reason"] == "no keepalive"]
+    return {
+        "mode": mode,
+        "connect_s": connect_s,
+        "drops": len(drops),
+        "resumes": {m: sum(1 for r in supervisor.reconnects if r["resume"] == m)
+                    for m in (RESUME_FAST, RESUME_FULL)},
+        "failed_attempts": supervisor.failed_attempts,
+        "reconnect": summary_ms(r["reconnect_s"] for r in drops),
+        "blackout": summary_ms(r["blackout_s"] for r in drops),
+        "stall_detect": summary_ms(r["detect_s"] for r in stalls),
+        "stall_blackout": summary_ms(r["blackout_s"] for r in stalls),
+    }
+
+
+def print_result(r):
+    print("%-4s connect %5.2fs | %d drops: reconnect p50 %s, blackout p50 %s / max %s ms"
+          " | stall: noticed after %s, blackout %s ms"
+          % (r["mode"], r["connect_s"], r["drops"],
+             _ms(r["reconnect"]["p50_ms"]), _ms(r["blackout"]["p50_ms"]),
+             _ms(r["blackout"]["max_ms"]), _ms(r["stall_detect"]["max_ms"]),
+             _ms(r["stall_blackout"]["max_ms"])))
+
+
+def _ms(value):
+    return "n/a" if value is None else "%.0f" % value
+
+
+def run(args):
+    sim, loop = start_simulator(args)
+    results = []
+    for mode in (RESUME_FULL, RESUME_FAST):
+        result = run_mode(mode, sim, loop, args)
+        print_result(result)
+        results.append(result)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=5094)
+    parser.add_argument("--rate", type=float, default=500.0, help="simulated reads per second")
+    parser.add_argument("--response-delay", type=float, default=0.05,
+                        help="seconds the simulated reader takes to answer a request")
+    parser.add_argument("--drops", type=int, default=10, help="connection resets per mode")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between connection resets")
+    parser.add_argument("--keepalive", type=float, default=0.5,
+                        help="keepalive interval in seconds")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        params = {k: getattr(args, k) for k in
+                  ("rate", "response_delay", "drops", "interval", "keepalive")}
+        write_results(args.json, "reconnect", results, params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""Report batching modes compared: messages/s, host CPU per tag and latency.
+
+    python -m benchmarks.reporting --rate 5000 --duration 5 --json reporting.json
+    python -m benchmarks.reporting --compare reporting.json   # fail on a >10% CPU/tag rise
+
+The reader simulator runs in its own process at a fixed read rate; this
+process connects to it once per mode and counts what arrives. CPU is the
+client process's own (socket, framing, decode, callback), latency is from
+the simulated read timestamp to the tag callback.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from sllurp.llrp import LLRPReaderClient, LLRPReaderConfig
+
+from benchmarks.common import compare, latency_summary, load_results, now_us
+from pipeline.fastreport import FastReportClient
+from pipeline.reporting import (
+    REPORT_AUTO,
+    REPORT_MODES,
+    AdaptiveReporting,
+    ReportProfile,
+)
+from pipeline.results import write_results
+from pipeline.startup import ReaderReady
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_simulator(port, rate):
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "ReaderSimulator.py"),
+                             "--port", str(port), "--rate", str(rate)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    return proc
+
+
+class Counter(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counting = False
+        self.reports = 0
+        self.tags = 0
+        self.latencies = []
+
+    def records_cb(self, _reader, records):
+        if not self.counting:
+            return
+        now = now_us()
+        with self.lock:
+            self.reports += 1
+            self.tags += len(records)
+            self.latencies.extend(now - tag["last_seen"] for tag in records)
+
+    def reports_cb(self, _reader, reports):
+        if not self.counting:
+            return
+        now = now_us()
+        with self.lock:
+            self.reports += 1
+            self.tags += len(reports)
+            self.latencies.extend(now - tag["LastSeenTimestampUTC"] for tag in reports)
+
+
+def run_mode(mode, args):
+    profile = ReportProfile(mode, n_tags=args.n_tags, timeout_ms=args.timeout_ms,
+                            target_reports_per_s=args.target_reports_per_s)
+    config = LLRPReaderConfig()
+    config.start_inventory = True
+    config.tag_content_selector = {
+        'EnableAntennaID': True,
+        'EnableChannelIndex': True,
+        'EnablePeakRSSI': True,
+        'EnableFirstSeenTimestamp': True,
+        'EnableLastSeenTimestamp': True,
+        'EnableTagSeenCount': True,
+    }
+    profile.apply(config)
+
+    counter = Counter()
+    if args.decoder == "fast":
+        reader = FastReportClient("127.0.0.1", args.port, config)
+        reader.add_tag_record_callback(counter.records_cb)
+    else:
+        reader = LLRPReaderClient("127.0.0.1", args.port, config)
+    reader.add_tag_report_callback(counter.reports_cb)
+    adaptive = None
+    if mode == REPORT_AUTO:
+        adaptive = AdaptiveReporting(reader, profile, interval=args.adapt_interval)
+        if args.decoder == "fast":
+            reader.add_tag_record_callback(lambda _r, records: adaptive.observe(len(records)))
+        reader.add_tag_report_callback(lambda _r, reports: adaptive.observe(len(reports)))
+
+    ready = ReaderReady(reader)
+    reader.connect()
+    try:
+        if not ready.wait(10):
+            raise SystemExit("%s: reader not ready" % mode)
+        if adaptive is not None:
+            # Let it settle on an N before measuring
+            time.sleep(args.adapt_interval * 2.5)
+        counter.counting = True
+        cpu_start, start = time.process_time(), time.monotonic()
+        time.sleep(args.duration)
+        counter.counting = False
+        cpu, elapsed = time.process_time() - cpu_start, time.monotonic() - start
+    finally:
+        reader.disconnect(timeout=5)
+        if reader.is_alive():
+            # A connection left running would keep decoding (and burning
+            # CPU) through the next mode's measurement
+            reader.hard_disconnect()
+            reader.join(5)
+
+    with counter.lock:
+        reports, tags, latencies = counter.reports, counter.tags, list(counter.latencies)
+    return {
+        "mode": mode,
+        "n_tags": adaptive.n_tags if adaptive else config.report_every_n_tags,
+        "timeout_ms": config.report_timeout_ms,
+        "switches": adaptive.switches if adaptive else 0,
+        "reports_per_s": reports / elapsed,
+        "tags_per_s": tags / elapsed,
+        "tags_per_report": tags / reports if reports else None,
+        "cpu_us_per_tag": cpu * 1e6 / tags if tags else None,
+        "cpu_percent": cpu * 100.0 / elapsed,
+        "latency": latency_summary(latencies),
+    }
+
+
+def print_result(r):
+    latency = r["latency"]
+    print("%-8s N %5d timeout %4d ms | %8.0f reports/s | %7.0f tags/s (%6.1f/report) |"
+          " CPU %5.1f us/tag (%4.1f%%) | latency p50 %6.1f p99 %6.1f ms"
+          % (r["mode"], r["n_tags"], r["timeout_ms"], r["reports_per_s"], r["tags_per_s"],
+             r["tags_per_report"] or 0, r["cpu_us_per_tag"] or 0, r["cpu_percent"],
+             latency["p50_ms"] or 0, latency["p99_ms"] or 0))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default=",".join(REPORT_MODES),
+                        help="comma-separated subset of %s" % (REPORT_MODES,))
+    parser.add_argument("--rate", type=float, default=5000.0,
+                        help="simulated tag reads per second")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="seconds measured per mode")
+    parser.add_argument("--n-tags", type=int, default=100, help="N for n_tags mode")
+    parser.add_argument("--timeout-ms", type=int, default=200,
+                        help="report timeout for n_tags, timed and auto")
+    parser.add_argument("--target-reports-per-s", type=float, default=20.0,
+                        help="what auto mode aims for")
+    parser.add_argument("--adapt-interval", type=float, default=1.0,
+                        help="seconds between auto mode checks")
+    parser.add_argument("--decoder", choices=("fast", "sllurp"), default="fast")
+    parser.add_argument("--port", type=int, default=15184, help="simulated reader port")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="exit non-zero if CPU per tag rose against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed CPU per tag rise for --compare (default: 0.1 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    simulator = start_simulator(args.port, args.rate)
+    results = []
+    try:
+        for mode in args.modes.split(","):
+            result = run_mode(mode, args)
+            results.append(result)
+            print_result(result)
+    finally:
+        simulator.terminate()
+        simulator.wait()
+
+    params = {k: getattr(args, k) for k in
+              ("modes", "rate", "duration", "n_tags", "timeout_ms",
+               "target_reports_per_s", "adapt_interval", "decoder")}
+    document = None
+    if args.json:
+        document = write_results(args.json, "reporting", results, params)
+    if args.compare:
+        baseline = load_results(args.compare)
+        current = document or {"results": results}
+        regressions = compare(baseline, current, ("mode",), "cpu_us_per_tag",
+                              args.tolerance, higher_is_better=False)
+        for (mode,), old, new in regressions:
+            print("REGRESSION %s: %.1f -> %.1f us/tag" % (mode, old, new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""Sharded storage: rows/s through one writer thread against N writer processes.
+
+    python -m benchmarks.sharded
+    python -m benchmarks.sharded --reads 1000000 --shards 1,2,4,8 --json sharded.json
+
+The same tag dicts are handed over in consumer-sized batches to a
+BatchedTagWriter and to ShardedTagWriters of each shard count, then the
+writer is closed. The time from the first put to close() returning is the
+sustained rate; the main thread's share of it (building and routing rows)
+is reported apart, as that is what the LLRP side pays. ShardedTagDB must
+find every read again before a result counts. Shards only help with cores
+to spare: `cpus` is recorded with each result.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from db.connection import close_connection, get_connection
+from db.sharded import SHARD_KEYS, ShardedTagDB, ShardedTagWriter
+from db.writer import BatchedTagWriter
+from pipeline.results import write_results
+
+BATCH = 500
+
+
+def make_tags(args):
+    rng = random.Random(1)
+    epcs = [b"\xe2\x80\x11\x60" + i.to_bytes(8, "big") for i in range(args.population)]
+    readers = ["10.0.0.%d:5084" % r for r in range(1, args.readers + 1)]
+    start = 1760000000 * 1000000
+    return [{"epc": rng.choice(epcs), "antenna": rng.randint(1, 4),
+             "channel": rng.randint(1, 50), "rssi": rng.randint(-80, -40),
+             "seen_count": 1, "first_seen": start + i * 100, "last_seen": start + i * 100,
+             "reader": rng.choice(readers)}
+            for i in range(args.reads)]
+
+
+def run_writer(writer, tags):
+    """(total_s, put_s) to write `tags` through a started writer and close it."""
+    start = time.perf_counter()
+    put_s = 0.0
+    for i in range(0, len(tags), BATCH):
+        put_start = time.perf_counter()
+        writer.put_many(tags[i:i + BATCH])
+        put_s += time.perf_counter() - put_start
+    writer.close()
+    return time.perf_counter() - start, put_s
+
+
+def run(args):
+    tags = make_tags(args)
+    workdir = tempfile.mkdtemp(prefix="sharded-bench-")
+    cpus = os.cpu_count()
+    results = []
+    try:
+        for shards in [0] + [int(n) for n in args.shards.split(",")]:
+            db_path = os.path.join(workdir, "tags-%d.db" % shards)
+            if shards:
+                writer = ShardedTagWriter(db_path, shards=shards, key=args.key)
+            else:
+                get_connection(db_path)  # Schema set up outside the timing
+                close_connection(db_path)
+                writer = BatchedTagWriter(db_path)
+            writer.start()
+            if shards:
+                time.sleep(1.0)  # Let the spawned shards import and open their files
+            total_s, put_s = run_writer(writer, tags)
+
+            if shards:
+                store = ShardedTagDB(db_path)
+                found = store.count()
+                store.close()
+            else:
+                found = get_connection(db_path).execute(
+                    "SELECT COUNT(*) FROM tag_reads").fetchone()[0]
+                close_connection(db_path)
+            if found != len(tags):
+                raise SystemExit("%d shards: found %d reads, wrote %d"
+                                 % (shards, found, len(tags)))
+            results.append({"shards": shards, "key": args.key if shards else None,
+                            "reads": len(tags), "cpus": cpus,
+                            "rows_per_s": len(tags) / total_s,
+                            "put_us_per_read": put_s * 1e6 / len(tags)})
+    finally:
+        shutil.rmtree(workdir)
+
+    for r in results:
+        print("%-14s %9.0f rows/s | main thread %.2f us/read"
+              % ("1 thread" if not r["shards"] else "%d shards" % r["shards"],
+                 r["rows_per_s"], r["put_us_per_read"]))
+    print("(%d CPUs)" % cpus)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reads", type=int, default=300000)
+    parser.add_argument("--population", type=int, default=20000, help="distinct EPCs")
+    parser.add_argument("--readers", type=int, default=8, help="distinct reader addresses")
+    parser.add_argument("--shards", default="2,4", help="comma-separated shard counts")
+    parser.add_argument("--key", choices=SHARD_KEYS, default="epc", help="shard by")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        params = {k: getattr(args, k) for k in
+                  ("reads", "population", "readers", "shards", "key")}
+        write_results(args.json, "sharded", results, params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""`show tags` parsing: lines/s and memory against output size.
+
+    python -m benchmarks.showtags --lines 10000,100000,1000000
+    python -m benchmarks.showtags --layouts table --json showtags.json
+
+Output is generated line by line and streamed through load_show_tags() into
+a throwaway database, the way RFID_TCP.py --db consumes an SSH stdout. The
+Python heap peak (tracemalloc) should stay flat as the output grows.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from db.create_tables import create_tags_table
+from pipeline.results import write_results
+from pipeline.showtags import load_show_tags
+
+LAYOUTS = ("table", "kv")
+
+
+def generate(layout, lines, population=1000):
+    """Yield about `lines` lines of CLI output in `layout`."""
+    if layout == "table":
+        yield "EPC                       Antenna  RSSI  Count  Last Seen\n"
+        yield "------------------------  -------  ----  -----  ----------------\n"
+        for i in range(lines - 2):
+            yield "E2801160%016X  %d        %d   %d      %d\n" % (
+                i % population, 1 + i % 4, -40 - i % 30, 1 + i % 5,
+                1700000000000000 + i)
+    else:
+        for i in range(lines // 2):
+            yield "EPC: E2801160%016X Antenna: %d\n" % (i % population, 1 + i % 4)
+            yield "  RSSI: %d Count: %d\n" % (-40 - i % 30, 1 + i % 5)
+
+
+def run(args):
+    results = []
+    for layout in args.layouts.split(","):
+        for lines in (int(x) for x in args.lines.split(",")):
+            fd, db_path = tempfile.mkstemp(suffix=".db")
+            os.close(fd)
+            try:
+                create_tags_table(db_path)
+                tracemalloc.start()
+                start = time.perf_counter()
+                parser = load_show_tags(generate(layout, lines), db_path,
+                                        reader="bench", batch_size=args.batch_size)
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            finally:
+                os.remove(db_path)
+            result = {
+                "layout": layout,
+                "lines": parser.lines,
+                "records": parser.records,
+                "skipped": parser.skipped,
+                "seconds": elapsed,
+                "lines_per_s": parser.lines / elapsed,
+                "records_per_s": parser.records / elapsed,
+                "peak_heap_kb": peak / 1024.0,
+            }
+            results.append(result)
+            print("%-5s %8d lines -> %8d records (%d skipped) | %8.0f lines/s |"
+                  " %8.0f records/s | peak heap %7.0f KB"
+                  % (layout, result["lines"], result["records"], result["skipped"],
+                     result["lines_per_s"], result["records_per_s"],
+                     result["peak_heap_kb"]))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layouts", default=",".join(LAYOUTS),
+                        help="comma-separated subset of %s" % (LAYOUTS,))
+    parser.add_argument("--lines", default="10000,100000,1000000",
+                        help="output sizes in lines, comma-separated")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="rows per insert transaction (default: 5000)")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    if args.json:
+        params = {k: getattr(args, k) for k in ("layouts", "lines", "batch_size")}
+        write_results(args.json, "showtags", results, params)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Cold start to first tag of the headless entry points.
+
+    python -m benchmarks.startup --runs 5 --json startup.json
+    python -m benchmarks.startup --compare startup.json  # fail on a >10% slowdown
+
+Each run starts a fresh interpreter on the entry point against the local
+reader simulator and measures the wall time from spawning the process to
+
+    ready      the reader finished its setup ("Reader ready" on stdout)
+    first_tag  the first tag reached the sink (stdout line for RFIDReader*,
+               first CSV row on disk for logger.py)
+"""
+
+import argparse
+import asyncio
+import os
+import queue
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import compare, load_results
+from pipeline.results import write_results
+from pipeline.simulator import ReaderSimulator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("rfidreader", "rfidreader2", "logger")
+RUN_TIMEOUT = 30.0
+
+
+def start_simulator(port, rate):
+    sim = ReaderSimulator("127.0.0.1", port, rate=rate)
+    threading.Thread(target=asyncio.run, args=(sim.serve_forever(),),
+                     name="bench-simulator", daemon=True).start()
+    return sim
+
+
+def command(scenario, port, workdir):
+    if scenario == "logger":
+        return [sys.executable, os.path.join(ROOT, "logger.py"), "127.0.0.1",
+                "--port", str(port), "--outfile", os.path.join(workdir, "tags.csv")]
+    script = "RFIDReader.py" if scenario == "rfidreader" else "RFIDReader2.py"
+    cmd = [sys.executable, "-u", os.path.join(ROOT, script), "--headless",
+           "--host", "127.0.0.1", "--port", str(port),
+           "--log-file", os.path.join(workdir, "tag_reads.txt")]
+    if scenario == "rfidreader2":
+        cmd += ["--db", os.path.join(workdir, "tags.db")]
+    return cmd
+
+
+def _pump(stream, lines):
+    for line in stream:
+        lines.put((time.monotonic(), line))
+
+
+def run_once(scenario, port, workdir):
+    """(ready_s, first_tag_s) of one cold start; ready_s is None for logger."""
+    csv_path = os.path.join(workdir, "tags.csv")
+    lines = queue.Queue()
+    start = time.monotonic()
+    proc = subprocess.Popen(command(scenario, port, workdir), cwd=workdir,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True, errors="replace")
+    threading.Thread(target=_pump, args=(proc.stdout, lines), daemon=True).start()
+    ready = first_tag = None
+    try:
+        while first_tag is None:
+            if time.monotonic() - start > RUN_TIMEOUT:
+                raise SystemExit("%s: no tag within %.0fs" % (scenario, RUN_TIMEOUT))
+            if proc.poll() is not None:
+                raise SystemExit("%s exited with %d" % (scenario, proc.returncode))
+            try:
+                at, line = lines.get(timeout=0.002)
+            except queue.Empty:
+                if scenario == "logger" and os.path.exists(csv_path):
+                    with open(csv_path) as f:
+                        if len(f.readlines()) > 1:  # Header plus a row
+                            first_tag = time.monotonic() - start
+                continue
+            if "Reader ready" in line:
+                ready = at - start
+            elif "First tag" in line:
+                first_tag = at - start
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    return ready, first_tag
+
+
+def summarize(samples):
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        return None
+    return {"median_s": statistics.median(samples), "min_s": min(samples),
+            "max_s": max(samples)}
+
+
+def run(args):
+    start_simulator(args.port, args.rate)
+    time.sleep(0.2)
+    results = []
+    for scenario in args.scenarios.split(","):
+        readies, firsts = [], []
+        for _ in range(args.runs):
+            workdir = tempfile.mkdtemp(prefix="rfid-startup-")
+            try:
+                ready, first_tag = run_once(scenario, args.port, workdir)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            readies.append(ready)
+            firsts.append(first_tag)
+        result = {
+            "scenario": scenario,
+            "runs": args.runs,
+            "ready": summarize(readies),
+            "first_tag": summarize(firsts),
+            # For --compare: higher is better there
+            "first_tags_per_s": 1.0 / statistics.median(firsts),
+        }
+        results.append(result)
+        print_result(result)
+    return results
+
+
+def print_result(r):
+    ready = r["ready"]
+    first = r["first_tag"]
+    print("%-12s ready %s | first tag median %.3fs (min %.3f, max %.3f)"
+          % (r["scenario"],
+             "median %.3fs" % ready["median_s"] if ready else "    n/a     ",
+             first["median_s"], first["min_s"], first["max_s"]))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated subset of %s" % (SCENARIOS,))
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per scenario")
+    parser.add_argument("--port", type=int, default=15084, help="simulated reader port")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="simulated tag reads per second")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="exit non-zero if first-tag time grew against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed slowdown for --compare (default: 0.1 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    params = {k: getattr(args, k) for k in ("scenarios", "runs", "rate")}
+    document = None
+    if args.json:
+        document = write_results(args.json, "startup", results, params)
+    if args.compare:
+        baseline = load_results(args.compare)
+        current = document or {"results": results}
+        regressions = compare(baseline, current, ("scenario",), "first_tags_per_s",
+                              args.tolerance)
+        for (scenario,), old, new in regressions:
+            print("REGRESSION %s: first tag %.3fs -> %.3fs" % (scenario, 1 / old, 1 / new))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
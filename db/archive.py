@@ -0,0 +1,295 @@
+"""Columnar, memory-mapped archive of the tag_reads table, one directory per day.
+
+    archive/
+        2026-10-17/
+            index.json         row count, time range, EPC width, readers, offsets
+            last_seen.npy      int64 microseconds, sorted
+            epc.npy            uint8[rows, epc_width], zero padded
+            epc_len.npy        uint8
+            ...
+
+Every column is a plain .npy file, so np.load(path, mmap_mode="r") (or
+ArchiveDay below) maps it without copying or parsing anything. Missing
+values use sentinels instead of NULL: 0 for antenna, channel, seen_count,
+first_seen and reader, MISSING_RSSI for rssi. `reader` holds 1-based codes
+into the index's `readers` list.
+"""
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from . import queries
+from .connection import get_connection
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+DAY_US = 86400 * 1000000
+HOUR_US = 3600 * 1000000
+MISSING_RSSI = -128
+CHUNK_ROWS = 50000
+
+# Column -> dtype; epc is stored separately as a 2-D uint8 array
+COLUMNS = (
+    ("last_seen", np.int64),
+    ("first_seen", np.int64),
+    ("antenna", np.uint16),
+    ("channel", np.uint16),
+    ("seen_count", np.uint32),
+    ("rssi", np.int8),
+    ("reader", np.uint16),
+)
+
+
+def day_start_us(day):
+    """Microseconds at 00:00 UTC of a datetime.date."""
+    start = datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc)
+    return int(start.timestamp()) * 1000000
+
+
+def day_of_us(timestamp_us):
+    return datetime.datetime.fromtimestamp(timestamp_us / 1e6, datetime.timezone.utc).date()
+
+
+def _column(values, dtype, missing=0):
+    return np.fromiter((missing if v is None else v for v in values), dtype, len(values))
+
+
+def _epc_bytes(epc):
+    # Rows that predate the BLOB migration and were not hex stay text
+    return epc.encode("utf-8") if isinstance(epc, str) else epc
+
+
+# -------- EXPORT -------- #
+def export_day(conn, day, archive_dir, chunk_rows=CHUNK_ROWS):
+    """Write the reads of one UTC day to archive_dir/YYYY-MM-DD/.
+
+    Rows are streamed from SQLite in last_seen order `chunk_rows` at a time
+    into the memory-mapped column files, so a day of any size is exported
+    in constant memory. The day is built in a temporary directory and
+    renamed into place when complete. Returns the index, or None if the
+    day has no reads.
+    """
+    # One read transaction: the count and the rows come from the same snapshot
+    conn.execute("BEGIN")
+    try:
+        return _export_day(conn, day, archive_dir, chunk_rows)
+    finally:
+        conn.rollback()
+
+
+def _export_day(conn, day, archive_dir, chunk_rows):
+    start_us = day_start_us(day)
+    end_us = start_us + DAY_US
+    rows, epc_width = conn.execute(queries.COUNT_READS_BETWEEN, (start_us, end_us)).fetchone()
+    if not rows:
+        return None
+
+    final = os.path.join(archive_dir, day.isoformat())
+    partial = final + ".partial"
+    if os.path.exists(partial):
+        shutil.rmtree(partial)
+    os.makedirs(partial)
+
+    def open_column(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(partial, name + ".npy"),
+                                         mode="w+", dtype=dtype, shape=shape)
+
+    columns = {name: open_column(name, dtype, (rows,)) for name, dtype in COLUMNS}
+    epc = open_column("epc", np.uint8, (rows, epc_width))
+    epc_len = open_column("epc_len", np.uint8, (rows,))
+    readers = {}
+
+    cursor = queries.reads_between(conn, start_us, end_us)
+    offset = 0
+    while offset < rows:
+        chunk = cursor.fetchmany(chunk_rows)
+        if not chunk:
+            break
+        n = len(chunk)
+        epcs, antenna, channel, seen_count, rssi, first_seen, last_seen, reader = zip(*chunk)
+        epcs = [_epc_bytes(e) for e in epcs]
+        end = offset + n
+        epc[offset:end] = np.frombuffer(
+            b"".join(e.ljust(epc_width, b"\0") for e in epcs), np.uint8).reshape(n, epc_width)
+        epc_len[offset:end] = [len(e) for e in epcs]
+        columns["last_seen"][offset:end] = last_seen
+        columns["first_seen"][offset:end] = _column(first_seen, np.int64)
+        columns["antenna"][offset:end] = _column(antenna, np.uint16)
+        columns["channel"][offset:end] = _column(channel, np.uint16)
+        columns["seen_count"][offset:end] = _column(seen_count, np.uint32)
+        columns["rssi"][offset:end] = _column(rssi, np.int8, MISSING_RSSI)
+        columns["reader"][offset:end] = [
+            0 if r is None else readers.setdefault(r, len(readers) + 1) for r in reader]
+        offset = end
+    if offset < rows:
+        raise RuntimeError("%s: expected %d reads, got %d" % (day, rows, offset))
+
+    last_seen = columns["last_seen"]
+    # Row offset of every hour boundary, so an hour is a slice without a search
+    hours = np.searchsorted(last_seen, start_us + HOUR_US * np.arange(25)).tolist()
+    antennas = np.bincount(columns["antenna"], minlength=1)
+    index = {
+        "version": ARCHIVE_VERSION,
+        "day": day.isoformat(),
+        "rows": rows,
+        "start_us": start_us,
+        "end_us": end_us,
+        "first_read_us": int(last_seen[0]),
+        "last_read_us": int(last_seen[-1]),
+        "epc_width": epc_width,
+        "readers": sorted(readers, key=readers.get),
+        "hour_offsets": hours,
+        "reads_per_antenna": {str(a): int(c) for a, c in enumerate(antennas) if c},
+        "columns": {name: np.dtype(dtype).str for name, dtype in COLUMNS},
+        "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat(
+            timespec="seconds"),
+    }
+    for column in list(columns.values()) + [epc, epc_len]:
+        column.flush()
+    del columns, epc, epc_len, last_seen
+    with open(os.path.join(partial, "index.json"), "w") as f:
+        json.dump(index, f, indent=1)
+    if os.path.exists(final):
+        shutil.rmtree(final)
+    os.rename(partial, final)
+    return index
+
+
+def archived_days(archive_dir):
+    """Days already in `archive_dir`, as datetime.date, oldest first."""
+    if not os.path.isdir(archive_dir):
+        return []
+    days = []
+    for name in os.listdir(archive_dir):
+        if os.path.exists(os.path.join(archive_dir, name, "index.json")):
+            try:
+                days.append(datetime.date.fromisoformat(name))
+            except ValueError:
+                pass
+    return sorted(days)
+
+
+def archive_closed_days(db_path, archive_dir, grace=300.0, prune=False, now=None):
+    """Export every day that ended more than `grace` seconds ago and is not
+    archived yet; with `prune`, delete archived reads from SQLite.
+
+    A day is exported once: reads that arrive for it later stay in SQLite
+    only, until its directory is removed and it is exported again.
+
+    Returns the indexes of the days exported by this call.
+    """
+    conn = get_connection(db_path)
+    oldest, _ = queries.time_range(conn)
+    if oldest is None:
+        return []
+    now = time.time() if now is None else now
+    # The last day that is over, grace included
+    last_closed = day_of_us(int((now - grace) * 1e6)) - datetime.timedelta(days=1)
+    done = set(archived_days(archive_dir))
+    exported = []
+    day = day_of_us(oldest)
+    while day <= last_closed:
+        if day not in done:
+            start = time.perf_counter()
+            index = export_day(conn, day, archive_dir)
+            if index is not None:
+                logger.info("Archived %s: %d reads in %.1fs", day, index["rows"],
+                            time.perf_counter() - start)
+                exported.append(index)
+                done.add(day)
+        if prune and day in done:
+            prune_day(conn, day, archive_dir)
+        day += datetime.timedelta(days=1)
+    return exported
+
+
+def prune_day(conn, day, archive_dir):
+    """Delete an archived day's reads from SQLite, if they are all in the
+    archive: reads that arrived after the export (a replayed spill, a
+    reader clock behind) keep the whole day in SQLite, with a warning."""
+    with open(os.path.join(archive_dir, day.isoformat(), "index.json")) as f:
+        archived = json.load(f)["rows"]
+    start_us = day_start_us(day)
+    with conn:
+        # Hold the write lock from the count to the delete
+        conn.execute("BEGIN IMMEDIATE")
+        rows, _ = conn.execute(queries.COUNT_READS_BETWEEN,
+                               (start_us, start_us + DAY_US)).fetchone()
+        if not rows:
+            return 0
+        if rows != archived:
+            logger.warning("%s: %d reads in SQLite but %d archived; not pruning"
+                           " (remove the day from the archive to export it again)",
+                           day, rows, archived)
+            return 0
+        conn.execute(queries.DELETE_READS_BETWEEN, (start_us, start_us + DAY_US))
+    logger.info("Pruned %d archived reads of %s from SQLite", rows, day)
+    return rows
+
+
+# -------- READING -------- #
+class ArchiveDay(object):
+    """One archived day, its columns memory-mapped read-only.
+
+    Columns are NumPy arrays backed by the files (`day.antenna`,
+    `day.last_seen`, ...; `day.epc` is uint8[rows, epc_width]); nothing is
+    read from disk until it is used. `epc_keys` views the EPCs as one
+    fixed-width value per row, for np.unique() and equality tests.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        if self.index["version"] != ARCHIVE_VERSION:
+            raise ValueError("%s: archive version %s, expected %d"
+                             % (path, self.index["version"], ARCHIVE_VERSION))
+        self.day = datetime.date.fromisoformat(self.index["day"])
+        self.rows = self.index["rows"]
+        self.readers = self.index["readers"]
+        for name in [name for name, _ in COLUMNS] + ["epc", "epc_len"]:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def epc_keys(self):
+        width = self.index["epc_width"]
+        return self.epc.view("V%d" % width).reshape(self.rows)
+
+    def epc_key(self, epc):
+        """`epc` (bytes) in the form of epc_keys, for comparisons."""
+        return np.frombuffer(epc.ljust(self.index["epc_width"], b"\0"),
+                             "V%d" % self.index["epc_width"])[0]
+
+    def epc_at(self, row):
+        return bytes(self.epc[row, :self.epc_len[row]])
+
+    def between(self, start_us, end_us):
+        """Slice of the rows read in [start_us, end_us)."""
+        last_seen = self.last_seen
+        return slice(int(np.searchsorted(last_seen, start_us)),
+                     int(np.searchsorted(last_seen, end_us)))
+
+    def hour(self, hour):
+        """Slice of the rows read in one UTC hour (0-23), from the index."""
+        offsets = self.index["hour_offsets"]
+        return slice(offsets[hour], offsets[hour + 1])
+
+    def reader_of(self, code):
+        return self.readers[code - 1] if code else None
+
+
+def open_archive(archive_dir, start=None, end=None):
+    """ArchiveDay for every archived day in [start, end] (dates, inclusive)."""
+    return [ArchiveDay(os.path.join(archive_dir, day.isoformat()))
+            for day in archived_days(archive_dir)
+            if (start is None or day >= start) and (end is None or day <= end)]
@@ -1,7 +1,50 @@
 import sqlite3
 import os
+import threading
 
+from .schema import migrate
 
-def get_connection():
-    db_path = os.path.join(os.path.dirname(__file__), "tags.db")
-    return sqlite3.connect(db_path)
+DB_PATH = os.path.join(os.path.dirname(__file__), "tags.db")
+
+# Applied to every connection handed out by get_connection()
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",      # 16 MiB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MiB memory-mapped reads
+    "PRAGMA busy_timeout=5000",
+)
+# Size of sqlite3's per-connection prepared statement cache
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+
+def get_connection(db_path=None):
+    """Return this thread's connection to `db_path`, opening it on first use.
+
+    Connections are tuned with PRAGMAS and migrated to the current schema
+    when opened. They are owned by the thread that asked for them, so do not
+    close them; use close_connection() when the thread is done.
+    """
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, cached_statements=CACHED_STATEMENTS)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        migrate(conn)
+        connections[db_path] = conn
+    return conn
+
+
+def close_connection(db_path=None):
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", {})
+    conn = connections.pop(db_path, None)
+    if conn is not None:
+        conn.close()
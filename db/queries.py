@@ -0,0 +1,69 @@
+INSERT_TAG_READ = '''
+    INSERT INTO tag_reads (epc, antenna, channel, seen_count, rssi, first_seen, last_seen,
+                           reader)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SELECT_LAST_SEEN = '''
+    SELECT MAX(last_seen) FROM tag_reads WHERE epc = ?
+'''
+
+SELECT_READS_BY_ANTENNA = '''
+    SELECT epc, antenna, channel, seen_count, rssi, first_seen, last_seen, reader
+    FROM tag_reads
+    WHERE antenna = ? AND last_seen >= ? AND last_seen < ?
+    ORDER BY last_seen
+'''
+
+SELECT_READS_BY_EPC = '''
+    SELECT epc, antenna, channel, seen_count, rssi, first_seen, last_seen, reader
+    FROM tag_reads
+    WHERE epc = ? AND last_seen >= ? AND last_seen < ?
+    ORDER BY last_seen
+'''
+
+
+def last_seen(conn, epc):
+    """Microsecond timestamp of the latest read of `epc`, or None."""
+    return conn.execute(SELECT_LAST_SEEN, (epc,)).fetchone()[0]
+
+
+def reads_by_antenna(conn, antenna, start_us, end_us):
+    return conn.execute(SELECT_READS_BY_ANTENNA, (antenna, start_us, end_us)).fetchall()
+
+
+def reads_by_epc(conn, epc, start_us, end_us):
+    return conn.execute(SELECT_READS_BY_EPC, (epc, start_us, end_us)).fetchall()
+
+
+# -------- TIME RANGES (archive export) -------- #
+# Two subqueries: one MIN(), MAX() pair would scan the whole index
+SELECT_TIME_RANGE = '''
+    SELECT (SELECT MIN(last_seen) FROM tag_reads), (SELECT MAX(last_seen) FROM tag_reads)
+'''
+
+COUNT_READS_BETWEEN = '''
+    SELECT COUNT(*), MAX(LENGTH(epc)) FROM tag_reads
+    WHERE last_seen >= ? AND last_seen < ?
+'''
+
+SELECT_READS_BETWEEN = '''
+    SELECT epc, antenna, channel, seen_count, rssi, first_seen, last_seen, reader
+    FROM tag_reads
+    WHERE last_seen >= ? AND last_seen < ?
+    ORDER BY last_seen
+'''
+
+DELETE_READS_BETWEEN = '''
+    DELETE FROM tag_reads WHERE last_seen >= ? AND last_seen < ?
+'''
+
+
+def time_range(conn):
+    """(oldest, newest) last_seen in the table, (None, None) when empty."""
+    return conn.execute(SELECT_TIME_RANGE).fetchone()
+
+
+def reads_between(conn, start_us, end_us):
+    """Cursor over the reads of [start_us, end_us), oldest first."""
+    return conn.execute(SELECT_READS_BETWEEN, (start_us, end_us))
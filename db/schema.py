@@ -0,0 +1,146 @@
+import logging
+from binascii import unhexlify
+
+logger = logging.getLogger(__name__)
+
+# Timestamps are stored as INTEGER microseconds since the Unix epoch, the
+# unit the reader uses for FirstSeenTimestampUTC/LastSeenTimestampUTC.
+TAG_READS_V1 = """
+CREATE TABLE tag_reads (
+    id INTEGER PRIMARY KEY,
+    epc TEXT NOT NULL,
+    antenna INTEGER,
+    channel INTEGER,
+    seen_count INTEGER,
+    rssi INTEGER,
+    first_seen INTEGER,
+    last_seen INTEGER NOT NULL
+)
+"""
+
+TAG_READS_INDEXES_V1 = (
+    "CREATE INDEX IF NOT EXISTS idx_tag_reads_epc_last_seen"
+    " ON tag_reads (epc, last_seen)",
+    "CREATE INDEX IF NOT EXISTS idx_tag_reads_antenna_last_seen"
+    " ON tag_reads (antenna, last_seen)",
+)
+
+
+def _table_exists(conn, name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (name,)).fetchone()
+    return row is not None
+
+
+def _migrate_v1(conn):
+    """Single tag_reads table with integer timestamps and lookup indexes.
+
+    Older databases had either RFIDReader2's `tag_reads` or db's `tags`
+    table, both with a TEXT last_seen; their rows are carried over.
+    """
+    legacy = [name for name in ("tag_reads", "tags") if _table_exists(conn, name)]
+    for name in legacy:
+        conn.execute("ALTER TABLE %s RENAME TO legacy_%s" % (name, name))
+
+    conn.execute(TAG_READS_V1)
+    for statement in TAG_READS_INDEXES_V1:
+        conn.execute(statement)
+
+    for name in legacy:
+        conn.execute("""
+            INSERT INTO tag_reads (epc, antenna, channel, seen_count, last_seen)
+            SELECT epc, antenna, channel, seen_count,
+                   COALESCE(CAST(last_seen AS INTEGER), 0)
+            FROM legacy_%s
+        """ % name)
+        conn.execute("DROP TABLE legacy_%s" % name)
+
+
+TAG_READS_V2 = TAG_READS_V1.replace("epc TEXT NOT NULL", "epc BLOB NOT NULL")
+
+
+def _unhex_epc(text):
+    if text is None or isinstance(text, bytes):
+        return text
+    try:
+        return unhexlify(text)
+    except ValueError:
+        # Not hex; keep the original characters rather than losing the row
+        return text.encode("utf-8")
+
+
+def _migrate_v2(conn):
+    """Store EPCs as raw bytes (BLOB) instead of hex text."""
+    conn.create_function("unhex_epc", 1, _unhex_epc)
+    conn.execute("ALTER TABLE tag_reads RENAME TO legacy_tag_reads")
+    conn.execute("DROP INDEX IF EXISTS idx_tag_reads_epc_last_seen")
+    conn.execute("DROP INDEX IF EXISTS idx_tag_reads_antenna_last_seen")
+    conn.execute(TAG_READS_V2)
+    conn.execute("""
+        INSERT INTO tag_reads (id, epc, antenna, channel, seen_count, rssi,
+                               first_seen, last_seen)
+        SELECT id, unhex_epc(epc), antenna, channel, seen_count, rssi,
+               first_seen, last_seen
+        FROM legacy_tag_reads
+    """)
+    conn.execute("DROP TABLE legacy_tag_reads")
+    for statement in TAG_READS_INDEXES_V1:
+        conn.execute(statement)
+
+
+def _migrate_v3(conn):
+    """Record which reader ("host:port") produced each row."""
+    conn.execute("ALTER TABLE tag_reads ADD COLUMN reader TEXT")
+
+
+def _migrate_v4(conn):
+    """Index last_seen on its own, for time-range exports and pruning."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tag_reads_last_seen"
+                 " ON tag_reads (last_seen)")
+
+
+# MIGRATIONS[n] upgrades a database from user_version n to n + 1
+MIGRATIONS = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Bring `conn`'s database up to SCHEMA_VERSION, one step per transaction.
+
+    A step that fails is rolled back whole, user_version included, so the
+    next run starts it again from a clean state.
+    """
+    version = get_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+    # sqlite3 only opens transactions by itself before INSERT/UPDATE/DELETE,
+    # so the ALTER/CREATE/DROP of a step would each commit on their own
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        while version < SCHEMA_VERSION:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                version = get_version(conn)
+                if version < SCHEMA_VERSION:
+                    logger.info("Migrating tag database to schema version %d", version + 1)
+                    MIGRATIONS[version](conn)
+                    version += 1
+                    conn.execute("PRAGMA user_version = %d" % version)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    finally:
+        conn.isolation_level = isolation_level
+    return version
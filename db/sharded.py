@@ -0,0 +1,363 @@
+"""Tag reads spread over several SQLite files, each written by its own process.
+
+A single BatchedTagWriter thread tops out at what one core can insert.
+ShardedTagWriter routes every read by a hash of its EPC (or of its reader
+address) to one of `shards` writer processes, each committing to its own
+database file next to `db_path`:
+
+    tags.db  ->  tags.epc-0-of-4.db, tags.epc-1-of-4.db, ...
+
+LLRP handling stays in the calling process, which only builds rows and
+ships them to the shards in chunks. The key and the shard count are part
+of the file names, so ShardedTagDB finds and queries a set of shards from
+`db_path` alone.
+"""
+
+import glob
+import heapq
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import threading
+import time
+import zlib
+
+from pipeline.metrics import DB_ERRORS, DB_ROWS
+
+from . import queries
+from .connection import DB_PATH, close_connection, get_connection
+from .writer import BatchedTagWriter, drop_invalid, tag_row
+
+logger = logging.getLogger(__name__)
+
+SHARD_BY_EPC = "epc"
+SHARD_BY_READER = "reader"
+SHARD_KEYS = (SHARD_BY_EPC, SHARD_BY_READER)
+# Column of each key in a tag_row()
+KEY_COLUMNS = {SHARD_BY_EPC: 0, SHARD_BY_READER: 7}
+
+LAST_SEEN = 6  # Column of last_seen in query results
+
+# Slots of a shard's shared statistics
+ROWS, COMMITS, COMMIT_TIME_TOTAL, COMMIT_TIME_MAX = range(4)
+
+_SHARD_NAME = re.compile(r"\.(%s)-(\d+)-of-(\d+)" % "|".join(SHARD_KEYS))
+
+
+def shard_path(db_path, key, index, shards):
+    root, ext = os.path.splitext(db_path)
+    return "%s.%s-%d-of-%d%s" % (root, key, index, shards, ext)
+
+
+def shard_paths(db_path, key, shards):
+    return [shard_path(db_path, key, i, shards) for i in range(shards)]
+
+
+def shard_index(value, shards):
+    """Shard of an EPC or reader address.
+
+    crc32 rather than hash(): str hashes are salted per process, and a
+    lookup has to land on the shard the writer picked in an earlier run.
+    """
+    if not isinstance(value, bytes):
+        value = str(value).encode()
+    return zlib.crc32(value) % shards
+
+
+def find_shards(db_path=None):
+    """(key, paths) of the shard files belonging to `db_path`."""
+    db_path = db_path or DB_PATH
+    root, ext = os.path.splitext(db_path)
+    layouts = {}
+    for path in glob.glob(glob.escape(root) + ".*-of-*" + glob.escape(ext)):
+        match = _SHARD_NAME.fullmatch(path[len(root):len(path) - len(ext)])
+        if match:
+            layouts.setdefault((match.group(1), int(match.group(3))), set()).add(path)
+    if not layouts:
+        raise FileNotFoundError("no shards of %s" % db_path)
+    if len(layouts) > 1:
+        raise ValueError("%s has shards of several layouts: %s" % (
+            db_path, ", ".join("%s/%d" % layout for layout in sorted(layouts))))
+    (key, shards), found = layouts.popitem()
+    paths = shard_paths(db_path, key, shards)
+    missing = [path for path in paths if path not in found]
+    if missing:
+        raise FileNotFoundError("missing shard(s): %s" % ", ".join(missing))
+    return key, paths
+
+
+def _as_row(row):
+    return row
+
+
+class _RowWriter(BatchedTagWriter):
+    """BatchedTagWriter fed ready-made rows by the routing process."""
+    to_row = staticmethod(_as_row)
+
+
+def _shard_main(db_path, rows, stats, batch_size, flush_interval, synchronous):
+    """Writer process of one shard: chunks of rows in, batched commits out."""
+    # Ctrl-C and service stops go to the whole process group; the parent
+    # decides when to stop, so that rows it still holds are not lost.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    parent = multiprocessing.parent_process()
+    writer = _RowWriter(db_path, batch_size=batch_size, flush_interval=flush_interval,
+                        synchronous=synchronous)
+    writer.start()
+
+    def publish():
+        stats[ROWS] = writer.rows_written
+        stats[COMMITS] = writer.commits
+        stats[COMMIT_TIME_TOTAL] = writer.commit_time_total
+        stats[COMMIT_TIME_MAX] = writer.commit_time_max
+
+    try:
+        while True:
+            try:
+                chunk = rows.get(timeout=flush_interval)
+            except queue.Empty:
+                if not parent.is_alive():
+                    logger.error("%s: parent process gone, stopping", db_path)
+                    break
+                chunk = ()
+            if chunk is None:
+                break
+            writer.put_many(chunk)
+            publish()
+    finally:
+        writer.close()
+        publish()
+
+
+class ShardedTagWriter(object):
+    """Tag writer that spreads reads over `shards` writer processes.
+
+    Drop-in for BatchedTagWriter: put()/put_many() from any thread,
+    close() flushes everything. Reads go to the shard of their EPC, or of
+    their reader with key="reader", and are shipped in chunks of
+    `chunk_rows` (sooner after `flush_interval` seconds). Each shard
+    commits with BatchedTagWriter's `batch_size`/`flush_interval` rules.
+    A shard holds at most `max_chunks` chunks in flight; past that, put()
+    waits for it, so an event loop should call it from an executor.
+
+    The shards are spawned, not forked, so they do not inherit the reader
+    threads and sockets of this process.
+    """
+
+    def __init__(self, db_path=None, shards=4, key=SHARD_BY_EPC, batch_size=500,
+                 flush_interval=0.5, synchronous="NORMAL", chunk_rows=256,
+                 max_chunks=64):
+        if key not in SHARD_KEYS:
+            raise ValueError("shard key must be one of %s, not %r" % (SHARD_KEYS, key))
+        if shards < 1:
+            raise ValueError("need at least one shard")
+        self.db_path = db_path or DB_PATH
+        self.shards = shards
+        self.key = key
+        self.paths = shard_paths(self.db_path, key, shards)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.chunk_rows = chunk_rows
+        self.max_chunks = max_chunks
+
+        self._column = KEY_COLUMNS[key]
+        self._lock = threading.Lock()
+        self._buffers = [[] for _ in range(shards)]
+        self._queues = []
+        self._stats = []
+        self._processes = []
+        self._stop = threading.Event()
+        self._flusher = None
+        self._rows_reported = 0
+        self._dead = set()
+        self.started_at = None
+
+    # -------- PRODUCER SIDE -------- #
+    def start(self):
+        if self._processes:
+            return
+        ctx = multiprocessing.get_context("spawn")
+        for index, path in enumerate(self.paths):
+            rows = ctx.Queue(self.max_chunks)
+            stats = ctx.Array("d", 4, lock=False)
+            process = ctx.Process(target=_shard_main, name="tag-db-shard-%d" % index,
+                                  args=(path, rows, stats, self.batch_size,
+                                        self.flush_interval, self.synchronous),
+                                  daemon=True)
+            process.start()
+            self._queues.append(rows)
+            self._stats.append(stats)
+            self._processes.append(process)
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._flusher = threading.Thread(target=self._flush_loop,
+                                         name="tag-db-shard-flusher", daemon=True)
+        self._flusher.start()
+
+    def put(self, tag_data):
+        self.put_many((tag_data,))
+
+    def put_many(self, tags):
+        column = self._column
+        shards = self.shards
+        buffers = self._buffers
+        with self._lock:
+            for tag_data in tags:
+                try:
+                    row = tag_row(tag_data)
+                except Exception as e:
+                    drop_invalid(tag_data, e)
+                    continue
+                index = shard_index(row[column], shards)
+                buffer = buffers[index]
+                buffer.append(row)
+                if len(buffer) >= self.chunk_rows:
+                    self._send(index)
+
+    def _send(self, index):
+        """Ship shard `index`'s buffered rows; call with the lock held."""
+        rows = self._buffers[index]
+        self._buffers[index] = []
+        if not self._put(index, rows):
+            DB_ERRORS.inc(len(rows))
+
+    def _put(self, index, item):
+        """Queue `item` for shard `index`; False if that shard has died."""
+        process = self._processes[index]
+        while process.is_alive():
+            try:
+                self._queues[index].put(item, timeout=1.0)
+                return True
+            except queue.Full:
+                pass
+        if index not in self._dead:
+            self._dead.add(index)
+            logger.error("%s exited with code %s; its tag reads are lost",
+                         process.name, process.exitcode)
+        return False
+
+    def _flush_loop(self):
+        # Half the interval, so a row waits at most flush_interval here
+        while not self._stop.wait(self.flush_interval / 2):
+            with self._lock:
+                for index, buffer in enumerate(self._buffers):
+                    if buffer:
+                        self._send(index)
+            self._report_rows()
+
+    def _report_rows(self):
+        # The shards' own metrics stay in their processes
+        rows = int(sum(stats[ROWS] for stats in self._stats))
+        if rows > self._rows_reported:
+            DB_ROWS.inc(rows - self._rows_reported)
+            self._rows_reported = rows
+
+    def close(self, timeout=None):
+        """Stop the shards after every pending read has been committed."""
+        if not self._processes:
+            return
+        self._stop.set()
+        self._flusher.join()
+        with self._lock:
+            for index, buffer in enumerate(self._buffers):
+                if buffer:
+                    self._send(index)
+            for index in range(self.shards):
+                self._put(index, None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.error("%s did not stop in time", process.name)
+        self._report_rows()
+        for rows in self._queues:
+            rows.close()
+        self._processes = []
+        self._queues = []
+
+    # -------- REPORTING -------- #
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        shard_rows = [int(stats[ROWS]) for stats in self._stats]
+        rows = sum(shard_rows)
+        commits = int(sum(stats[COMMITS] for stats in self._stats))
+        commit_time_total = sum(stats[COMMIT_TIME_TOTAL] for stats in self._stats)
+        return {
+            "shards": self.shards,
+            "shard_rows": shard_rows,
+            "rows": rows,
+            "commits": commits,
+            "rows_per_s": rows / elapsed if elapsed else 0.0,
+            # The shards write side by side, so their rates add up
+            "write_rows_per_s": sum(stats[ROWS] / stats[COMMIT_TIME_TOTAL]
+                                    for stats in self._stats if stats[COMMIT_TIME_TOTAL]),
+            "avg_commit_ms": commit_time_total / commits * 1000.0 if commits else 0.0,
+            "max_commit_ms": max([stats[COMMIT_TIME_MAX] for stats in self._stats],
+                                 default=0.0) * 1000.0,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return ("{rows} rows in {commits} commits over {shards} shards |"
+                " {rows_per_s:.1f} rows/s ({write_rows_per_s:.0f} rows/s while writing) |"
+                " commit avg {avg_commit_ms:.2f} ms, max {max_commit_ms:.2f} ms"
+                ).format(**s)
+
+
+class ShardedTagDB(object):
+    """The db.queries lookups answered across every shard of `db_path`.
+
+    Lookups by EPC go to a single shard when the reads were sharded by
+    EPC; everything else asks each shard and merges the answers, oldest
+    read first. Connections come from get_connection(), so they belong to
+    the calling thread; close() releases them.
+    """
+
+    def __init__(self, db_path=None):
+        self.key, self.paths = find_shards(db_path)
+
+    def _connections(self, epc=None):
+        paths = self.paths
+        if epc is not None and self.key == SHARD_BY_EPC:
+            paths = [paths[shard_index(epc, len(paths))]]
+        return [get_connection(path) for path in paths]
+
+    def _merged(self, cursors):
+        return heapq.merge(*cursors, key=lambda row: row[LAST_SEEN])
+
+    def last_seen(self, epc):
+        """Microsecond timestamp of the latest read of `epc`, or None."""
+        seen = [queries.last_seen(conn, epc) for conn in self._connections(epc)]
+        return max((s for s in seen if s is not None), default=None)
+
+    def reads_by_epc(self, epc, start_us, end_us):
+        return list(self._merged(queries.reads_by_epc(conn, epc, start_us, end_us)
+                                 for conn in self._connections(epc)))
+
+    def reads_by_antenna(self, antenna, start_us, end_us):
+        return list(self._merged(queries.reads_by_antenna(conn, antenna, start_us, end_us)
+                                 for conn in self._connections()))
+
+    def reads_between(self, start_us, end_us):
+        """Iterator over the reads of [start_us, end_us), oldest first."""
+        return self._merged(queries.reads_between(conn, start_us, end_us)
+                            for conn in self._connections())
+
+    def time_range(self):
+        """(oldest, newest) last_seen over all shards, (None, None) when empty."""
+        ranges = [queries.time_range(conn) for conn in self._connections()]
+        oldest = [r[0] for r in ranges if r[0] is not None]
+        newest = [r[1] for r in ranges if r[1] is not None]
+        return min(oldest, default=None), max(newest, default=None)
+
+    def count(self):
+        return sum(conn.execute("SELECT COUNT(*) FROM tag_reads").fetchone()[0]
+                   for conn in self._connections())
+
+    def close(self):
+        for path in self.paths:
+            close_connection(path)
@@ -0,0 +1,211 @@
+import logging
+import sqlite3
+import threading
+import time
+from queue import Queue, Empty
+
+from pipeline.metrics import DB_COMMIT_SECONDS, DB_ERRORS, DB_INVALID_READS, DB_ROWS
+
+from .connection import get_connection, close_connection
+from .queries import INSERT_TAG_READ
+
+logger = logging.getLogger(__name__)
+
+
+# What executemany() raises for a parameter SQLite cannot bind
+BIND_ERRORS = (sqlite3.InterfaceError, sqlite3.ProgrammingError, OverflowError)
+
+
+def now_us():
+    return int(time.time() * 1000000)
+
+
+def tag_row(tag_data):
+    """INSERT_TAG_READ parameters for a pipeline tag dict."""
+    get = tag_data.get
+    return (
+        tag_data["epc"],
+        get("antenna"),
+        get("channel"),
+        get("seen_count"),
+        get("rssi"),
+        get("first_seen"),
+        # Readers without timestamps enabled get the host clock
+        get("last_seen") or now_us(),
+        get("reader"),
+    )
+
+
+def drop_invalid(item, error):
+    """Count and log a tag read (or row) that cannot be stored."""
+    DB_INVALID_READS.inc()
+    logger.error("Dropping a tag read that cannot be stored (%s: %s): %r",
+                 type(error).__name__, error, item)
+
+
+class BatchedTagWriter(object):
+    """Single-connection SQLite writer that commits tag reads in batches.
+
+    Reads are handed over with put()/put_many() and written by a dedicated
+    thread. A batch is committed in one transaction once `batch_size` rows
+    are pending or `flush_interval` seconds have passed since the first
+    pending row, whichever comes first. close() always flushes what is left.
+    At most `max_pending` reads wait in the queue; past that, put() waits
+    for the writer, so a slow disk holds up the producer instead of
+    growing memory.
+    """
+
+    # Turns what put() is given into INSERT_TAG_READ parameters
+    to_row = staticmethod(tag_row)
+
+    def __init__(self, db_path=None, batch_size=500, flush_interval=0.5,
+                 synchronous="NORMAL", max_pending=100000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+
+        self._queue = Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Statistics, only written by the writer thread
+        self.rows_written = 0
+        self.commits = 0
+        self.commit_time_total = 0.0
+        self.commit_time_max = 0.0
+        self.started_at = None
+
+    # -------- PRODUCER SIDE -------- #
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run,
+                                        name="tag-db-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, tag_data):
+        self._queue.put(tag_data)
+
+    def put_many(self, tags):
+        for tag_data in tags:
+            self._queue.put(tag_data)
+
+    def close(self, timeout=None):
+        """Stop the writer thread after flushing every pending read."""
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # -------- WRITER THREAD -------- #
+    def _connect(self):
+        conn = get_connection(self.db_path)
+        conn.execute("PRAGMA synchronous=%s" % self.synchronous)
+        return conn
+
+    def _commit(self, conn, rows):
+        start = time.perf_counter()
+        with conn:
+            conn.executemany(INSERT_TAG_READ, rows)
+        elapsed = time.perf_counter() - start
+        DB_COMMIT_SECONDS.observe(elapsed)
+        DB_ROWS.inc(len(rows))
+
+        self.rows_written += len(rows)
+        self.commits += 1
+        self.commit_time_total += elapsed
+        if elapsed > self.commit_time_max:
+            self.commit_time_max = elapsed
+
+    def _commit_each(self, conn, rows):
+        for row in rows:
+            try:
+                self._commit(conn, [row])
+            except BIND_ERRORS as e:
+                drop_invalid(row, e)
+            except sqlite3.Error:
+                DB_ERRORS.inc()
+                logger.exception("Failed to write a tag read")
+
+    def _add_row(self, pending, tag_data):
+        """Append tag_data's row to `pending`; False if it has none."""
+        try:
+            pending.append(self.to_row(tag_data))
+            return True
+        except Exception as e:
+            # One malformed read must not stop the thread, and every later
+            # read with it
+            drop_invalid(tag_data, e)
+            return False
+
+    def _run(self):
+        conn = self._connect()
+        pending = []
+        deadline = None
+        try:
+            while True:
+                timeout = self.flush_interval
+                if deadline is not None:
+                    timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    tag_data = self._queue.get(timeout=timeout)
+                except Empty:
+                    pass
+                else:
+                    if self._add_row(pending, tag_data) and deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                stopping = self._stop.is_set()
+                if stopping:
+                    # Take everything that was queued before close()
+                    while True:
+                        try:
+                            tag_data = self._queue.get_nowait()
+                        except Empty:
+                            break
+                        self._add_row(pending, tag_data)
+
+                if pending and (stopping or len(pending) >= self.batch_size
+                                or time.monotonic() >= deadline):
+                    try:
+                        self._commit(conn, pending)
+                    except BIND_ERRORS:
+                        # A value SQLite cannot store: write the rows one
+                        # by one, so that only the bad ones are lost
+                        self._commit_each(conn, pending)
+                    except sqlite3.Error:
+                        DB_ERRORS.inc(len(pending))
+                        logger.exception("Failed to write %d tag reads", len(pending))
+                    pending = []
+                    deadline = None
+
+                if stopping:
+                    break
+        finally:
+            close_connection(self.db_path)
+
+    # -------- REPORTING -------- #
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "rows": self.rows_written,
+            "commits": self.commits,
+            "rows_per_s": self.rows_written / elapsed if elapsed else 0.0,
+            # Rows/s the disk sustained while committing, ignoring idle time
+            "write_rows_per_s": (self.rows_written / self.commit_time_total
+                                 if self.commit_time_total else 0.0),
+            "avg_commit_ms": (self.commit_time_total / self.commits * 1000.0
+                              if self.commits else 0.0),
+            "max_commit_ms": self.commit_time_max * 1000.0,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return ("{rows} rows in {commits} commits | {rows_per_s:.1f} rows/s"
+                " ({write_rows_per_s:.0f} rows/s while writing) |"
+                " commit avg {avg_commit_ms:.2f} ms, max {max_commit_ms:.2f} ms"
+                ).format(**s)
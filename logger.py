@@ -1,11 +1,20 @@
 from __future__ import print_function, unicode_literals
+import argparse
 import csv
 import datetime
-import tkinter as tk
-from tkinter import messagebox, filedialog
-from sllurp.llrp import LLRPReaderConfig, LLRPReaderClient
+import os
+import signal
+import sys
+import threading
+import time
+from queue import Queue
+from sllurp.llrp import LLRP_DEFAULT_PORT, LLRPReaderConfig, LLRPReaderClient
 from sllurp.log import get_logger
 
+from pipeline.consumer import drain_batch
+from pipeline.reporting import REPORT_AUTO, REPORT_MODES, AdaptiveReporting, ReportProfile
+from pipeline.startup import parse_args_with_config, start_readers
+
 
 numTags = 0
 logger = get_logger(__name__)
@@ -13,19 +22,37 @@ csvLogger = None
 
 
 class CsvLogger(object):
-    def __init__(self, filehandle, epc=None, reader_timestamp=False):
-        self.rows = []
+    """Streams tag reads to CSV from a background writer thread.
+
+    Rows go through a bounded queue (`buffer_rows`), so memory stays flat no
+    matter how long the session runs; a full queue makes tag_cb wait for the
+    writer. The file is flushed every `flush_interval` seconds. With
+    `roll_hourly`, a new file (named after the original with a -YYYYmmdd-HH
+    suffix) is started every hour, each with its own header.
+    """
+    HEADER = ('timestamp', 'reader', 'antenna', 'rssi', 'epc')
+
+    def __init__(self, filehandle, epc=None, reader_timestamp=False,
+                 buffer_rows=10000, flush_interval=1.0, roll_hourly=False):
         self.filehandle = filehandle
         self.num_tags = 0
-        self.epc = epc
+        self.num_rows = 0
+        self.epc = epc.lower() if epc else None
         self.reader_timestamp = reader_timestamp
+        self.flush_interval = flush_interval
+        self.roll_hourly = roll_hourly
+        self._queue = Queue(maxsize=buffer_rows)
+        self._hour = None
+        self._writer = threading.Thread(target=self._write_rows,
+                                        name='csv-writer', daemon=True)
+        self._writer.start()
 
     def tag_cb(self, reader, tags):
         host, port = reader.get_peername()
         reader = '{}:{}'.format(host, port)
         logger.info('RO_ACCESS_REPORT from %s', reader)
         for tag in tags:
-            epc = tag['EPC']
+            epc = tag['EPC'].decode('ascii')
             if self.epc is not None and epc != self.epc:
                 continue
             if self.reader_timestamp:
@@ -35,14 +62,55 @@ class CsvLogger(object):
                              datetime.datetime(1970, 1, 1)).total_seconds()
             antenna = tag['AntennaID']
             rssi = tag['PeakRSSI']
-            self.rows.append((timestamp, reader, antenna, rssi, epc))
+            self._queue.put((timestamp, reader, antenna, rssi, epc))
             self.num_tags += tag['TagSeenCount']
 
+    def _roll_path(self, hour):
+        root, ext = os.path.splitext(self._base_path)
+        return '{}-{}{}'.format(root, hour, ext)
+
+    def _open_writer(self):
+        """Return a csv writer for the current file, rolling it if needed."""
+        if self.roll_hourly:
+            hour = datetime.datetime.now().strftime('%Y%m%d-%H')
+            if hour != self._hour:
+                if self._hour is not None:
+                    self.filehandle.flush()
+                    self.filehandle.close()
+                    self.filehandle = open(self._roll_path(hour), 'w', newline='')
+                    logger.info('Rolled CSV log to %s', self.filehandle.name)
+                self._hour = hour
+                self._csv = None
+        if self._csv is None:
+            self._csv = csv.writer(self.filehandle, dialect='excel')
+            if self.filehandle.tell() == 0:
+                self._csv.writerow(self.HEADER)
+        return self._csv
+
+    def _write_rows(self):
+        self._csv = None
+        self._base_path = getattr(self.filehandle, 'name', 'tags.csv')
+        last_flush = time.monotonic()
+        done = False
+        while not done:
+            rows = drain_batch(self._queue, 1000, timeout=self.flush_interval)
+            if rows and rows[-1] is None:
+                rows.pop()
+                done = True
+            if rows:
+                self._open_writer().writerows(rows)
+                self.num_rows += len(rows)
+            if done or time.monotonic() - last_flush >= self.flush_interval:
+                self.filehandle.flush()
+                last_flush = time.monotonic()
+
     def flush(self):
-        logger.info('Writing %d rows...', len(self.rows))
-        wri = csv.writer(self.filehandle, dialect='excel')
-        wri.writerow(('timestamp', 'reader', 'antenna', 'rssi', 'epc'))
-        wri.writerows(self.rows)
+        """Write out every queued row and stop the writer thread."""
+        if not self._writer.is_alive():
+            return
+        self._queue.put(None)
+        self._writer.join()
+        logger.info('Wrote %d rows', self.num_rows)
 
 
 def finish_cb(reader):
@@ -103,8 +171,14 @@ def main(args):
         impinj_reports=False
     )
 
+    # None keeps the reader's default report trigger (the GUI sets none)
+    report_profile = getattr(args, 'report_profile', None)
+    connect_timeout = getattr(args, 'connect_timeout', 5.0)
+    ready_timeout = getattr(args, 'ready_timeout', 30.0)
+
     csvLogger = CsvLogger(args.outfile, epc=args.epc,
-                          reader_timestamp=args.reader_timestamp)
+                          reader_timestamp=args.reader_timestamp,
+                          roll_hourly=args.roll_hourly)
 
     reader_clients = []
     for host in args.host:
@@ -115,45 +189,51 @@ def main(args):
             port = args.port
 
         config = LLRPReaderConfig(factory_args)
-        reader = LLRPReaderClient(host, port, config)
+        if report_profile is not None:
+            report_profile.apply(config)
+        reader = LLRPReaderClient(host, port, config, timeout=connect_timeout)
         reader.add_disconnected_callback(finish_cb)
         reader.add_tag_report_callback(csvLogger.tag_cb)
+        if report_profile is not None and report_profile.mode == REPORT_AUTO:
+            adaptive = AdaptiveReporting(reader, report_profile)
+            reader.add_tag_report_callback(
+                lambda _reader, reports, adaptive=adaptive: adaptive.observe(len(reports)))
         reader_clients.append(reader)
 
+    # The CSV is flushed and closed however main() ends, even when Ctrl-C
+    # or a service stop (SIGTERM) arrives while the readers are starting
     try:
-        for reader in reader_clients:
+        # All readers connect at once; a failed one is reported and left out
+        start = time.monotonic()
+        startups = start_readers(reader_clients, ready_timeout=ready_timeout)
+        logger.info('Startup of %d reader(s) took %.3fs:',
+                    len(startups), time.monotonic() - start)
+        for startup in startups:
+            logger.info('  %s', startup)
+            if not startup.ok:
+                logger.error('Reader %s failed to start: %s', startup.name, startup.error)
+        reader_clients = [startup.reader for startup in startups if startup.ok]
+
+        while True:
             try:
-                reader.connect()
-            except Exception as e:
-                if "Impinj" in str(e) or "ERROR_MESSAGE" in str(e):
-                    logger.warning("Ignoring vendor extension error: %s", e)
-                else:
-                    raise  # Re-raise if it's another issue
-    except Exception as e:
-        logger.error("Reader connection failed: %s", e)
-        for reader in reader_clients:
-            reader.disconnect()
-
-    while True:
-        try:
-            # Join all threads using a timeout, so it doesn't block
-            # Filter out threads which have been joined or are None
-            alive_readers = [reader for reader in reader_clients if reader.is_alive()]
-            if not alive_readers:
-                break
-            for reader in alive_readers:
-                reader.join(1)
-        except (KeyboardInterrupt, SystemExit):
-            # catch ctrl-C and stop inventory before disconnecting
-            logger.info("Exit detected! Stopping readers...")
-            for reader in reader_clients:
-                try:
-                    reader.disconnect()
-                except:
-                    logger.exception("Error during disconnect. Ignoring...")
-
-    csvLogger.flush()
-    csvLogger.filehandle.close()
+                # Join all threads using a timeout, so it doesn't block
+                # Filter out threads which have been joined or are None
+                alive_readers = [reader for reader in reader_clients if reader.is_alive()]
+                if not alive_readers:
+                    break
+                for reader in alive_readers:
+                    reader.join(1)
+            except (KeyboardInterrupt, SystemExit):
+                # catch ctrl-C and stop inventory before disconnecting
+                logger.info("Exit detected! Stopping readers...")
+                for reader in reader_clients:
+                    try:
+                        reader.disconnect()
+                    except:
+                        logger.exception("Error during disconnect. Ignoring...")
+    finally:
+        csvLogger.flush()
+        csvLogger.filehandle.close()
 
 
 def start_logging():
@@ -166,6 +246,7 @@ def start_logging():
     tx_power = int(tx_power_entry.get())
     epc = epc_entry.get() or None
     reader_timestamp = timestamp_var.get()
+    roll_hourly = roll_hourly_var.get()
     frequencies = []
 
     if not host or not outfile_path:
@@ -186,12 +267,67 @@ def start_logging():
         'tx_power': tx_power,
         'epc': epc,
         'reader_timestamp': reader_timestamp,
+        'roll_hourly': roll_hourly,
         'frequencies': frequencies
     })
 
     main(args)
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Log tag reads from one or more LLRP readers to CSV."
+                    " Without arguments a window asks for the settings.")
+    parser.add_argument("host", nargs="*", help="reader address as host[:port]")
+    parser.add_argument("-p", "--port", type=int, default=LLRP_DEFAULT_PORT)
+    parser.add_argument("-o", "--outfile", help="CSV file to write")
+    parser.add_argument("-a", "--antennas", default="1",
+                        help="comma-separated antenna IDs (default: 1)")
+    parser.add_argument("-X", "--tx-power", type=int, default=0,
+                        help="transmit power table index, 0 = max (default: 0)")
+    parser.add_argument("--epc", help="only log this EPC")
+    parser.add_argument("--reader-timestamp", action="store_true",
+                        help="use the reader's timestamp instead of the host's")
+    parser.add_argument("--roll-hourly", action="store_true",
+                        help="start a new file every hour")
+    parser.add_argument("--frequencies", default="0",
+                        help="comma-separated channel indexes, 0 = automatic")
+    parser.add_argument("--connect-timeout", type=float, default=5.0,
+                        help="seconds to wait for each reader's TCP connect (default: 5)")
+    parser.add_argument("--ready-timeout", type=float, default=30.0,
+                        help="seconds a connected reader gets to start inventory"
+                             " (default: 30)")
+    parser.add_argument("--report-mode", choices=REPORT_MODES,
+                        help="when the readers send tag reports"
+                             " (default: the reader's own setting)")
+    parser.add_argument("--report-n", type=int, default=100,
+                        help="reads per report in n_tags mode (default: 100)")
+    parser.add_argument("--report-timeout-ms", type=int, default=200,
+                        help="longest a read waits for its report to fill (default: 200)")
+    args = parse_args_with_config(parser, argv)
+    if not args.host or not args.outfile:
+        parser.error("a reader host and --outfile are needed")
+    args.report_profile = None
+    if args.report_mode:
+        try:
+            args.report_profile = ReportProfile(args.report_mode, n_tags=args.report_n,
+                                                timeout_ms=args.report_timeout_ms)
+        except ValueError as e:
+            parser.error(str(e))
+    args.antennas = [int(x.strip()) for x in str(args.antennas).split(',')]
+    args.frequencies = [int(x.strip()) for x in str(args.frequencies).split(',')]
+    return args
+
+
+def cli(argv=None):
+    """Headless entry point: settings from the command line or --config."""
+    args = parse_args(argv)
+    # A service stop flushes and disconnects like Ctrl-C does
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    args.outfile = open(args.outfile, 'w', newline='')
+    return main(args)
+
+
 def select_output_file():
     file_path = filedialog.asksaveasfilename(defaultextension=".csv",
                                              filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
@@ -200,43 +336,52 @@ def select_output_file():
         outfile_entry.insert(0, file_path)  # Insert selected file path
 
 
-# GUI Setup
-root = tk.Tk()
-root.title("RFID Tag Logger")
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli())
+
+    # GUI Setup; tkinter is only loaded when there is no command line
+    import tkinter as tk
+    from tkinter import messagebox, filedialog
 
-tk.Label(root, text="Reader Host(s) (comma-separated):").grid(row=0, column=0)
-host_entry = tk.Entry(root)
-host_entry.grid(row=0, column=1)
+    root = tk.Tk()
+    root.title("RFID Tag Logger")
 
-tk.Label(root, text="Port:").grid(row=1, column=0)
-port_entry = tk.Entry(root)
-port_entry.grid(row=1, column=1)
+    tk.Label(root, text="Reader Host(s) (comma-separated):").grid(row=0, column=0)
+    host_entry = tk.Entry(root)
+    host_entry.grid(row=0, column=1)
 
-tk.Label(root, text="Output File:").grid(row=2, column=0)
-outfile_entry = tk.Entry(root)
-outfile_entry.grid(row=2, column=1)
+    tk.Label(root, text="Port:").grid(row=1, column=0)
+    port_entry = tk.Entry(root)
+    port_entry.grid(row=1, column=1)
 
-# Button to select output file
-select_button = tk.Button(root, text="Select File", command=select_output_file)
-select_button.grid(row=2, column=2)
+    tk.Label(root, text="Output File:").grid(row=2, column=0)
+    outfile_entry = tk.Entry(root)
+    outfile_entry.grid(row=2, column=1)
 
-tk.Label(root, text="Antenna IDs (comma-separated):").grid(row=3, column=0)
-antennas_entry = tk.Entry(root)
-antennas_entry.grid(row=3, column=1)
+    # Button to select output file
+    select_button = tk.Button(root, text="Select File", command=select_output_file)
+    select_button.grid(row=2, column=2)
 
-tk.Label(root, text="Transmission Power:").grid(row=4, column=0)
-tx_power_entry = tk.Entry(root)
-tx_power_entry.grid(row=4, column=1)
+    tk.Label(root, text="Antenna IDs (comma-separated):").grid(row=3, column=0)
+    antennas_entry = tk.Entry(root)
+    antennas_entry.grid(row=3, column=1)
 
-tk.Label(root, text="EPC (optional):").grid(row=5, column=0)
-epc_entry = tk.Entry(root)
-epc_entry.grid(row=5, column=1)
+    tk.Label(root, text="Transmission Power:").grid(row=4, column=0)
+    tx_power_entry = tk.Entry(root)
+    tx_power_entry.grid(row=4, column=1)
 
-timestamp_var = tk.BooleanVar()
-tk.Checkbutton(root, text="Use Reader Timestamp", variable=timestamp_var).grid(row=6, columnspan=2)
+    tk.Label(root, text="EPC (optional):").grid(row=5, column=0)
+    epc_entry = tk.Entry(root)
+    epc_entry.grid(row=5, column=1)
 
-start_button = tk.Button(root, text="Start Logging", command=start_logging)
-start_button.grid(row=7, columnspan=2)
+    timestamp_var = tk.BooleanVar()
+    tk.Checkbutton(root, text="Use Reader Timestamp", variable=timestamp_var).grid(row=6, columnspan=2)
+
+    roll_hourly_var = tk.BooleanVar()
+    tk.Checkbutton(root, text="New File Every Hour", variable=roll_hourly_var).grid(row=7, columnspan=2)
+
+    start_button = tk.Button(root, text="Start Logging", command=start_logging)
+    start_button.grid(row=8, columnspan=2)
 
-if __name__ == "__main__":
     root.mainloop()
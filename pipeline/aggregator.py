@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TagState(object):
+    """Everything known about one EPC (or EPC/antenna pair)."""
+    __slots__ = ("epc", "antenna", "channel", "first_seen", "last_seen",
+                 "seen_count", "peak_rssi", "channels", "reader",
+                 "last_update", "last_emit")
+
+    def __init__(self, epc, antenna):
+        self.epc = epc
+        self.antenna = antenna
+        self.channel = None
+        self.first_seen = None
+        self.last_seen = None
+        self.seen_count = 0
+        self.peak_rssi = None
+        self.channels = set()
+        self.reader = None
+        self.last_update = 0.0
+        self.last_emit = None
+
+    def as_tag(self):
+        """Snapshot in the same shape as the dicts on TAG_QUEUE."""
+        return {
+            "epc": self.epc,
+            "antenna": self.antenna,
+            "channel": self.channel,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "seen_count": self.seen_count,
+            "rssi": self.peak_rssi,
+            "channels": sorted(self.channels),
+            "reader": self.reader,
+        }
+
+
+class TagAggregator(object):
+    """Folds repeated reads of the same tag into one TagState per EPC.
+
+    update() returns a snapshot only when the tag is new or when `window`
+    seconds have passed since it was last emitted, so sinks see one row per
+    tag per window instead of every single read. `seen_count` in the
+    snapshot is cumulative since the tag was first seen.
+
+    Memory is bounded: the least recently read tags are evicted once more
+    than `max_tags` are tracked, and tags not read for `ttl` seconds are
+    forgotten (and reported as new if they come back).
+    """
+
+    def __init__(self, window=5.0, by_antenna=False, max_tags=100000, ttl=600.0):
+        self.window = window
+        self.by_antenna = by_antenna
+        self.max_tags = max_tags
+        self.ttl = ttl
+        self._tags = OrderedDict()
+        self._lock = threading.Lock()
+        self.reads_in = 0
+        self.emitted = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._tags)
+
+    def clear(self):
+        with self._lock:
+            self._tags.clear()
+
+    def get(self, epc, antenna=None):
+        return self._tags.get((epc, antenna) if self.by_antenna else epc)
+
+    def update(self, tag, now=None):
+        if now is None:
+            now = time.monotonic()
+        self.reads_in += 1
+
+        antenna = tag.get("antenna")
+        key = (tag["epc"], antenna) if self.by_antenna else tag["epc"]
+        state = self._tags.get(key)
+        if state is None:
+            state = TagState(tag["epc"], antenna)
+            state.first_seen = tag.get("first_seen") or tag.get("last_seen")
+            self._tags[key] = state
+        else:
+            self._tags.move_to_end(key)
+
+        state.antenna = antenna
+        state.last_seen = tag.get("last_seen")
+        state.reader = tag.get("reader")
+        state.seen_count += tag.get("seen_count") or 1
+        channel = tag.get("channel")
+        if channel is not None:
+            state.channel = channel
+            state.channels.add(channel)
+        rssi = tag.get("rssi")
+        if rssi is not None and (state.peak_rssi is None or rssi > state.peak_rssi):
+            state.peak_rssi = rssi
+        state.last_update = now
+
+        self._evict(now)
+
+        if state.last_emit is None or now - state.last_emit >= self.window:
+            state.last_emit = now
+            self.emitted += 1
+            return state.as_tag()
+        return None
+
+    def update_many(self, tags, now=None):
+        """Feed a batch of reads and return the snapshots to send to sinks."""
+        if now is None:
+            now = time.monotonic()
+        update = self.update
+        emitted = []
+        with self._lock:
+            for tag in tags:
+                snapshot = update(tag, now)
+                if snapshot is not None:
+                    emitted.append(snapshot)
+        return emitted
+
+    def _evict(self, now):
+        tags = self._tags
+        while len(tags) > self.max_tags:
+            tags.popitem(last=False)
+            self.evicted += 1
+        # Entries are in least-recently-read order, so stop at the first
+        # one that is still fresh.
+        expire_before = now - self.ttl
+        while tags:
+            oldest = next(iter(tags.values()))
+            if oldest.last_update >= expire_before:
+                break
+            tags.popitem(last=False)
+            self.evicted += 1
+
+    def summary(self):
+        ratio = self.reads_in / self.emitted if self.emitted else 0.0
+        return (f"{len(self._tags)} tags tracked | {self.reads_in} reads in,"
+                f" {self.emitted} emitted ({ratio:.1f}:1) | {self.evicted} evicted")
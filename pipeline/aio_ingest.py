@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import socket
+import struct
+import time
+
+from sllurp.llrp import (
+    LLRP_DEFAULT_PORT,
+    LLRPClient,
+    LLRPMessage,
+    LLRPReaderState,
+)
+from sllurp.llrp_errors import LLRPError, ReaderConfigurationError
+
+from .fastreport import (
+    MAX_MESSAGE_SIZE,
+    RO_ACCESS_REPORT,
+    UnsupportedReport,
+    decode_tag_reports,
+)
+from .metrics import FALLBACK_REPORTS, FAST_REPORTS, REPORTS, TAG_READS
+from .records import tag_from_report
+from .reporting import REPORT_AUTO, AdaptiveReporting
+
+logger = logging.getLogger(__name__)
+
+# LLRP message header: type/version, total length, message id
+MSG_HEADER = struct.Struct("!HII")
+
+
+def parse_host(host, default_port=LLRP_DEFAULT_PORT):
+    """Split "host[:port]" into (host, port)."""
+    if ":" in host:
+        host, port = host.split(":", 1)
+        return host, int(port)
+    return host, default_port
+
+
+class AsyncReaderConnection(object):
+    """One LLRP reader driven from the event loop instead of its own thread.
+
+    sllurp's LLRPClient still runs the protocol state machine (capabilities,
+    config, ROSpec, keepalive acks); this class only owns the socket. Tag
+    reports are put on the shared `reports` queue as (peername, records),
+    records being pipeline tag dicts, and the connection is re-established
+    after `reconnect_delay` when it drops or goes silent for three keepalive
+    intervals. With `fast_decode`, reports are decoded by
+    decode_tag_reports() and only fall back to sllurp when it cannot. An
+    auto `report_profile` retunes the report batching from the read rate;
+    the N it settles on is kept in `config` across reconnects.
+    """
+
+    def __init__(self, host, port, config, reports, timeout=5.0,
+                 reconnect_delay=5.0, fast_decode=False, report_profile=None):
+        self.host = host
+        self.port = port
+        self.peername = "{}:{}".format(host, port)
+        self.config = config
+        self.reports = reports
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.fast_decode = fast_decode
+        self.adaptive = None
+        if report_profile is not None and report_profile.mode == REPORT_AUTO:
+            # observe() runs on the loop, the same thread that reads the
+            # stop responses, as AdaptiveReporting needs
+            self.adaptive = AdaptiveReporting(self, report_profile)
+
+        self.llrp = None
+        self.connects = 0
+        self.reports_received = 0
+        self.last_message_at = None
+        self._writer = None
+        self._stopping = False
+
+    @property
+    def state(self):
+        if self.llrp is None:
+            return LLRPReaderState.STATE_DISCONNECTED
+        return self.llrp.state
+
+    def _idle_timeout(self):
+        if self.config.keepalive_interval:
+            return 3 * self.config.keepalive_interval / 1000.0
+        return None
+
+    async def run(self):
+        while not self._stopping:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                logger.warning("%s: no message within %.0fs, reconnecting",
+                               self.peername, self._idle_timeout() or self.timeout)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                if not self._stopping:
+                    logger.warning("%s: connection error: %s", self.peername, e)
+            except (LLRPError, ReaderConfigurationError):
+                logger.exception("%s: LLRP error", self.peername)
+            finally:
+                self._close()
+            if not self._stopping:
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _session(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._writer = writer
+        self.connects += 1
+        logger.info("%s: connected", self.peername)
+
+        self.llrp = LLRPClient(self.config, transport_tx_write=writer.write)
+        self.llrp.peername = (self.host, self.port)
+        idle_timeout = self._idle_timeout()
+
+        while True:
+            header = await asyncio.wait_for(reader.readexactly(MSG_HEADER.size),
+                                            idle_timeout)
+            type_version, length, _ = MSG_HEADER.unpack(header)
+            if not MSG_HEADER.size <= length <= MAX_MESSAGE_SIZE:
+                # Nothing after this can be framed; start over on a new connection
+                raise LLRPError("invalid message length %d" % length)
+            body = await reader.readexactly(length - MSG_HEADER.size)
+            self.last_message_at = time.monotonic()
+
+            if (self.fast_decode and type_version & 0x3ff == RO_ACCESS_REPORT
+                    and self.llrp.state == LLRPReaderState.STATE_INVENTORYING):
+                try:
+                    records = decode_tag_reports(body, self.peername)
+                except (UnsupportedReport, struct.error):
+                    FALLBACK_REPORTS.inc()
+                else:
+                    FAST_REPORTS.inc()
+                    await self._put_records(records)
+                    continue
+
+            lmsg = LLRPMessage(msgbytes=header + body)
+            if (lmsg.getName() == "RO_ACCESS_REPORT"
+                    and self.llrp.state == LLRPReaderState.STATE_INVENTORYING):
+                tags = lmsg.msgdict["RO_ACCESS_REPORT"]["TagReportData"]
+                await self._put_records([tag_from_report(tag, self.peername)
+                                         for tag in tags])
+            self.llrp.handleMessage(lmsg)
+            await writer.drain()
+
+    async def _put_records(self, records):
+        self.reports_received += 1
+        REPORTS.labels(self.peername).inc()
+        TAG_READS.labels(self.peername).inc(len(records))
+        if self.adaptive is not None:
+            self.adaptive.observe(len(records))
+        # Waiting here when the pipeline is full pushes back on the reader
+        # through TCP instead of growing memory.
+        await self.reports.put((self.peername, records))
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.llrp is not None:
+            self.llrp.state = LLRPReaderState.STATE_DISCONNECTED
+
+    async def stop(self, timeout=2.0):
+        """Ask the reader to delete its ROSpecs, then close the socket."""
+        self._stopping = True
+        if self._writer is None or self.llrp is None:
+            return
+        stopped = asyncio.get_event_loop().create_future()
+
+        def on_stopped(state, is_success, *args):
+            if not stopped.done():
+                stopped.set_result(is_success)
+
+        try:
+            self.llrp.stopPolitely(onCompletion=on_stopped, disconnect=True)
+            await asyncio.wait_for(stopped, timeout)
+        except (asyncio.TimeoutError, OSError):
+            logger.warning("%s: no answer to stop request", self.peername)
+        self._close()
+
+
+class IngestionService(object):
+    """Runs many LLRP reader connections in a single event loop.
+
+    Every reader feeds the same bounded asyncio queue of
+    (peername, tag_records) items; `consumer` is a coroutine function that
+    receives that queue and runs for as long as the service does.
+    """
+
+    def __init__(self, hosts, config_factory, consumer, queue_size=10000,
+                 timeout=5.0, reconnect_delay=5.0, fast_decode=False,
+                 report_profile=None):
+        self.hosts = hosts
+        self.config_factory = config_factory
+        self.consumer = consumer
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.fast_decode = fast_decode
+        self.report_profile = report_profile
+        self.connections = []
+        self.reports = None
+
+    async def run(self):
+        self.reports = asyncio.Queue(maxsize=self.queue_size)
+        for host in self.hosts:
+            host, port = parse_host(host)
+            self.connections.append(AsyncReaderConnection(
+                host, port, self.config_factory(), self.reports,
+                timeout=self.timeout, reconnect_delay=self.reconnect_delay,
+                fast_decode=self.fast_decode, report_profile=self.report_profile))
+
+        tasks = [asyncio.ensure_future(conn.run()) for conn in self.connections]
+        consumer = asyncio.ensure_future(self.consumer(self.reports))
+        try:
+            # Unlike gather(), wait() leaves the tasks running when we are
+            # cancelled, so the readers can still answer the stop requests.
+            done, _ = await asyncio.wait([consumer] + tasks,
+                                         return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            await asyncio.gather(*(conn.stop() for conn in self.connections),
+                                 return_exceptions=True)
+            for task in tasks + [consumer]:
+                task.cancel()
+            await asyncio.gather(*tasks, consumer, return_exceptions=True)
+
+    def status(self):
+        return [
+            {
+                "reader": conn.peername,
+                "state": LLRPReaderState.getStateName(conn.state),
+                "connects": conn.connects,
+                "reports": conn.reports_received,
+            }
+            for conn in self.connections
+        ]
@@ -0,0 +1,155 @@
+"""Console commands and options shared by RFIDReader.py and RFIDReader2.py.
+
+The handlers take the RecentReads / PresenceEngine they report on, so both
+scripts run the same `recent`, `ant`, `where` and `zones` commands on their
+own module state.
+"""
+import time
+
+from .epc import epc_from_hex, epc_hex
+from .reporting import REPORT_MODES, ReportProfile
+from .startup import parse_args_with_config
+
+
+def parse_seconds(words, default=30.0):
+    try:
+        return float(words[0]) if words else default
+    except ValueError:
+        print(f"❌ Not a number of seconds: {words[0]}")
+        return None
+
+
+def format_port(port):
+    reader, antenna = port
+    return f"antenna {antenna}" if reader is None else f"{reader} antenna {antenna}"
+
+
+def format_age(last_seen):
+    return f"{time.time() - last_seen:.1f}s ago"
+
+
+def print_recent(recent, words):
+    seconds = parse_seconds(words)
+    if seconds is None:
+        return
+    ports = recent.overview(seconds)
+    if not ports:
+        print(f"🕒 No reads in the last {seconds:.0f}s.")
+    for port, s in sorted(ports.items(), key=lambda kv: str(kv[0])):
+        print(f"🕒 {format_port(port)}: {s['epcs']} tags, {s['count']} reads"
+              f" in the last {seconds:.0f}s")
+    print(f"🗃️ Recent reads: {recent.format_stats()}")
+
+
+def print_antenna_reads(recent, words):
+    try:
+        antenna = int(words[0])
+    except (IndexError, ValueError):
+        print("❌ Usage: ant <antenna ID> [seconds]")
+        return
+    seconds = parse_seconds(words[1:])
+    if seconds is None:
+        return
+    tags = recent.antenna(antenna, seconds)
+    print(f"📶 Antenna {antenna}: {len(tags)} tags in the last {seconds:.0f}s")
+    for epc, s in sorted(tags.items(), key=lambda kv: -kv[1]["last_seen"]):
+        print(f" - EPC: {epc_hex(epc)} | Reads: {s['count']} | RSSI: {s['rssi']}"
+              f" | Last: {format_age(s['last_seen'])}")
+
+
+def print_where(recent, words):
+    try:
+        epc = epc_from_hex(words[0])
+    except (IndexError, ValueError):
+        print("❌ Usage: where <EPC> [seconds]")
+        return
+    seconds = parse_seconds(words[1:])
+    if seconds is None:
+        return
+    ports = recent.epc(epc, seconds)
+    if not ports:
+        print(f"📍 {epc_hex(epc)} not read in the last {seconds:.0f}s.")
+    for port, s in sorted(ports.items(), key=lambda kv: -kv[1]["last_seen"]):
+        print(f"📍 {epc_hex(epc)} on {format_port(port)}: {s['count']} reads,"
+              f" RSSI {s['rssi']}, last {format_age(s['last_seen'])}")
+
+
+def print_zones(presence):
+    if presence is None:
+        print("🚪 No zones configured (--zones dock=1,2;aisle=3).")
+        return
+    print(f"🚪 {presence.format_stats()}")
+    for zone in presence.zones:
+        epcs = presence.in_zone(zone)
+        shown = ", ".join(epc_hex(epc) for epc in epcs[:10])
+        more = f" (+{len(epcs) - 10} more)" if len(epcs) > 10 else ""
+        print(f" - {zone}: {shown or '-'}{more}")
+
+
+def format_zone_event(event):
+    if event["event"] == "arrive":
+        return (f"🟢 {epc_hex(event['epc'])} arrived in {event['zone']}"
+                f" (antenna {event['antenna']}, RSSI {event['rssi']:.1f})")
+    return (f"🔴 {epc_hex(event['epc'])} left {event['zone']}"
+            f" after {event['dwell']:.1f}s")
+
+
+def format_zone_log(event):
+    return (f"{int(event['time'] * 1000000)}, EPC: {epc_hex(event['epc'])},"
+            f" Zone: {event['zone']}, Event: {event['event']},"
+            f" Antenna: {event['antenna']}, RSSI: {event['rssi']:.1f}\n")
+
+
+def parse_reader_args(parser, argv=None, **defaults):
+    """Add the reader options to `parser` and parse `argv`.
+
+    `defaults` are the calling script's settings, keyed like the options
+    (port, log_format, report_mode, zones, ...). The script adds its own
+    options, --log-file and --headless first; the result carries a
+    ReportProfile as `report_profile` and the parsed --zones.
+    """
+    parser.add_argument("--host", help="reader IP address (prompted for if omitted)")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--log-format", choices=("text", "journal"),
+                        help="text lines, or a binary journal in the --log-file"
+                             " directory (default: %(default)s)")
+    parser.add_argument("--ready-timeout", type=float,
+                        help="seconds to wait for the reader to be configured")
+    parser.add_argument("--no-reconnect", dest="reconnect", action="store_false",
+                        help="exit when the connection drops")
+    parser.add_argument("--keepalive", type=float,
+                        help="seconds between reader keepalives; a connection is"
+                             " dead after three missed ones (default: %(default)s)")
+    parser.add_argument("--no-fast-resume", dest="fast_resume", action="store_false",
+                        help="reset and reconfigure the reader on every reconnect")
+    parser.add_argument("--report-mode", choices=REPORT_MODES,
+                        help="when the reader sends tag reports (default: %(default)s)")
+    parser.add_argument("--report-n", type=int,
+                        help="reads per report in n_tags mode")
+    parser.add_argument("--report-timeout-ms", type=int,
+                        help="longest a read waits for its report to fill")
+    parser.add_argument("--zones",
+                        help="zones to report arrivals and departures for, as"
+                             " name=antenna,antenna;name=antenna (needs NumPy)")
+    parser.add_argument("--zone-enter-rssi", type=float,
+                        help="smoothed dBm a tag must reach to arrive in a zone")
+    parser.add_argument("--zone-exit-rssi", type=float,
+                        help="smoothed dBm a tag must stay at or above to stay")
+    parser.add_argument("--zone-timeout", type=float,
+                        help="seconds without such a read before a tag departs")
+    parser.set_defaults(**defaults)
+    args = parse_args_with_config(parser, argv)
+    if args.headless and not args.host:
+        parser.error("--headless needs --host")
+    try:
+        args.report_profile = ReportProfile(args.report_mode, n_tags=args.report_n,
+                                            timeout_ms=args.report_timeout_ms)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.zones:
+        from .presence import parse_zones
+        try:
+            args.zones = parse_zones(args.zones)
+        except ValueError as e:
+            parser.error(f"--zones: {e}")
+    return args
@@ -0,0 +1,20 @@
+from queue import Empty
+
+
+def drain_batch(queue, max_items=500, timeout=0.2):
+    """Block for the first item of `queue`, then take whatever else is ready.
+
+    Returns up to `max_items` items without waiting for more than the first
+    one, or an empty list if nothing arrived within `timeout` seconds.
+    """
+    try:
+        batch = [queue.get(timeout=timeout)]
+    except Empty:
+        return []
+    get_nowait = queue.get_nowait
+    try:
+        while len(batch) < max_items:
+            batch.append(get_nowait())
+    except Empty:
+        pass
+    return batch
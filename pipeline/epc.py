@@ -0,0 +1,47 @@
+from binascii import hexlify, unhexlify
+
+# EPCs travel through the pipeline as raw bytes (12 bytes for an EPC-96)
+# instead of the 24-character hex string sllurp reports. Repeat reads of the
+# same tag share a single bytes object through the intern table below, keyed
+# by that object itself so a tag keeps nothing else alive.
+#
+# The table is kept in two generations. New and recently read EPCs go into
+# `_recent`; once it holds MAX_INTERNED // 2 of them it becomes `_older` and a
+# fresh one is started. A tag read again while in `_older` moves back, so
+# only the tags not read for a whole generation stop being shared.
+MAX_INTERNED = 500000
+
+_recent = {}
+_older = {}
+
+
+def _intern(epc):
+    """The shared copy of `epc`; callers try `_recent` inline first."""
+    global _recent, _older
+    shared = _older.get(epc, epc)
+    if len(_recent) >= MAX_INTERNED // 2:
+        _older = _recent
+        _recent = {}
+    _recent[shared] = shared
+    return shared
+
+
+def epc_from_report(raw):
+    """Compact EPC from the hex `EPC` field of a sllurp tag report."""
+    epc = unhexlify(raw)
+    return _recent.get(epc) or _intern(epc)
+
+
+def epc_from_bytes(raw):
+    """Compact EPC from bytes taken straight off the wire."""
+    return _recent.get(raw) or _intern(raw)
+
+
+def epc_from_hex(text):
+    """Compact EPC from user input or an exported hex string."""
+    return epc_from_report(text.strip().lower().encode("ascii"))
+
+
+def epc_hex(epc):
+    """Hex text of a compact EPC, for display and export only."""
+    return hexlify(epc).decode("ascii")
@@ -0,0 +1,191 @@
+import logging
+import struct
+
+from sllurp.llrp import LLRPMessage, LLRPReaderClient, LLRPReaderState
+from sllurp.llrp_errors import LLRPError
+
+from .epc import epc_from_bytes
+from .metrics import FALLBACK_REPORTS, FAST_REPORTS, reader_label
+
+logger = logging.getLogger(__name__)
+
+MSG_HEADER = struct.Struct("!HII")
+# Larger "messages" mean the stream is out of step, not a huge report
+MAX_MESSAGE_SIZE = 16 * 1024 ** 2
+TLV_HEADER = struct.Struct("!HH")
+RO_ACCESS_REPORT = 61
+TAG_REPORT_DATA = 240
+EPC_DATA = 241
+EPC_96 = 13
+
+
+class UnsupportedReport(ValueError):
+    """The report holds something the fast path does not decode."""
+
+
+# TV parameters that may appear in TagReportData: type -> (record field or
+# None to skip it, struct). EPC-96 is handled separately.
+_TV_PARAMS = {
+    1: ("antenna", struct.Struct("!H")),          # AntennaID
+    2: ("first_seen", struct.Struct("!Q")),       # FirstSeenTimestampUTC
+    3: (None, struct.Struct("!Q")),               # FirstSeenTimestampUptime
+    4: ("last_seen", struct.Struct("!Q")),        # LastSeenTimestampUTC
+    5: (None, struct.Struct("!Q")),               # LastSeenTimestampUptime
+    6: ("rssi", struct.Struct("!b")),             # PeakRSSI
+    7: ("channel", struct.Struct("!H")),          # ChannelIndex
+    8: ("seen_count", struct.Struct("!H")),       # TagSeenCount
+    9: (None, struct.Struct("!I")),               # ROSpecID
+    10: (None, struct.Struct("!H")),              # InventoryParameterSpecID
+    11: (None, struct.Struct("!H")),              # C1G2CRC
+    12: (None, struct.Struct("!H")),              # C1G2PC
+    14: (None, struct.Struct("!H")),              # SpecIndex
+    16: (None, struct.Struct("!I")),              # AccessSpecID
+    19: (None, struct.Struct("!H")),              # C1G2XPCW1
+    20: (None, struct.Struct("!H")),              # C1G2XPCW2
+}
+_TV_DECODERS = {
+    tv_type: (field, s.unpack_from, 1 + s.size)
+    for tv_type, (field, s) in _TV_PARAMS.items()
+}
+
+
+def decode_tag_reports(body, reader=None):
+    """Pipeline tag records from the body of an RO_ACCESS_REPORT.
+
+    Returns the same dicts tag_from_report() builds from sllurp's decoded
+    reports, without building sllurp's generic parameter dicts first. Raises
+    UnsupportedReport for anything besides plain TagReportData (access spec
+    results, custom parameters, RF survey data...) so the caller can hand
+    the message to sllurp instead.
+    """
+    data = memoryview(body)
+    end = len(data)
+    unpack_tlv = TLV_HEADER.unpack_from
+    tv_decoders = _TV_DECODERS
+    records = []
+    pos = 0
+    while pos < end:
+        param_type, length = unpack_tlv(data, pos)
+        if param_type & 0x8000 or param_type & 0x3ff != TAG_REPORT_DATA or length < 4:
+            raise UnsupportedReport("parameter type %d in report" % (param_type & 0x3ff))
+        tag_end = pos + length
+        if tag_end > end:
+            raise UnsupportedReport("truncated TagReportData")
+        tag = {"epc": None, "channel": None, "antenna": None, "rssi": None,
+               "first_seen": None, "last_seen": None, "seen_count": None,
+               "reader": reader}
+        pos += 4
+        while pos < tag_end:
+            first = data[pos]
+            if first & 0x80:
+                tv_type = first & 0x7f
+                if tv_type == EPC_96:
+                    tag["epc"] = epc_from_bytes(bytes(data[pos + 1:pos + 13]))
+                    pos += 13
+                    continue
+                try:
+                    field, unpack, size = tv_decoders[tv_type]
+                except KeyError:
+                    raise UnsupportedReport("TV parameter type %d" % tv_type)
+                if field is not None:
+                    tag[field] = unpack(data, pos + 1)[0]
+                pos += size
+            else:
+                sub_type, sub_length = unpack_tlv(data, pos)
+                if sub_type & 0x3ff != EPC_DATA or sub_length < 6:
+                    raise UnsupportedReport("parameter type %d in TagReportData"
+                                            % (sub_type & 0x3ff))
+                bits = struct.unpack_from("!H", data, pos + 4)[0]
+                tag["epc"] = epc_from_bytes(bytes(data[pos + 6:pos + 6 + (bits + 7) // 8]))
+                pos += sub_length
+        if pos != tag_end or tag["epc"] is None:
+            raise UnsupportedReport("malformed TagReportData")
+        records.append(tag)
+    return records
+
+
+class FastReportClient(LLRPReaderClient):
+    """LLRPReaderClient that decodes tag reports with decode_tag_reports().
+
+    While inventorying, RO_ACCESS_REPORTs go to the callbacks registered with
+    add_tag_record_callback() as pipeline tag records. Every other message,
+    and any report the fast path cannot decode, takes sllurp's normal route,
+    so tag_report_callbacks still see the reports that fell back. Message
+    callbacks for "RO_ACCESS_REPORT" see every report; only when there are
+    any is a fast-decoded report also decoded by sllurp for them.
+
+    A header whose length cannot be right leaves nothing after it framed:
+    the connection is then dropped as lost, for sllurp's own reconnect or a
+    ReaderSupervisor to start over.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._record_callbacks = []
+        self._buffer = b""
+        self._peer = reader_label(self)
+
+    def add_tag_record_callback(self, cb):
+        if cb not in self._record_callbacks:
+            self._record_callbacks.append(cb)
+
+    def reset_stream(self):
+        """Forget a partial message left over from a dropped connection."""
+        self._buffer = b""
+
+    def raw_data_received(self, data):
+        if self._buffer:
+            data = self._buffer + data
+        view = memoryview(data)
+        pos = 0
+        end = len(data)
+        while end - pos >= MSG_HEADER.size:
+            type_version, length, _ = MSG_HEADER.unpack_from(data, pos)
+            if not MSG_HEADER.size <= length <= MAX_MESSAGE_SIZE:
+                self._buffer = b""
+                # main_loop() takes socket errors for a lost connection
+                raise ConnectionError("%s: invalid message length %d"
+                                      % (self._peer, length))
+            if end - pos < length:
+                break
+            start = pos
+            pos += length
+            if (type_version & 0x3ff == RO_ACCESS_REPORT and self._record_callbacks
+                    and self.llrp.state == LLRPReaderState.STATE_INVENTORYING):
+                try:
+                    records = decode_tag_reports(view[start + MSG_HEADER.size:pos],
+                                                 self._peer)
+                except (UnsupportedReport, struct.error):
+                    FALLBACK_REPORTS.inc()
+                else:
+                    FAST_REPORTS.inc()
+                    if self._llrp_message_callbacks.get("RO_ACCESS_REPORT"):
+                        self._on_report_message(data[start:pos])
+                    self._on_tag_records(records)
+                    continue
+            self._handle_message(data[start:pos])
+        self._buffer = data[pos:]
+
+    def _handle_message(self, message):
+        try:
+            lmsg = LLRPMessage(msgbytes=message)
+        except LLRPError:
+            logger.exception("Failed to decode LLRPMessage")
+            return
+        self._on_llrp_message_received(lmsg)
+        self.llrp.handleMessage(lmsg)
+
+    def _on_report_message(self, message):
+        try:
+            lmsg = LLRPMessage(msgbytes=message)
+        except LLRPError:
+            logger.exception("Failed to decode LLRPMessage")
+            return
+        self._on_llrp_message_received(lmsg)
+
+    def _on_tag_records(self, records):
+        for fn in self._record_callbacks:
+            try:
+                fn(self, records)
+            except Exception:
+                logger.exception("Error in tag record callback. Continuing anyway...")
@@ -0,0 +1,415 @@
+"""Append-only binary journal of tag reads, a compact alternative to the text log.
+
+A journal is a directory of segment files, `reads-YYYYMMDD-NNNNNN.rfj`.
+Each segment is a HEADER followed by fixed-size records, so record i is at
+HEADER.size + i * record_size and a segment can be memory-mapped and
+indexed (or viewed as a NumPy array) without parsing:
+
+    header   magic, version, epc_width, record_size, created (us), sequence, crc32
+    record   kind, epc_len, antenna, channel, rssi, reader code, seen_count,
+             first_seen (us), last_seen (us), epc
+
+Records are written in blocks, one per flush. A block starts with a
+KIND_BLOCK record holding the number of records that follow and their
+CRC32, so checking a block is one zlib call however many reads it holds.
+Readers are named once per segment by a KIND_READER record, and read
+records refer to them by its 1-based code.
+
+Segments are only ever appended to. A crash can leave the last block
+incomplete; readers skip it, and skip any block whose CRC does not match,
+finding the next one at its fixed offset. Missing values are stored as
+sentinels: 0 for antenna, channel, seen_count, first_seen, last_seen and
+reader, MISSING_RSSI for rssi.
+"""
+
+import datetime
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from .epc import epc_hex
+from .metrics import LOG_FLUSH_SECONDS
+from .textlog import FSYNC_ALWAYS, FSYNC_NEVER, FSYNC_POLICIES
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RFJ1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHxxqI4xI")
+SEGMENT_PATTERN = "reads-%s-%06d.rfj"
+EPC_WIDTH = 12          # bytes of an EPC-96; longer EPCs start a wider segment
+MISSING_RSSI = -128
+BLOCK_RECORDS = 4096    # Most records behind one block header
+
+KIND_READ = 0
+KIND_READER = 1
+KIND_BLOCK = 2
+
+CSV_HEADER = ("timestamp", "reader", "antenna", "rssi", "epc")   # logger.py's CSV
+
+
+def record_struct(epc_width):
+    """KIND_READ record."""
+    return struct.Struct("<BBHHbxHIqq%ds" % epc_width)
+
+
+def reader_struct(epc_width):
+    """KIND_READER record: kind, code and the name, NUL padded."""
+    return struct.Struct("<BxH%ds" % (record_struct(epc_width).size - 4))
+
+
+def block_struct(epc_width):
+    """KIND_BLOCK record: kind, number of records that follow, their CRC32."""
+    return struct.Struct("<BxxxII%dx" % (record_struct(epc_width).size - 12))
+
+
+def _header(epc_width, created_us, sequence):
+    record_size = record_struct(epc_width).size
+    head = HEADER.pack(MAGIC, VERSION, epc_width, record_size, created_us, sequence, 0)
+    return head[:-4] + struct.pack("<I", zlib.crc32(head[:-4]))
+
+
+# -------- WRITING -------- #
+class TagJournal(object):
+    """Writes pipeline tag dicts (all keys present) to segments in `directory`.
+
+    Works like TagLogWriter: records are buffered and written as one block
+    once `flush_bytes` are pending or `flush_interval` seconds have passed;
+    call poll() when idle and close() on shutdown. A new segment is started
+    on open, past `max_bytes`, when the day changes (`rotate_daily`) and
+    when an EPC longer than the segment's EPC width comes in.
+    """
+
+    def __init__(self, directory, flush_interval=1.0, flush_bytes=64 * 1024,
+                 max_bytes=None, rotate_daily=True, epc_width=EPC_WIDTH,
+                 fsync=FSYNC_NEVER):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("fsync must be one of %s" % (FSYNC_POLICIES,))
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.fsync = fsync
+        self.records = 0
+
+        self._lock = threading.Lock()
+        self._block = []
+        self._file = None
+        self._path = None
+        self._size = 0
+        self._opened_on = None
+        self._readers = {}
+        self._last_flush = time.monotonic()
+        self._sequence = next_sequence(directory)
+        self._open(epc_width)
+
+    @property
+    def path(self):
+        return self._path
+
+    def _open(self, epc_width):
+        os.makedirs(self.directory, exist_ok=True)
+        self._opened_on = datetime.date.today()
+        self._path = os.path.join(self.directory, SEGMENT_PATTERN % (
+            self._opened_on.strftime("%Y%m%d"), self._sequence))
+        self._file = open(self._path, "xb")
+        self._file.write(_header(epc_width, int(time.time() * 1000000), self._sequence))
+        self._sequence += 1
+        self._size = HEADER.size
+        self._readers = {None: 0}
+        self.epc_width = epc_width
+        self._record = record_struct(epc_width)
+        self._reader_record = reader_struct(epc_width)
+        self._block_record = block_struct(epc_width)
+
+    # -------- WRITING -------- #
+    def write_tags(self, tags):
+        with self._lock:
+            if self._file is None:
+                return
+            pack = self._record.pack
+            append = self._block.append
+            readers = self._readers
+            width = self.epc_width
+            for tag in tags:
+                epc = tag["epc"]
+                epc_len = len(epc)
+                if epc_len > width:
+                    self._roll(epc_len)
+                    pack, append, readers, width = (self._record.pack, self._block.append,
+                                                    self._readers, self.epc_width)
+                reader = tag["reader"]
+                code = readers.get(reader)
+                if code is None:
+                    code = self._declare_reader(reader)
+                rssi = tag["rssi"]
+                append(pack(KIND_READ, epc_len, tag["antenna"] or 0, tag["channel"] or 0,
+                            MISSING_RSSI if rssi is None else rssi, code,
+                            tag["seen_count"] or 0, tag["first_seen"] or 0,
+                            tag["last_seen"] or 0, epc))
+            self.records += len(tags)
+            if (self.fsync == FSYNC_ALWAYS
+                    or len(self._block) * self._record.size >= self.flush_bytes
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def _declare_reader(self, reader):
+        """Code of a reader not seen yet in this segment (0 if it cannot be named)."""
+        name = reader.encode("utf-8")
+        if len(name) > self._reader_record.size - 4 or len(self._readers) > 0xFFFF:
+            logger.warning("Cannot name reader %r in the journal; stored as unknown", reader)
+            self._readers[reader] = 0
+            return 0
+        code = self._readers[reader] = len(self._readers)
+        self._block.append(self._reader_record.pack(KIND_READER, code, name))
+        return code
+
+    def poll(self):
+        """Flush if the time threshold has passed. Call this when idle."""
+        with self._lock:
+            if self._file is None:
+                return
+            if self._block and time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+            elif self.rotate_daily and self._opened_on != datetime.date.today():
+                self._roll(self.epc_width)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            self._file.close()
+            self._file = None
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if self._file is None:
+            return
+        start = time.perf_counter()
+        wrote = self._write_block()
+        self._file.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._file.fileno())
+        if wrote:
+            LOG_FLUSH_SECONDS.observe(time.perf_counter() - start)
+        if ((self.max_bytes and self._size >= self.max_bytes)
+                or (self.rotate_daily and self._opened_on != datetime.date.today())):
+            self._roll(self.epc_width)
+
+    def _write_block(self):
+        if not self._block:
+            return False
+        # Bounded blocks, so a damaged record costs at most BLOCK_RECORDS reads
+        for i in range(0, len(self._block), BLOCK_RECORDS):
+            data = b"".join(self._block[i:i + BLOCK_RECORDS])
+            self._file.write(self._block_record.pack(
+                KIND_BLOCK, len(data) // self._record.size, zlib.crc32(data)))
+            self._file.write(data)
+            self._size += self._record.size + len(data)
+        self._block = []
+        return True
+
+    def _roll(self, epc_width):
+        """Finish the current segment and start one at least `epc_width` wide."""
+        self._write_block()
+        self._file.close()
+        logger.info("Closed journal segment %s", self._path)
+        self._open(max(epc_width, EPC_WIDTH))
+
+    def stats(self):
+        return {"records": self.records, "path": self._path, "segment_bytes": self._size}
+
+
+def next_sequence(directory):
+    """Sequence number for the next segment in `directory`."""
+    sequences = [int(name[-10:-4]) for name in segment_names(directory)]
+    return max(sequences) + 1 if sequences else 0
+
+
+def segment_names(directory, day=None):
+    """Segment file names in `directory`, oldest first; only `day`'s if given."""
+    if not os.path.isdir(directory):
+        return []
+    prefix = "reads-" + (day.strftime("%Y%m%d") if day is not None else "")
+    names = [n for n in os.listdir(directory) if n.startswith(prefix) and n.endswith(".rfj")]
+    return sorted(names, key=lambda n: int(n[-10:-4]))
+
+
+# -------- READING -------- #
+class JournalSegment(object):
+    """One segment, memory-mapped read-only.
+
+    len() is the number of complete record slots. Iterating yields tag
+    dicts in the pipeline's format, block by block; blocks that are
+    incomplete or fail their CRC are skipped and their slots counted in
+    `skipped`. array() views the slots as a NumPy structured array without
+    copying.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError("%s: not a journal segment" % path)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.epc_width, self.record_size, self.created_us,
+         self.sequence, crc) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("%s: not a journal segment" % path)
+        if zlib.crc32(self._map[:HEADER.size - 4]) != crc:
+            raise ValueError("%s: corrupt segment header" % path)
+        if version != VERSION:
+            raise ValueError("%s: journal version %d, expected %d" % (path, version, VERSION))
+        self.record = record_struct(self.epc_width)
+        if self.record.size != self.record_size:
+            raise ValueError("%s: record size %d, expected %d"
+                             % (path, self.record_size, self.record.size))
+        self.torn_bytes = (size - HEADER.size) % self.record_size
+        self.records = (size - HEADER.size) // self.record_size
+        self.skipped = 0
+
+    def __len__(self):
+        return self.records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # Arrays from array() still use the map; it goes with them
+            pass
+
+    def _slots(self, first, count):
+        size = self.record_size
+        return memoryview(self._map)[HEADER.size + first * size:
+                                     HEADER.size + (first + count) * size]
+
+    def blocks(self, verify=True):
+        """(first slot, slots) of every readable block, in order."""
+        block = block_struct(self.epc_width)
+        records = self.records
+        slot = 0
+        while slot < records:
+            kind, count, crc = block.unpack_from(self._map, HEADER.size + slot * self.record_size)
+            if kind == KIND_BLOCK and slot + 1 + count <= records:
+                if not verify:
+                    yield slot + 1, count
+                    slot += 1 + count
+                    continue
+                data = self._slots(slot + 1, count)
+                valid = zlib.crc32(data) == crc
+                data.release()
+                if valid:
+                    yield slot + 1, count
+                    slot += 1 + count
+                    continue
+            # Damaged or torn: carry on from the next slot that starts a block
+            if not self.skipped:
+                logger.warning("%s: skipping unreadable block at slot %d of %d",
+                               self.path, slot, records)
+            start = slot
+            slot += 1
+            while (slot < records
+                   and self._map[HEADER.size + slot * self.record_size] != KIND_BLOCK):
+                slot += 1
+            self.skipped += slot - start
+
+    def __iter__(self):
+        return self.iter_tags()
+
+    def iter_tags(self, verify=True):
+        """Tag dicts of every read record; `verify` checks the block CRCs."""
+        size = self.record_size
+        reader_record = reader_struct(self.epc_width)
+        iter_unpack = self.record.iter_unpack
+        readers = {0: None}
+        for first, count in self.blocks(verify):
+            view = self._slots(first, count)
+            try:
+                for i, (kind, epc_len, antenna, channel, rssi, reader, seen_count,
+                        first_seen, last_seen, epc) in enumerate(iter_unpack(view)):
+                    if kind != KIND_READ:
+                        if kind == KIND_READER:
+                            _, code, name = reader_record.unpack_from(view, i * size)
+                            readers[code] = name.rstrip(b"\0").decode("utf-8")
+                        continue
+                    yield {
+                        "epc": epc[:epc_len],
+                        "antenna": antenna or None,
+                        "channel": channel or None,
+                        "rssi": None if rssi == MISSING_RSSI else rssi,
+                        "seen_count": seen_count or None,
+                        "first_seen": first_seen or None,
+                        "last_seen": last_seen or None,
+                        "reader": readers.get(reader),
+                    }
+            finally:
+                view.release()
+
+    def readers(self):
+        """Reader code -> name, from the segment's declarations."""
+        names = {}
+        reader_record = reader_struct(self.epc_width)
+        for slot in range(self.records):
+            offset = HEADER.size + slot * self.record_size
+            if self._map[offset] == KIND_READER:
+                _, code, name = reader_record.unpack_from(self._map, offset)
+                names[code] = name.rstrip(b"\0").decode("utf-8")
+        return names
+
+    def array(self):
+        """The record slots as a NumPy structured array backed by the map.
+
+        Block headers and reader declarations are slots too: select reads
+        with `a[a["kind"] == KIND_READ]`. CRCs are not checked. Needs NumPy.
+        """
+        import numpy as np
+
+        dtype = np.dtype([
+            ("kind", "u1"), ("epc_len", "u1"), ("antenna", "<u2"), ("channel", "<u2"),
+            ("rssi", "i1"), ("pad", "u1"), ("reader", "<u2"), ("seen_count", "<u4"),
+            ("first_seen", "<i8"), ("last_seen", "<i8"), ("epc", "V%d" % self.epc_width)])
+        return np.frombuffer(self._map, dtype, self.records, HEADER.size)
+
+
+def iter_journal(directory, day=None, verify=True):
+    """Tag dicts from every segment in `directory` (of `day`), in write order."""
+    for name in segment_names(directory, day):
+        try:
+            segment = JournalSegment(os.path.join(directory, name))
+        except ValueError as e:
+            logger.warning("Skipping %s", e)
+            continue
+        with segment:
+            for tag in segment.iter_tags(verify):
+                yield tag
+
+
+# -------- CONVERSION -------- #
+def text_line(tag):
+    """A read as the line RFIDReader writes to tag_reads.txt."""
+    return (f"{tag['last_seen']}, EPC: {epc_hex(tag['epc'])}, Antenna: {tag['antenna']},"
+            f" Channel: {tag['channel']}, SeenCount: {tag['seen_count']}\n")
+
+
+def csv_row(tag):
+    """A read as a row of logger.py's CSV (CSV_HEADER columns)."""
+    last_seen = tag["last_seen"]
+    return (last_seen / 1e6 if last_seen is not None else "", tag["reader"] or "",
+            tag["antenna"], tag["rssi"], epc_hex(tag["epc"]))
@@ -0,0 +1,305 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers a sub-millisecond callback up to a multi-second fsync stall
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    pairs.extend('%s="%s"' % (n, v) for n, v in extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return "%d" % value
+    return repr(value)
+
+
+class Registry(object):
+    """The set of metrics rendered on /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Metric %s already registered" % metric.name)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            lines.append("# HELP %s %s" % (metric.name, metric.documentation))
+            lines.append("# TYPE %s %s" % (metric.name, metric.type))
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+        if not self.labelnames:
+            # Unlabelled metrics are exported as 0 before their first update
+            self.labels()
+
+    def labels(self, *values, **kwargs):
+        """The child metric for one combination of label values."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("%s takes labels %s" % (self.name, self.labelnames))
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        """The unlabelled child, for metrics without labels."""
+        return self.labels()
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            for suffix, extra, value in child.samples():
+                yield "%s%s%s %s" % (self.name, suffix,
+                                     _format_labels(self.labelnames, values, extra),
+                                     _format_value(value))
+
+
+class _CounterChild(object):
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield "", (), self.value
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. reads received or parse errors."""
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild(object):
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from `function()` at scrape time instead."""
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                yield "", (), self.function()
+            except Exception:
+                logger.exception("Gauge callback failed")
+            return
+        yield "", (), self.value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. queue depth."""
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+class _HistogramChild(object):
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            yield "_bucket", (("le", _format_value(float(bound))),), cumulative
+        yield "_sum", (), total
+        yield "_count", (), count
+
+
+class Histogram(_Metric):
+    """Latency distribution in fixed buckets (seconds)."""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+def reader_label(reader):
+    """"host:port" of an LLRPReaderClient, for the `reader` label."""
+    host, port = reader.get_peername()
+    return "%s:%s" % (host, port)
+
+
+_reader_counters = {}
+
+
+def reader_counters(reader):
+    """(reports, tag reads) counters of one reader, cached for the hot path."""
+    counters = _reader_counters.get(reader)
+    if counters is None:
+        peer = reader_label(reader)
+        counters = _reader_counters[reader] = (REPORTS.labels(peer),
+                                               TAG_READS.labels(peer))
+    return counters
+
+
+# -------- HTTP ENDPOINT -------- #
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the console
+        pass
+
+
+def start_metrics_server(port=9108, host="127.0.0.1", registry=REGISTRY):
+    """Serve /metrics from a daemon thread; returns the server."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http",
+                     daemon=True).start()
+    logger.info("Metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+# -------- PIPELINE METRICS -------- #
+REPORTS = Counter("rfid_reports_total",
+                  "RO_ACCESS_REPORTs received", ["reader"])
+TAG_READS = Counter("rfid_tag_reads_total",
+                    "Tag reads received in reports", ["reader"])
+PARSE_ERRORS = Counter("rfid_tag_parse_errors_total",
+                       "Tag reads that could not be parsed and were dropped")
+CALLBACK_SECONDS = Histogram("rfid_report_callback_seconds",
+                             "Time spent in the tag report callback")
+QUEUE_DEPTH = Gauge("rfid_tag_queue_depth",
+                    "Tag reads waiting for the consumer thread")
+BATCH_SECONDS = Histogram("rfid_batch_seconds",
+                          "Time to hand one consumer batch to every sink")
+TAGS_EMITTED = Counter("rfid_tags_emitted_total",
+                       "Tags passed to the sinks after deduplication")
+PROCESSING_ERRORS = Counter("rfid_processing_errors_total",
+                            "Batches the consumer thread failed to handle")
+LOG_FLUSH_SECONDS = Histogram("rfid_log_flush_seconds",
+                              "Time to write and flush buffered tag log lines")
+DB_COMMIT_SECONDS = Histogram("rfid_db_commit_seconds",
+                              "Time to commit one batch of tag reads to SQLite")
+DB_ROWS = Counter("rfid_db_rows_written_total",
+                  "Tag reads committed to SQLite")
+DB_ERRORS = Counter("rfid_db_write_errors_total",
+                    "Tag reads lost because their batch failed to commit")
+DB_INVALID_READS = Counter("rfid_db_invalid_reads_total",
+                           "Tag reads dropped because no database row could be made of them")
+FAST_REPORTS = Counter("rfid_fast_decoded_reports_total",
+                       "RO_ACCESS_REPORTs decoded by the fast path")
+FALLBACK_REPORTS = Counter("rfid_fallback_decoded_reports_total",
+                           "RO_ACCESS_REPORTs the fast path handed to sllurp")
+QUEUE_DROPPED = Counter("rfid_tag_queue_dropped_total",
+                        "Tag reads dropped by the full ingestion queue", ["policy"])
+QUEUE_SPILLED = Counter("rfid_tag_queue_spilled_total",
+                        "Tag reads the full ingestion queue spilled to disk", ["policy"])
+QUEUE_REPLAYED = Counter("rfid_tag_queue_replayed_total",
+                         "Spilled tag reads read back from disk", ["policy"])
+RECONNECTS = Counter("rfid_reader_reconnects_total",
+                     "Reader connections re-established, by resume path",
+                     ["reader", "resume"])
+BLACKOUT_SECONDS = Histogram("rfid_reader_blackout_seconds",
+                             "Time from the last message before a connection loss"
+                             " to the first tag report after it", ["reader"],
+                             buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                                      60.0, 120.0, 300.0))
@@ -0,0 +1,411 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+ARRIVE = "arrive"
+DEPART = "depart"
+
+MAX_ANTENNA_ID = 0xFFFF   # AntennaID is a u16 in LLRP
+# Batches smaller than this are folded in read by read: below it, setting
+# up the NumPy arrays costs more than it saves (see benchmarks/presence.py)
+VECTOR_MIN_BATCH = 256
+
+
+def parse_zones(spec):
+    """{zone: [antenna IDs]} from "dock=1,2;aisle=3" (or a dict, from a
+    config file)."""
+    if isinstance(spec, dict):
+        return {str(name): [int(a) for a in antennas] for name, antennas in spec.items()}
+    zones = {}
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        name, sep, antennas = part.partition("=")
+        if not sep or not name.strip():
+            raise ValueError("zone %r is not name=antenna,antenna..." % part.strip())
+        zones[name.strip()] = [int(a) for a in antennas.split(",") if a.strip()]
+    return zones
+
+
+def _per_antenna(value, antennas, what):
+    """Per-column thresholds from a number or an {antenna: value} dict."""
+    if isinstance(value, dict):
+        missing = [a for a in antennas if a not in value]
+        if missing:
+            raise ValueError("no %s for antenna(s) %s" % (what, missing))
+        return np.array([value[a] for a in antennas], dtype=np.float64)
+    return np.full(len(antennas), value, dtype=np.float64)
+
+
+class PresenceEngine(object):
+    """Turns raw reads into arrival and departure events per tag per zone.
+
+    A zone is a set of antennas; an antenna belongs to one zone. For every
+    tag and antenna the engine keeps an exponentially smoothed RSSI (weight
+    `alpha` for each new read). A tag arrives in a zone when its smoothed
+    RSSI on one of the zone's antennas reaches that antenna's `enter_rssi`,
+    and stays in it while reads keep its smoothed RSSI at or above
+    `exit_rssi` (hysteresis: a tag hovering at the edge does not flap). It
+    departs once no antenna of the zone has had such a read for `timeout`
+    seconds. Thresholds are dBm, one number for all antennas or an
+    {antenna: dBm} dict; reads without a PeakRSSI count as reads at the
+    enter threshold, so presence then only depends on reads and timeouts.
+
+    State lives in NumPy arrays (one row per tag, one column per zone
+    antenna) and update() processes a whole batch of reads at once: the
+    smoothing of repeated reads within a batch is folded into one weighted
+    sum per tag and antenna, exactly as if they had been applied one by
+    one; the thresholds are then checked once per batch, against the
+    smoothed value after it. Batches under `vector_min_batch` reads take a
+    plain Python loop over the same state instead, under the same rules.
+    Only transitions come out, as event dicts:
+
+        {"event": "arrive"/"depart", "epc", "zone", "antenna", "rssi", "time"}
+
+    with the antenna and smoothed RSSI that made the tag arrive, or its
+    best antenna when it departed. Departures also carry `last_seen` (the
+    last read that kept the tag in the zone) and `dwell` seconds.
+
+    Departures are found by a sweep that update() runs every
+    `sweep_interval` seconds; call poll() when no reads are coming in.
+    Tags that are in no zone and have not been read for `forget_after`
+    seconds free their row; at most `max_tags` rows exist, and reads of
+    further new tags are counted in `dropped`.
+
+    Times are time.time() seconds unless `now` is given.
+    """
+
+    def __init__(self, zones, enter_rssi=-65.0, exit_rssi=-72.0, alpha=0.3,
+                 timeout=3.0, sweep_interval=0.25, forget_after=60.0,
+                 max_tags=100000, initial_tags=1024, vector_min_batch=VECTOR_MIN_BATCH):
+        if not zones:
+            raise ValueError("no zones")
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.zones = list(zones)
+        self.alpha = alpha
+        self.timeout = timeout
+        self.sweep_interval = sweep_interval
+        self.forget_after = forget_after
+        self.max_tags = max_tags
+        self.vector_min_batch = vector_min_batch
+
+        self.antennas = []
+        zone_of_column = []
+        for z, name in enumerate(self.zones):
+            for antenna in zones[name]:
+                if antenna in self.antennas:
+                    raise ValueError("antenna %d is in more than one zone" % antenna)
+                self.antennas.append(antenna)
+                zone_of_column.append(z)
+        if not self.antennas:
+            raise ValueError("the zones have no antennas")
+        self._zone_of_column = np.array(zone_of_column, dtype=np.intp)
+        # AntennaID -> column, -1 for antennas outside every zone
+        self._column_of = np.full(MAX_ANTENNA_ID + 1, -1, dtype=np.intp)
+        self._column_of[self.antennas] = np.arange(len(self.antennas))
+        self._columns = {antenna: c for c, antenna in enumerate(self.antennas)}
+        self._enter = _per_antenna(enter_rssi, self.antennas, "enter_rssi")
+        self._exit = _per_antenna(exit_rssi, self.antennas, "exit_rssi")
+        if np.any(self._exit > self._enter):
+            raise ValueError("exit_rssi must not be above enter_rssi")
+        self._enter_list = self._enter.tolist()
+        self._exit_list = self._exit.tolist()
+        # Columns of each zone, for the departure sweep
+        self._zone_columns = [np.flatnonzero(self._zone_of_column == z)
+                              for z in range(len(self.zones))]
+
+        self._rows = {}          # epc -> row
+        self._epcs = []          # row -> epc (None when free)
+        self._free = []
+        self._allocate(min(initial_tags, max_tags))
+        self.reads = 0
+        self.ignored = 0         # reads on antennas outside every zone
+        self.dropped = 0         # reads of new tags past max_tags
+        self.arrivals = 0
+        self.departures = 0
+        self._last_sweep = None
+        self._lock = threading.Lock()
+
+    # -------- STATE -------- #
+    def _allocate(self, capacity):
+        columns = len(self.antennas)
+        self._ema = np.full((capacity, columns), np.nan)
+        self._last_strong = np.full((capacity, columns), -np.inf)
+        self._last_read = np.full(capacity, -np.inf)
+        self._present = np.zeros((capacity, len(self.zones)), dtype=bool)
+        self._arrived_at = np.zeros((capacity, len(self.zones)))
+        self._epcs = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        old = len(self._epcs)
+        capacity = min(old * 2, self.max_tags)
+        if capacity <= old:
+            return False
+        grow = capacity - old
+        columns = len(self.antennas)
+        self._ema = np.vstack([self._ema, np.full((grow, columns), np.nan)])
+        self._last_strong = np.vstack([self._last_strong,
+                                       np.full((grow, columns), -np.inf)])
+        self._last_read = np.concatenate([self._last_read, np.full(grow, -np.inf)])
+        self._present = np.vstack([self._present,
+                                   np.zeros((grow, len(self.zones)), dtype=bool)])
+        self._arrived_at = np.vstack([self._arrived_at, np.zeros((grow, len(self.zones)))])
+        self._epcs.extend([None] * grow)
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        return True
+
+    def _row(self, epc):
+        row = self._rows.get(epc)
+        if row is None:
+            if not self._free and not self._grow():
+                return -1
+            row = self._free.pop()
+            self._rows[epc] = row
+            self._epcs[row] = epc
+        return row
+
+    def _release(self, rows):
+        self._ema[rows] = np.nan
+        self._last_strong[rows] = -np.inf
+        self._last_read[rows] = -np.inf
+        for row in rows.tolist():
+            del self._rows[self._epcs[row]]
+            self._epcs[row] = None
+            self._free.append(row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    # -------- READS -------- #
+    def update(self, tags, now=None):
+        """Fold a batch of pipeline tag dicts read at `now` into the state;
+        returns the arrival (and due departure) events."""
+        if now is None:
+            now = time.time()
+        n = len(tags)
+        with self._lock:
+            events = []
+            if n and n >= self.vector_min_batch:
+                events = self._update(tags, n, now)
+            elif n:
+                events = self._update_small(tags, n, now)
+            if self._last_sweep is None or now - self._last_sweep >= self.sweep_interval:
+                events.extend(self._sweep(now))
+            return events
+
+    def _update(self, tags, n, now):
+        self.reads += n
+        # The only per-read Python: pulling the fields out of the dicts
+        antennas = np.array([t.get("antenna") or 0 for t in tags], dtype=np.intp)
+        columns = self._column_of[antennas & MAX_ANTENNA_ID]
+        keep = columns >= 0
+        self.ignored += int(n - np.count_nonzero(keep))
+        if not keep.any():
+            return []
+        get_row = self._rows.get
+        rows = np.array([get_row(t["epc"], -1) for t in tags], dtype=np.intp)
+        for i in np.flatnonzero(keep & (rows < 0)).tolist():
+            rows[i] = self._row(tags[i]["epc"])  # New tag (or a repeat of one)
+        known = rows >= 0
+        self.dropped += int(np.count_nonzero(keep & ~known))
+        keep &= known
+        # None -> NaN
+        rssi = np.array([t.get("rssi") for t in tags], dtype=np.float64)
+        rows, columns, rssi = rows[keep], columns[keep], rssi[keep]
+        missing = np.isnan(rssi)
+        rssi[missing] = self._enter[columns[missing]]
+
+        # Group the reads by (row, column), in arrival order
+        width = len(self.antennas)
+        keys = rows * width + columns
+        order = np.argsort(keys, kind="stable")
+        keys, rssi = keys[order], rssi[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        group = np.repeat(np.arange(len(starts)), counts)
+        from_end = np.repeat(starts + counts, counts) - np.arange(len(keys)) - 1
+        g_rows, g_columns = keys[starts] // width, keys[starts] % width
+
+        # ema' = (1-a)^k ema + sum a (1-a)^(k-1-i) x_i, the first read of a
+        # tag on an antenna starting the average at its own value
+        a = self.alpha
+        decay = 1.0 - a
+        weights = a * decay ** from_end
+        old = self._ema[g_rows, g_columns]
+        fresh = np.isnan(old)
+        first = starts[fresh]
+        weights[first] = decay ** from_end[first]
+        ema = np.bincount(group, weights * rssi, minlength=len(starts))
+        ema += np.where(fresh, 0.0, old * decay ** counts)
+        self._ema[g_rows, g_columns] = ema
+        self._last_read[g_rows] = now
+
+        zones = self._zone_of_column[g_columns]
+        present = self._present[g_rows, zones]
+        strong = ema >= np.where(present, self._exit[g_columns], self._enter[g_columns])
+        self._last_strong[g_rows[strong], g_columns[strong]] = now
+
+        arriving = np.flatnonzero(strong & ~present)
+        events = []
+        if len(arriving):
+            # One arrival per tag and zone, from its strongest antenna (the
+            # first listed on a tie)
+            arriving = arriving[np.argsort(-ema[arriving], kind="stable")]
+            pairs = g_rows[arriving] * len(self.zones) + zones[arriving]
+            _, first_of_pair = np.unique(pairs, return_index=True)
+            arriving = arriving[np.sort(first_of_pair)]
+            a_rows, a_zones = g_rows[arriving], zones[arriving]
+            self._present[a_rows, a_zones] = True
+            self._arrived_at[a_rows, a_zones] = now
+            self.arrivals += len(arriving)
+            for row, zone, column, value in zip(a_rows.tolist(), a_zones.tolist(),
+                                                g_columns[arriving].tolist(),
+                                                ema[arriving].tolist()):
+                events.append({"event": ARRIVE, "epc": self._epcs[row],
+                               "zone": self.zones[zone], "antenna": self.antennas[column],
+                               "rssi": value, "time": now})
+        return events
+
+    def _update_small(self, tags, n, now):
+        """_update() read by read, for batches too small to vectorise."""
+        self.reads += n
+        column_of = self._columns
+        enter, exit_ = self._enter_list, self._exit_list
+        get_row = self._rows.get
+        alpha = self.alpha
+        # (row, column) -> smoothed RSSI
+        groups = {}
+        for t in tags:
+            column = column_of.get((t.get("antenna") or 0) & MAX_ANTENNA_ID)
+            if column is None:
+                self.ignored += 1
+                continue
+            epc = t["epc"]
+            row = get_row(epc)
+            if row is None:
+                row = self._row(epc)
+                if row < 0:
+                    self.dropped += 1
+                    continue
+            rssi = t.get("rssi")
+            rssi = enter[column] if rssi is None else float(rssi)
+            key = (row, column)
+            old = groups.get(key)
+            if old is None:
+                old = float(self._ema[row, column])
+            # The first read of a tag on an antenna starts the average
+            groups[key] = rssi if math.isnan(old) else old + alpha * (rssi - old)
+        if not groups:
+            return []
+
+        zone_of = self._zone_of_column
+        candidates = []
+        # Key order, then strongest first, matches _update()'s tie-breaking
+        for (row, column) in sorted(groups):
+            ema = groups[(row, column)]
+            self._ema[row, column] = ema
+            self._last_read[row] = now
+            zone = int(zone_of[column])
+            present = bool(self._present[row, zone])
+            if ema >= (exit_[column] if present else enter[column]):
+                self._last_strong[row, column] = now
+                if not present:
+                    candidates.append((ema, row, zone, column))
+        candidates.sort(key=lambda c: -c[0])
+        events = []
+        arrived = set()
+        for ema, row, zone, column in candidates:
+            if (row, zone) in arrived:
+                continue
+            arrived.add((row, zone))
+            self._present[row, zone] = True
+            self._arrived_at[row, zone] = now
+            events.append({"event": ARRIVE, "epc": self._epcs[row],
+                           "zone": self.zones[zone], "antenna": self.antennas[column],
+                           "rssi": ema, "time": now})
+        self.arrivals += len(events)
+        return events
+
+    # -------- DEPARTURES -------- #
+    def poll(self, now=None):
+        """Run the departure sweep if it is due; returns its events."""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            if self._last_sweep is not None and now - self._last_sweep < self.sweep_interval:
+                return []
+            return self._sweep(now)
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        events = []
+        cutoff = now - self.timeout
+        for z, columns in enumerate(self._zone_columns):
+            present = self._present[:, z]
+            if not present.any():
+                continue
+            last = self._last_strong[:, columns].max(axis=1)
+            gone = np.flatnonzero(present & (last < cutoff))
+            if not len(gone):
+                continue
+            self._present[gone, z] = False
+            self.departures += len(gone)
+            ema = self._ema[gone][:, columns]
+            best = columns[np.argmax(np.nan_to_num(ema, nan=-np.inf), axis=1)]
+            for row, column, seen in zip(gone.tolist(), best.tolist(), last[gone].tolist()):
+                events.append({"event": DEPART, "epc": self._epcs[row],
+                               "zone": self.zones[z], "antenna": self.antennas[column],
+                               "rssi": float(self._ema[row, column]), "time": now,
+                               "last_seen": seen,
+                               "dwell": seen - float(self._arrived_at[row, z])})
+        stale = np.flatnonzero(~self._present.any(axis=1)
+                               & (self._last_read < now - self.forget_after)
+                               & (self._last_read > -np.inf))
+        if len(stale):
+            self._release(stale)
+        return events
+
+    # -------- QUERIES -------- #
+    def in_zone(self, zone):
+        """EPCs currently in `zone`."""
+        z = self.zones.index(zone)
+        with self._lock:
+            return [self._epcs[row] for row in np.flatnonzero(self._present[:, z]).tolist()]
+
+    def zones_of(self, epc):
+        """Zones `epc` is currently in."""
+        with self._lock:
+            row = self._rows.get(epc)
+            if row is None:
+                return []
+            return [self.zones[z] for z in np.flatnonzero(self._present[row]).tolist()]
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._allocate(len(self._epcs))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tags": len(self._rows),
+                "capacity": len(self._epcs),
+                "reads": self.reads,
+                "ignored": self.ignored,
+                "dropped": self.dropped,
+                "arrivals": self.arrivals,
+                "departures": self.departures,
+                "in_zone": {name: int(np.count_nonzero(self._present[:, z]))
+                            for z, name in enumerate(self.zones)},
+            }
+
+    def format_stats(self):
+        s = self.stats()
+        zones = ", ".join(f"{name}: {count}" for name, count in s["in_zone"].items())
+        return (f"{zones} | {s['tags']} tags tracked, {s['arrivals']} arrivals,"
+                f" {s['departures']} departures, {s['ignored']} reads outside zones,"
+                f" {s['dropped']} dropped")
@@ -0,0 +1,340 @@
+import json
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .epc import epc_from_hex, epc_hex
+
+logger = logging.getLogger(__name__)
+
+# One (EPC, port) entry in a bucket: [reads, first read, last read, peak RSSI]
+_COUNT, _FIRST, _LAST, _RSSI = range(4)
+
+
+class _Bucket(object):
+    __slots__ = ("slot", "by_port", "by_epc", "keys")
+
+    def __init__(self):
+        self.slot = None
+        self.by_port = {}   # (reader, antenna) -> {epc: entry}
+        self.by_epc = {}    # epc -> {(reader, antenna): entry}
+        self.keys = 0
+
+
+def _merge(into, entry):
+    """Fold one bucket entry into a query result."""
+    if into is None:
+        return list(entry)
+    into[_COUNT] += entry[_COUNT]
+    if entry[_FIRST] < into[_FIRST]:
+        into[_FIRST] = entry[_FIRST]
+    if entry[_LAST] > into[_LAST]:
+        into[_LAST] = entry[_LAST]
+    if entry[_RSSI] is not None and (into[_RSSI] is None or entry[_RSSI] > into[_RSSI]):
+        into[_RSSI] = entry[_RSSI]
+    return into
+
+
+def _as_dict(entry):
+    return {"count": entry[_COUNT], "first_seen": entry[_FIRST],
+            "last_seen": entry[_LAST], "rssi": entry[_RSSI]}
+
+
+class RecentReads(object):
+    """The last `horizon` seconds of tag reads, in memory, for live queries.
+
+    Reads go into a ring of `bucket`-second time buckets. Each bucket keeps
+    one entry per EPC and port (reader, antenna) with the read count, the
+    first and last read time and the peak RSSI, indexed both by port and by
+    EPC, so "what did antenna 2 see in the last 30 s" only walks the
+    buckets and ports involved and "where is EPC X" only looks at that EPC.
+    A bucket is reused once it falls out of the horizon, and holds at most
+    `max_keys` entries (further new EPC/port pairs are counted in
+    `dropped`), so memory is fixed however high the read rate gets.
+
+    Times are host wall clock seconds (time.time()) taken when the reads
+    are added; reader timestamps may be missing or skewed. last_seen is
+    exact; counts and first_seen cover whole buckets, so the oldest bucket
+    of a query window is counted in full if anything in it is recent
+    enough.
+
+    Thread-safe: the consumer thread adds while the command loop and the
+    query API read.
+    """
+
+    def __init__(self, horizon=300.0, bucket=5.0, max_keys=20000):
+        if horizon < bucket:
+            raise ValueError("horizon must be at least one bucket")
+        self.horizon = horizon
+        self.bucket = bucket
+        self.max_keys = max_keys
+        self.reads = 0
+        self.dropped = 0
+        self._size = int(math.ceil(horizon / bucket)) + 1
+        self._buckets = [_Bucket() for _ in range(self._size)]
+        self._last_slot = {}    # epc -> newest slot it was read in
+        self._lock = threading.Lock()
+
+    def _slot(self, t):
+        return int(t // self.bucket)
+
+    def _bucket_for(self, slot):
+        bucket = self._buckets[slot % self._size]
+        if bucket.slot != slot:
+            if bucket.slot is not None:
+                if bucket.slot > slot:
+                    return None  # Older than the horizon
+                last_slot = self._last_slot
+                for epc in bucket.by_epc:
+                    if last_slot.get(epc) == bucket.slot:
+                        del last_slot[epc]
+            bucket.slot = slot
+            bucket.by_port = {}
+            bucket.by_epc = {}
+            bucket.keys = 0
+        return bucket
+
+    def add_many(self, tags, now=None):
+        """Add pipeline tag dicts, all read at `now` (default: time.time())."""
+        if now is None:
+            now = time.time()
+        slot = self._slot(now)
+        with self._lock:
+            bucket = self._bucket_for(slot)
+            if bucket is None:
+                return
+            by_port = bucket.by_port
+            by_epc = bucket.by_epc
+            last_slot = self._last_slot
+            for tag in tags:
+                epc = tag["epc"]
+                port = (tag.get("reader"), tag.get("antenna"))
+                count = tag.get("seen_count") or 1
+                self.reads += count
+                ports = by_epc.get(epc)
+                entry = ports.get(port) if ports is not None else None
+                if entry is None:
+                    if bucket.keys >= self.max_keys:
+                        self.dropped += count
+                        continue
+                    entry = [count, now, now, tag.get("rssi")]
+                    if ports is None:
+                        ports = by_epc[epc] = {}
+                    ports[port] = entry
+                    epcs = by_port.get(port)
+                    if epcs is None:
+                        epcs = by_port[port] = {}
+                    epcs[epc] = entry
+                    bucket.keys += 1
+                    last_slot[epc] = slot
+                    continue
+                entry[_COUNT] += count
+                entry[_LAST] = now
+                rssi = tag.get("rssi")
+                if rssi is not None and (entry[_RSSI] is None or rssi > entry[_RSSI]):
+                    entry[_RSSI] = rssi
+
+    def add(self, tag, now=None):
+        self.add_many((tag,), now)
+
+    def clear(self):
+        with self._lock:
+            for bucket in self._buckets:
+                bucket.slot = None
+                bucket.by_port = {}
+                bucket.by_epc = {}
+                bucket.keys = 0
+            self._last_slot.clear()
+
+    def _window(self, seconds, now, newest=None):
+        """Live buckets overlapping the last `seconds`, newest first."""
+        if now is None:
+            now = time.time()
+        seconds = min(seconds, self.horizon)
+        cutoff = now - seconds
+        if newest is None:
+            newest = self._slot(now)
+        oldest = max(self._slot(cutoff), self._slot(now) - self._size + 1)
+        buckets = []
+        for slot in range(newest, oldest - 1, -1):
+            bucket = self._buckets[slot % self._size]
+            if bucket.slot == slot:
+                buckets.append(bucket)
+        return cutoff, buckets
+
+    @staticmethod
+    def _port_matches(port, antennas, reader):
+        return ((antennas is None or port[1] in antennas)
+                and (reader is None or port[0] == reader))
+
+    def antenna(self, antennas=None, seconds=30.0, reader=None, now=None):
+        """EPC -> {count, first_seen, last_seen, rssi} of the tags read on
+        `antennas` (an antenna ID or a collection of them, None = any) in
+        the last `seconds`."""
+        if isinstance(antennas, int):
+            antennas = (antennas,)
+        result = {}
+        with self._lock:
+            cutoff, buckets = self._window(seconds, now)
+            for bucket in buckets:
+                for port, epcs in bucket.by_port.items():
+                    if not self._port_matches(port, antennas, reader):
+                        continue
+                    for epc, entry in epcs.items():
+                        if entry[_LAST] >= cutoff:
+                            result[epc] = _merge(result.get(epc), entry)
+        return {epc: _as_dict(entry) for epc, entry in result.items()}
+
+    def epc(self, epc, seconds=30.0, now=None):
+        """(reader, antenna) -> {count, first_seen, last_seen, rssi} of one
+        EPC over the last `seconds`; empty if it was not read."""
+        result = {}
+        with self._lock:
+            newest = self._last_slot.get(epc)
+            if newest is None:
+                return result
+            cutoff, buckets = self._window(seconds, now, newest)
+            for bucket in buckets:
+                for port, entry in bucket.by_epc.get(epc, {}).items():
+                    if entry[_LAST] >= cutoff:
+                        result[port] = _merge(result.get(port), entry)
+        return {port: _as_dict(entry) for port, entry in result.items()}
+
+    def last_seen(self, epc, seconds=None, antennas=None, reader=None, now=None):
+        """When `epc` was last read (on `antennas`, if given) within the last
+        `seconds` (default: the horizon), or None. "Is X in the dock zone
+        now" is last_seen(x, 5, DOCK_ANTENNAS) is not None."""
+        if isinstance(antennas, int):
+            antennas = (antennas,)
+        with self._lock:
+            newest = self._last_slot.get(epc)
+            if newest is None:
+                return None
+            cutoff, buckets = self._window(seconds or self.horizon, now, newest)
+            for bucket in buckets:
+                # Buckets are newest first: the first match is the latest read
+                latest = None
+                for port, entry in bucket.by_epc.get(epc, {}).items():
+                    if (self._port_matches(port, antennas, reader)
+                            and entry[_LAST] >= cutoff
+                            and (latest is None or entry[_LAST] > latest)):
+                        latest = entry[_LAST]
+                if latest is not None:
+                    return latest
+        return None
+
+    def overview(self, seconds=30.0, now=None):
+        """(reader, antenna) -> {epcs, count} over the last `seconds`."""
+        ports = {}
+        with self._lock:
+            cutoff, buckets = self._window(seconds, now)
+            for bucket in buckets:
+                for port, epcs in bucket.by_port.items():
+                    seen, count = ports.setdefault(port, (set(), [0]))
+                    for epc, entry in epcs.items():
+                        if entry[_LAST] >= cutoff:
+                            seen.add(epc)
+                            count[0] += entry[_COUNT]
+        return {port: {"epcs": len(seen), "count": count[0]}
+                for port, (seen, count) in ports.items() if seen}
+
+    def stats(self, now=None):
+        with self._lock:
+            # Buckets past the horizon stay allocated until their slot comes round
+            _, buckets = self._window(self.horizon, now)
+            oldest = buckets[-1].slot if buckets else None
+            return {
+                "horizon_s": self.horizon,
+                "bucket_s": self.bucket,
+                "reads": self.reads,
+                "dropped": self.dropped,
+                "epcs": sum(1 for slot in self._last_slot.values()
+                            if oldest is not None and slot >= oldest),
+                "entries": sum(b.keys for b in buckets),
+                "max_entries": self.max_keys * self._size,
+            }
+
+    def format_stats(self, now=None):
+        s = self.stats(now)
+        return (f"{s['epcs']} EPCs in the last {s['horizon_s']:.0f}s,"
+                f" {s['entries']}/{s['max_entries']} entries,"
+                f" {s['reads']} reads, {s['dropped']} dropped")
+
+
+# -------- QUERY API -------- #
+def _port_json(port, summary):
+    reader, antenna = port
+    return dict(summary, reader=reader, antenna=antenna)
+
+
+def _antennas_param(values):
+    if not values:
+        return None
+    return {int(a) for value in values for a in value.split(",") if a.strip()}
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP, e.g.
+
+    GET /recent?seconds=30                      reads per reader/antenna
+    GET /recent/antenna/2?seconds=30            EPCs antenna 2 read
+    GET /recent/epc/E200...?seconds=5&antenna=1,2   where (and if) an EPC is
+    """
+    store = None
+
+    def _send(self, status, document):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        store = self.store
+        try:
+            seconds = float(params.get("seconds", ["30"])[0])
+            antennas = _antennas_param(params.get("antenna"))
+            reader = params.get("reader", [None])[0]
+            if parts == ["recent"]:
+                ports = store.overview(seconds)
+                self._send(200, {"seconds": seconds, "stats": store.stats(),
+                                 "ports": [_port_json(p, s) for p, s in sorted(
+                                     ports.items(), key=lambda kv: str(kv[0]))]})
+            elif len(parts) == 3 and parts[:2] == ["recent", "antenna"]:
+                tags = store.antenna(_antennas_param([parts[2]]), seconds, reader)
+                self._send(200, {"seconds": seconds, "antenna": parts[2],
+                                 "tags": [dict(s, epc=epc_hex(epc)) for epc, s in sorted(
+                                     tags.items(), key=lambda kv: -kv[1]["last_seen"])]})
+            elif len(parts) == 3 and parts[:2] == ["recent", "epc"]:
+                epc = epc_from_hex(parts[2])
+                last_seen = store.last_seen(epc, seconds, antennas, reader)
+                ports = store.epc(epc, seconds)
+                self._send(200, {"epc": epc_hex(epc), "seconds": seconds,
+                                 "present": last_seen is not None,
+                                 "last_seen": last_seen,
+                                 "ports": [_port_json(p, s) for p, s in ports.items()]})
+            else:
+                self.send_error(404)
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_query_server(store, port=9109, host="127.0.0.1"):
+    """Serve the recent-reads JSON API from a daemon thread; returns the server."""
+    handler = type("QueryHandler", (_QueryHandler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="recent-http",
+                     daemon=True).start()
+    logger.info("Recent reads on http://%s:%d/recent", host, server.server_address[1])
+    return server
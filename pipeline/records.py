@@ -0,0 +1,15 @@
+from .epc import epc_from_report
+
+
+def tag_from_report(tag, reader=None):
+    """Pipeline tag dict from one TagReportData entry of an RO_ACCESS_REPORT."""
+    return {
+        "epc": epc_from_report(tag["EPC"]),
+        "channel": tag.get("ChannelIndex"),
+        "antenna": tag.get("AntennaID"),
+        "rssi": tag.get("PeakRSSI"),
+        "first_seen": tag.get("FirstSeenTimestampUTC"),
+        "last_seen": tag.get("LastSeenTimestampUTC"),
+        "seen_count": tag.get("TagSeenCount"),
+        "reader": reader,
+    }
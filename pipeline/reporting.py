@@ -0,0 +1,144 @@
+import logging
+import time
+
+from sllurp.llrp import LLRPReaderState
+
+logger = logging.getLogger(__name__)
+
+# Report batching modes
+REPORT_PER_TAG = "per_tag"   # One RO_ACCESS_REPORT per tag read (lowest latency)
+REPORT_N_TAGS = "n_tags"     # Every N reads, or after timeout_ms if fewer arrived
+REPORT_TIMED = "timed"       # Everything read in each timeout_ms period
+REPORT_AUTO = "auto"         # N chosen from the observed read rate
+REPORT_MODES = (REPORT_PER_TAG, REPORT_N_TAGS, REPORT_TIMED, REPORT_AUTO)
+
+# TagObservationTrigger.NumberOfTags is 16 bit
+MAX_N_TAGS = 65535
+
+
+class ReportProfile(object):
+    """How often the reader sends RO_ACCESS_REPORTs.
+
+    sllurp turns report_every_n_tags/report_timeout_ms into the AISpec's
+    TagObservationTrigger, so every report closes an AISpec: after `n_tags`
+    reads or `timeout_ms` milliseconds, whichever comes first. Fewer, larger
+    reports cost less network, decode and callback time per tag; per-tag
+    reports get each read to the host as soon as possible.
+
+    In auto mode apply() starts per-tag, and an AdaptiveReporting attached
+    to the reader moves N so that about `target_reports_per_s` reports
+    arrive per second, never batching more than `max_n_tags` reads and never
+    holding one back longer than `timeout_ms`.
+    """
+
+    def __init__(self, mode=REPORT_PER_TAG, n_tags=100, timeout_ms=200,
+                 target_reports_per_s=20.0, max_n_tags=1000):
+        if mode not in REPORT_MODES:
+            raise ValueError("mode must be one of %s" % (REPORT_MODES,))
+        if not 1 <= n_tags <= MAX_N_TAGS or not 1 <= max_n_tags <= MAX_N_TAGS:
+            raise ValueError("n_tags and max_n_tags must be between 1 and %d" % MAX_N_TAGS)
+        if mode in (REPORT_TIMED, REPORT_AUTO) and timeout_ms <= 0:
+            raise ValueError("%s reporting needs a timeout_ms" % mode)
+        self.mode = mode
+        self.n_tags = n_tags
+        self.timeout_ms = timeout_ms
+        self.target_reports_per_s = target_reports_per_s
+        self.max_n_tags = max_n_tags
+
+    def trigger(self):
+        """(report_every_n_tags, report_timeout_ms) for the mode's start."""
+        if self.mode == REPORT_N_TAGS:
+            return self.n_tags, self.timeout_ms
+        if self.mode == REPORT_TIMED:
+            return MAX_N_TAGS, self.timeout_ms
+        return 1, 0
+
+    def n_for_rate(self, tags_per_s):
+        """Reads per report that gives about target_reports_per_s at this rate."""
+        n = int(round(tags_per_s / self.target_reports_per_s))
+        return max(1, min(self.max_n_tags, n))
+
+    def apply(self, config):
+        """Set the report trigger on an LLRPReaderConfig."""
+        config.report_every_n_tags, config.report_timeout_ms = self.trigger()
+        return config
+
+    def __repr__(self):
+        n, timeout = self.trigger()
+        return "ReportProfile(%s, N=%d, timeout=%d ms)" % (self.mode, n, timeout)
+
+
+class AdaptiveReporting(object):
+    """Retunes an LLRPReaderClient's report batching from its read rate.
+
+    Call observe() from a tag report callback with the number of reads in
+    each report. At most every `interval` seconds it works out the N that
+    suits the rate seen since the last check and, when that is at least
+    `hysteresis` times larger or smaller than the current one, restarts
+    inventory with it. A restart deletes and re-adds the ROSpec, which costs
+    a short read gap, so `interval` also bounds how often that can happen.
+
+    The check runs on the reader's own thread on purpose: sllurp's
+    stopPolitely() sends DELETE_ACCESSSPEC before it changes state, and from
+    any other thread the response can come back while the client still
+    thinks it is inventorying, which loses it and leaves the old ROSpec
+    running. If reads stop altogether nothing is checked, but then reports
+    only wait `timeout_ms` for a batch to fill.
+    """
+
+    def __init__(self, reader, profile, interval=5.0, hysteresis=2.0):
+        self.reader = reader
+        self.profile = profile
+        self.interval = interval
+        self.hysteresis = hysteresis
+        self.n_tags = reader.config.report_every_n_tags or 1
+        self.switches = 0
+        self.last_rate = 0.0
+        self._reads = 0
+        self._checked_at = time.monotonic()
+
+    def observe(self, n_reads):
+        self._reads += n_reads
+        now = time.monotonic()
+        if now - self._checked_at >= self.interval:
+            try:
+                self.check(now)
+            except Exception:
+                logger.exception("Report batching check failed")
+
+    def check(self, now=None):
+        """Retune if the read rate calls for it; returns True if it switched."""
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self._checked_at
+        reads, self._reads = self._reads, 0
+        self._checked_at = now
+        if elapsed <= 0:
+            return False
+        self.last_rate = reads / elapsed
+        wanted = self.profile.n_for_rate(self.last_rate)
+        ratio = float(max(wanted, self.n_tags)) / min(wanted, self.n_tags)
+        if ratio < self.hysteresis:
+            return False
+        llrp = self.reader.llrp
+        if llrp.state != LLRPReaderState.STATE_INVENTORYING:
+            return False
+        logger.info("%.0f tags/s: reporting every %d tags instead of %d",
+                    self.last_rate, wanted, self.n_tags)
+        self.n_tags = wanted
+        config = self.reader.config
+        config.report_every_n_tags = wanted
+        config.report_timeout_ms = self.profile.timeout_ms if wanted > 1 else 0
+        self.switches += 1
+        self._restart_inventory(llrp)
+        return True
+
+    @staticmethod
+    def _restart_inventory(llrp):
+        # Same dance sllurp does to apply a new transmit power
+        def on_stopped(_state, is_success, *args):
+            if is_success:
+                llrp.setState(LLRPReaderState.STATE_CONNECTED)
+                llrp.startInventory(force_regen_rospec=True)
+
+        llrp.stopPolitely(onCompletion=on_stopped)
@@ -0,0 +1,41 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+
+def environment():
+    """Where and on what the numbers were measured."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path, benchmark, results, params=None):
+    """Write results as JSON to `path` ("-" for stdout)."""
+    document = {
+        "benchmark": benchmark,
+        "environment": environment(),
+        "params": params or {},
+        "results": results,
+    }
+    if path == "-":
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2)
+    return document
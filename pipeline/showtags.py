@@ -0,0 +1,221 @@
+import datetime
+import re
+
+from .epc import epc_from_report
+
+# Column/key names the reader CLI may use, squashed (lower case, no spaces,
+# underscores or dashes) -> pipeline record field
+FIELD_ALIASES = {
+    "epc": "epc", "epcid": "epc", "tagid": "epc", "tag": "epc", "id": "epc",
+    "antenna": "antenna", "antennaid": "antenna", "ant": "antenna", "port": "antenna",
+    "rssi": "rssi", "peakrssi": "rssi",
+    "channel": "channel", "channelindex": "channel", "ch": "channel",
+    "count": "seen_count", "seencount": "seen_count", "tagseencount": "seen_count",
+    "readcount": "seen_count", "reads": "seen_count", "seen": "seen_count",
+    "firstseen": "first_seen", "firstseentimestamp": "first_seen", "first": "first_seen",
+    "lastseen": "last_seen", "lastseentimestamp": "last_seen", "last": "last_seen",
+    "time": "last_seen", "timestamp": "last_seen",
+}
+INT_FIELDS = ("antenna", "channel", "seen_count", "rssi")
+TIME_FIELDS = ("first_seen", "last_seen")
+
+_HEX = re.compile(r"^(?:0x)?([0-9A-Fa-f]{8,})$")
+_KEY_VALUE = re.compile(r"([A-Za-z][A-Za-z _-]*?)\s*[:=]\s*([^\s,;|]+(?: [0-9:.]+)?)")
+_COLUMNS = re.compile(r"\s*\|\s*|\s*,\s*|\t+|\s{2,}")
+_NUMBER = re.compile(r"^[-+]?\d+(?:\.\d+)?")
+
+
+def _squash(name):
+    return re.sub(r"[\s_-]+", "", name).lower()
+
+
+def _epc(value):
+    match = _HEX.match(value.replace(" ", "").replace("-", ""))
+    if match is None or len(match.group(1)) % 2:
+        return None
+    return epc_from_report(match.group(1).upper())
+
+
+def _int(value):
+    # "-55", "-55.5dBm", "3x"
+    match = _NUMBER.match(value)
+    return int(float(match.group())) if match else None
+
+
+def _timestamp_us(value):
+    """Microseconds since the epoch from a CLI timestamp, None if unknown.
+
+    Integers of 16+ digits are taken as microseconds (the LLRP unit),
+    13 digits as milliseconds, shorter numbers as seconds; anything else
+    has to be an ISO 8601 date and time, UTC unless it says otherwise.
+    """
+    value = value.strip()
+    if _NUMBER.match(value) and _NUMBER.match(value).group() == value:
+        number = float(value)
+        digits = len(value.split(".")[0].lstrip("-+"))
+        if digits >= 16:
+            return int(number)
+        if digits >= 13:
+            return int(number * 1000)
+        return int(number * 1000000)
+    try:
+        stamp = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=datetime.timezone.utc)
+    return int(stamp.timestamp() * 1000000)
+
+
+class ShowTagsParser(object):
+    """Incremental parser for the reader CLI's `show tags` output.
+
+    feed() takes one line at a time and returns the tag records (the same
+    dicts tag_from_report() builds for LLRP reports) that line completed, so
+    output can be parsed while it streams in, in constant memory: the parser
+    only holds the table header and at most one half-built record.
+
+    Two layouts are understood:
+
+    table      a header line naming the columns (EPC / Tag ID, Antenna, RSSI,
+               Count, Channel, First/Last Seen...) followed by one row per
+               tag, columns separated by tabs, `|`, `,` or 2+ spaces (single
+               spaces too when the row has as many fields as the header)
+    key/value  `EPC: E200... Antenna: 1 RSSI: -52` or `epc=E200...,ant=1`,
+               on one line or spread over several; a record ends at the next
+               EPC, a blank line or the end of the output (flush())
+
+    Lines that fit neither (banners, prompts, totals) are counted in
+    `skipped` and otherwise ignored. Readers that do not print a timestamp
+    get the host clock when the record is stored.
+    """
+
+    def __init__(self, reader=None):
+        self.reader = reader
+        self.lines = 0
+        self.records = 0
+        self.skipped = 0
+        self._columns = None
+        self._pending = None
+
+    def _new_record(self):
+        return {"epc": None, "channel": None, "antenna": None, "rssi": None,
+                "first_seen": None, "last_seen": None, "seen_count": None,
+                "reader": self.reader}
+
+    @staticmethod
+    def _set(record, field, value):
+        if field in INT_FIELDS:
+            record[field] = _int(value)
+        elif field in TIME_FIELDS:
+            record[field] = _timestamp_us(value)
+
+    def _header(self, fields):
+        columns = [FIELD_ALIASES.get(_squash(f)) for f in fields]
+        if "epc" in columns and sum(c is not None for c in columns) >= 2:
+            return columns
+        return None
+
+    def _row(self, line):
+        columns = self._columns
+        fields = [f for f in _COLUMNS.split(line.strip()) if f]
+        if len(fields) != len(columns):
+            fields = line.split()
+            if len(fields) != len(columns):
+                return None
+        record = self._new_record()
+        for field, value in zip(columns, fields):
+            if field == "epc":
+                record["epc"] = _epc(value)
+            elif field is not None:
+                self._set(record, field, value)
+        return record if record["epc"] is not None else None
+
+    def feed(self, line):
+        """Parse one line; returns the list of records it completed."""
+        self.lines += 1
+        stripped = line.strip()
+        if not stripped:
+            return self.flush()
+
+        if self._columns is not None:
+            record = self._row(stripped)
+            if record is not None:
+                self.records += 1
+                return [record]
+
+        pairs = []
+        for key, value in _KEY_VALUE.findall(stripped):
+            # "Tag: EPC=E200..." -> the EPC pair
+            if "=" in value:
+                key, value = value.split("=", 1)
+            pairs.append((key, value))
+        fields = [(FIELD_ALIASES.get(_squash(k)), v) for k, v in pairs]
+        fields = [(f, v) for f, v in fields if f is not None]
+        if fields:
+            done = []
+            for field, value in fields:
+                if field == "epc":
+                    epc = _epc(value)
+                    if epc is None:
+                        continue
+                    done.extend(self.flush())
+                    self._pending = self._new_record()
+                    self._pending["epc"] = epc
+                elif self._pending is not None:
+                    self._set(self._pending, field, value)
+            if self._pending is not None or done:
+                return done
+
+        header = self._header([f for f in _COLUMNS.split(stripped) if f])
+        if header is None:
+            header = self._header(stripped.split())
+        if header is not None:
+            done = self.flush()
+            self._columns = header
+            return done
+
+        self.skipped += 1
+        return []
+
+    def flush(self):
+        """Records still being built (key/value layout); call at end of output."""
+        if self._pending is None:
+            return []
+        record, self._pending = self._pending, None
+        self.records += 1
+        return [record]
+
+    def parse(self, lines):
+        """Yield the records of an iterable of lines, e.g. an SSH stdout."""
+        for line in lines:
+            for record in self.feed(line):
+                yield record
+        for record in self.flush():
+            yield record
+
+
+def load_show_tags(lines, db_path=None, reader=None, batch_size=5000):
+    """Parse `show tags` output straight into the tag_reads table.
+
+    Rows are inserted `batch_size` at a time, one transaction each, so a
+    large output never sits in memory whole. Returns the parser, for its
+    line/record/skipped counts.
+    """
+    from db.connection import get_connection
+    from db.queries import INSERT_TAG_READ
+    from db.writer import tag_row
+
+    conn = get_connection(db_path)
+    parser = ShowTagsParser(reader)
+    batch = []
+    for record in parser.parse(lines):
+        batch.append(tag_row(record))
+        if len(batch) >= batch_size:
+            with conn:
+                conn.executemany(INSERT_TAG_READ, batch)
+            batch = []
+    if batch:
+        with conn:
+            conn.executemany(INSERT_TAG_READ, batch)
+    return parser
@@ -0,0 +1,569 @@
+import asyncio
+import functools
+import logging
+import random
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+LLRP_VERSION = 1
+MSG_HEADER = struct.Struct("!HII")
+TLV_HEADER = struct.Struct("!HH")
+
+# Message types (LLRP 1.0.1, section 16.1)
+GET_READER_CAPABILITIES = 1
+GET_READER_CONFIG = 2
+SET_READER_CONFIG = 3
+CLOSE_CONNECTION_RESPONSE = 4
+GET_READER_CAPABILITIES_RESPONSE = 11
+GET_READER_CONFIG_RESPONSE = 12
+SET_READER_CONFIG_RESPONSE = 13
+CLOSE_CONNECTION = 14
+ADD_ROSPEC = 20
+DELETE_ROSPEC = 21
+START_ROSPEC = 22
+STOP_ROSPEC = 23
+ENABLE_ROSPEC = 24
+DISABLE_ROSPEC = 25
+DELETE_ACCESSSPEC = 41
+RO_ACCESS_REPORT = 61
+KEEPALIVE = 62
+READER_EVENT_NOTIFICATION = 63
+ENABLE_EVENTS_AND_REPORTS = 64
+KEEPALIVE_ACK = 72
+ERROR_MESSAGE = 100
+CUSTOM_MESSAGE = 1023
+
+IMPINJ_VENDOR_ID = 25882
+IMPINJ_ENABLE_EXTENSIONS = 21
+IMPINJ_ENABLE_EXTENSIONS_RESPONSE = 22
+
+# Requests answered with a bare LLRPStatus, mapped to their response type
+STATUS_RESPONSES = {
+    GET_READER_CONFIG: GET_READER_CONFIG_RESPONSE,
+    SET_READER_CONFIG: SET_READER_CONFIG_RESPONSE,
+    CLOSE_CONNECTION: CLOSE_CONNECTION_RESPONSE,
+    ADD_ROSPEC: 30,
+    DELETE_ROSPEC: 31,
+    START_ROSPEC: 32,
+    STOP_ROSPEC: 33,
+    ENABLE_ROSPEC: 34,
+    DISABLE_ROSPEC: 35,
+    40: 50,             # ADD_ACCESSSPEC
+    DELETE_ACCESSSPEC: 51,
+    42: 52,             # ENABLE_ACCESSSPEC
+    43: 53,             # DISABLE_ACCESSSPEC
+}
+
+# Fixed-size fields in front of the sub-parameters of the ROSpec parameters
+# the simulator looks into; the AISpec antenna list is handled separately.
+CONTAINER_PREFIX = {
+    177: 6,     # ROSpec: ROSpecID, Priority, CurrentState
+    178: 0,     # ROBoundarySpec
+    183: None,  # AISpec
+    184: 5,     # AISpecStopTrigger: type, duration
+    237: 3,     # ROReportSpec: trigger, N
+}
+
+# TagReportContentSelector bits, most significant first, with the TV
+# parameter each one enables: (bit, TV type, struct format)
+CONTENT_FIELDS = (
+    ("rospec_id", 15, 9, "I"),
+    ("spec_index", 14, 14, "H"),
+    ("inventory_parameter_spec_id", 13, 10, "H"),
+    ("antenna", 12, 1, "H"),
+    ("rssi", 10, 6, "b"),
+    ("channel", 11, 7, "H"),
+    ("first_seen", 9, 2, "Q"),
+    ("last_seen", 8, 4, "Q"),
+    ("seen_count", 7, 8, "H"),
+    ("access_spec_id", 6, 16, "I"),
+)
+DEFAULT_CONTENT_FLAGS = 0b0001111110000000  # antenna .. seen count
+
+RSSI_MIN = -95
+RSSI_MAX = -20
+
+# LLRPStatus code for a ROSpecID the reader does not know
+M_FIELD_ERROR = 101
+
+
+def now_us():
+    return int(time.time() * 1000000)
+
+
+# -------- ENCODING -------- #
+def encode_message(msg_type, msg_id, body=b""):
+    return MSG_HEADER.pack((LLRP_VERSION << 10) | msg_type,
+                           MSG_HEADER.size + len(body), msg_id) + body
+
+
+def encode_param(param_type, payload=b""):
+    return TLV_HEADER.pack(param_type, TLV_HEADER.size + len(payload)) + payload
+
+
+def encode_status(code=0, description=b""):
+    return encode_param(287, struct.pack("!HH", code, len(description)) + description)
+
+
+def encode_capabilities(antennas, power_table, mode_identifier):
+    """GET_READER_CAPABILITIES_RESPONSE body with what sllurp checks on connect."""
+    firmware = b"sim-1.0"
+    general = encode_param(137, struct.pack(
+        "!HHIIH", antennas, 1 << 14, IMPINJ_VENDOR_ID, 1, len(firmware)) + firmware)
+    llrp = encode_param(142, struct.pack("!BBHIIIII", 0, 1, 0, 1, 0, 0, 0, 0))
+
+    power = b"".join(encode_param(145, struct.pack("!HH", index, value))
+                     for index, value in enumerate(power_table, 1))
+    hops = struct.pack("!%dI" % 50, *range(902750, 927750, 500))
+    frequency = encode_param(146, b"\x80" + encode_param(
+        147, struct.pack("!BBH", 1, 0, 50) + hops))
+    modes = encode_param(328, encode_param(329, struct.pack(
+        "!IBBBBIIIII", mode_identifier, 0x80, 2, 0, 4, 320000, 2000, 20000, 20000, 0)))
+    regulatory = encode_param(143, struct.pack("!HH", 840, 1)
+                              + encode_param(144, power + frequency + modes))
+
+    c1g2 = encode_param(327, struct.pack("!BH", 0xc0, 2))
+    return encode_status() + general + llrp + regulatory + c1g2
+
+
+# -------- DECODING -------- #
+def iter_params(data):
+    """Yield (type, payload) for each TLV parameter in `data`."""
+    offset = 0
+    while offset + TLV_HEADER.size <= len(data):
+        if data[offset] & 0x80:
+            # TV parameters only show up in reports, never in requests
+            break
+        param_type, length = TLV_HEADER.unpack_from(data, offset)
+        if length < TLV_HEADER.size:
+            break
+        yield param_type & 0x3ff, data[offset + TLV_HEADER.size:offset + length]
+        offset += length
+
+
+def walk_params(data, found):
+    """Collect the leaf parameters of a request into `found` by type."""
+    for param_type, payload in iter_params(data):
+        found.setdefault(param_type, payload)
+        if param_type not in CONTAINER_PREFIX:
+            continue
+        prefix = CONTAINER_PREFIX[param_type]
+        if param_type == 183:
+            count = struct.unpack_from("!H", payload)[0]
+            prefix = 2 + 2 * count
+        if prefix is not None:
+            walk_params(payload[prefix:], found)
+
+
+class ROSpecSettings(object):
+    """The parts of an ADD_ROSPEC that change what the simulator sends."""
+
+    def __init__(self, body=b""):
+        found = {}
+        walk_params(body, found)
+        self.rospec_id = 1
+        self.antennas = []
+        self.duration_ms = 0
+        self.report_n = 0
+        self.report_timeout_ms = 0
+        self.content_flags = DEFAULT_CONTENT_FLAGS
+
+        if 177 in found:
+            self.rospec_id = struct.unpack_from("!I", found[177])[0]
+        if 182 in found:
+            trigger, duration = struct.unpack_from("!BI", found[182])
+            if trigger == 1:
+                self.duration_ms = duration
+        if 183 in found:
+            count = struct.unpack_from("!H", found[183])[0]
+            self.antennas = list(struct.unpack_from("!%dH" % count, found[183], 2))
+        if 185 in found:
+            # Tag observation trigger: report after N tags or T ms
+            _, _, number, _, _, timeout = struct.unpack_from("!BBHHHI", found[185])
+            self.report_n = number
+            self.report_timeout_ms = timeout
+        if 237 in found:
+            _, n = struct.unpack_from("!BH", found[237])
+            if n:
+                self.report_n = n
+        if 238 in found:
+            self.content_flags = struct.unpack_from("!H", found[238])[0]
+
+
+# -------- SIMULATED READER -------- #
+class TagPopulation(object):
+    """A fixed set of EPC-96 tags, each with its own mean RSSI."""
+
+    def __init__(self, size=500, rssi_mean=-55.0, rssi_std=6.0, jitter=2.0,
+                 seed=None):
+        self.random = random.Random(seed)
+        self.epcs = [struct.pack("!HHQ", 0xe280, 0x1160, i) for i in range(size)]
+        self.base_rssi = [self.random.gauss(rssi_mean, rssi_std) for _ in range(size)]
+        self.jitter = jitter
+
+    def __len__(self):
+        return len(self.epcs)
+
+    def rssi(self, index):
+        value = int(round(self.random.gauss(self.base_rssi[index], self.jitter)))
+        return min(RSSI_MAX, max(RSSI_MIN, value))
+
+
+class TagReportEncoder(object):
+    """Builds RO_ACCESS_REPORTs carrying the fields a content selector enables."""
+
+    def __init__(self, epcs, content_flags=DEFAULT_CONTENT_FLAGS, rospec_id=1):
+        self.epcs = epcs
+        self.rospec_id = rospec_id
+        self.fields = [(name, tv_type, fmt) for name, bit, tv_type, fmt in CONTENT_FIELDS
+                       if content_flags & (1 << bit)]
+        self.struct = struct.Struct(
+            "!HH" + "B12s" + "".join("B" + f for _, _, f in self.fields))
+
+    def encode(self, reads):
+        """Encode (index, antenna, rssi, channel, timestamp) reads as TagReportData."""
+        size = self.struct.size
+        pack = self.struct.pack
+        epcs = self.epcs
+        values = {"rospec_id": self.rospec_id, "spec_index": 1,
+                  "inventory_parameter_spec_id": 1, "seen_count": 1,
+                  "access_spec_id": 0}
+        fields = self.fields
+        out = []
+        for index, antenna, rssi, channel, timestamp in reads:
+            values["antenna"] = antenna
+            values["rssi"] = rssi
+            values["channel"] = channel
+            values["first_seen"] = values["last_seen"] = timestamp
+            args = [240, size, 0x80 | 13, epcs[index]]
+            for name, tv_type, _ in fields:
+                args.append(0x80 | tv_type)
+                args.append(values[name])
+            out.append(pack(*args))
+        return b"".join(out)
+
+    def message(self, reads, msg_id):
+        return encode_message(RO_ACCESS_REPORT, msg_id, self.encode(reads))
+
+
+class ReaderState(object):
+    """What a reader keeps across client connections.
+
+    As on a real reader, ROSpecs and the keepalive setting belong to the
+    reader, not to the connection that configured them: a client that comes
+    back after a dropped connection finds its ROSpec still there and can
+    enable it again without reconfiguring anything. A ROSpec left running
+    by a dropped client does not send anything until it is enabled again.
+    """
+
+    def __init__(self):
+        self.rospecs = {}   # ROSpecID -> ROSpecSettings
+        self.keepalive_ms = 0
+
+    def reset(self):
+        self.rospecs.clear()
+        self.keepalive_ms = 0
+
+
+class ReaderSession(object):
+    """One client connection to the simulated reader.
+
+    Answers the configuration handshake sllurp's LLRPClient performs and,
+    while a ROSpec is enabled, streams RO_ACCESS_REPORTs at `rate` tag reads
+    per second. Reports honour the client's ROReportSpec/TagObservationTrigger
+    N and timeout, its antenna list and its TagReportContentSelector; with no
+    N configured a report is sent every `report_interval` seconds. ROSpecs
+    and keepalives live in the reader's ReaderState, shared by its sessions.
+    """
+
+    def __init__(self, reader, writer, sim, state=None):
+        self.reader = reader
+        self.writer = writer
+        self.sim = sim
+        self.state = ReaderState() if state is None else state
+        self.rospec = ROSpecSettings()
+        self.msg_id = 1000
+        self.stalled_until = 0.0
+        self._inventory = None
+        self._keepalive = None
+        self._encoder = None
+
+    def _next_id(self):
+        self.msg_id += 1
+        return self.msg_id
+
+    def send(self, data):
+        if self.stalled_until and time.monotonic() < self.stalled_until:
+            # The link is down: nothing gets through, nothing is queued
+            return
+        self.writer.write(data)
+        self.sim.bytes_sent += len(data)
+
+    def stall(self, seconds):
+        """Send nothing for `seconds`, like a link that silently stops passing
+        traffic without either end closing the connection."""
+        self.stalled_until = time.monotonic() + seconds
+
+    async def run(self):
+        self.send(encode_message(READER_EVENT_NOTIFICATION, self._next_id(),
+                                 encode_param(246, encode_param(128, struct.pack("!Q", now_us()))
+                                              + encode_param(256, struct.pack("!H", 0)))))
+        self._start_keepalives()
+        try:
+            while True:
+                header = await self.reader.readexactly(MSG_HEADER.size)
+                type_version, length, msg_id = MSG_HEADER.unpack(header)
+                body = await self.reader.readexactly(length - MSG_HEADER.size)
+                if self.sim.response_delay and type_version & 0x3ff != KEEPALIVE_ACK:
+                    await asyncio.sleep(self.sim.response_delay)
+                if not self.handle(type_version & 0x3ff, msg_id, body):
+                    break
+                await self.writer.drain()
+        finally:
+            self.stop_inventory()
+            if self._keepalive is not None:
+                self._keepalive.cancel()
+
+    def handle(self, msg_type, msg_id, body):
+        """Answer one request. Returns False once the connection should close."""
+        if msg_type == GET_READER_CAPABILITIES:
+            self.send(encode_message(GET_READER_CAPABILITIES_RESPONSE, msg_id,
+                                     self.sim.capabilities))
+            return True
+        if msg_type == CUSTOM_MESSAGE:
+            vendor, subtype = struct.unpack_from("!IB", body)
+            if vendor == IMPINJ_VENDOR_ID and subtype == IMPINJ_ENABLE_EXTENSIONS:
+                self.send(encode_message(CUSTOM_MESSAGE, msg_id, struct.pack(
+                    "!IB", vendor, IMPINJ_ENABLE_EXTENSIONS_RESPONSE) + encode_status()))
+            return True
+        if msg_type in (KEEPALIVE_ACK, ENABLE_EVENTS_AND_REPORTS):
+            return True
+
+        response = STATUS_RESPONSES.get(msg_type)
+        if response is None:
+            logger.warning("Unsupported message type %d", msg_type)
+            self.send(encode_message(ERROR_MESSAGE, msg_id, encode_status(
+                109, b"unsupported by simulator")))
+            return True
+
+        status = encode_status()
+        if msg_type == SET_READER_CONFIG:
+            self.configure(body)
+        elif msg_type == ADD_ROSPEC:
+            rospec = ROSpecSettings(body)
+            self.state.rospecs[rospec.rospec_id] = rospec
+        elif msg_type in (ENABLE_ROSPEC, START_ROSPEC):
+            rospec = self.state.rospecs.get(struct.unpack_from("!I", body)[0])
+            if rospec is None:
+                status = encode_status(M_FIELD_ERROR, b"no such ROSpec")
+            else:
+                # sllurp adds ROSpecs with an immediate start trigger
+                self.rospec = rospec
+                self.start_inventory()
+        elif msg_type == DELETE_ROSPEC:
+            rospec_id = struct.unpack_from("!I", body)[0]
+            if rospec_id:
+                self.state.rospecs.pop(rospec_id, None)
+            else:
+                self.state.rospecs.clear()
+            self.stop_inventory()
+        elif msg_type in (STOP_ROSPEC, DISABLE_ROSPEC):
+            self.stop_inventory()
+        self.send(encode_message(response, msg_id, status))
+        return msg_type != CLOSE_CONNECTION
+
+    def configure(self, body):
+        if body[0] & 0x80:
+            # ResetToFactoryDefault
+            self.state.reset()
+            self.stop_inventory()
+        found = {}
+        walk_params(body[1:], found)  # skip the ResetToFactoryDefault byte
+        if 220 in found:
+            trigger, interval = struct.unpack_from("!BI", found[220])
+            self.state.keepalive_ms = interval if trigger == 1 else 0
+        self._start_keepalives()
+
+    def _start_keepalives(self):
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+        if self.state.keepalive_ms:
+            self._keepalive = asyncio.ensure_future(self._send_keepalives())
+
+    async def _send_keepalives(self):
+        while True:
+            await asyncio.sleep(self.state.keepalive_ms / 1000.0)
+            self.send(encode_message(KEEPALIVE, self._next_id()))
+
+    # -------- INVENTORY -------- #
+    def start_inventory(self):
+        if self._inventory is not None:
+            return
+        self._encoder = TagReportEncoder(self.sim.population.epcs,
+                                         self.rospec.content_flags,
+                                         self.rospec.rospec_id)
+        self._inventory = asyncio.ensure_future(self._run_inventory())
+
+    def stop_inventory(self):
+        if self._inventory is not None:
+            self._inventory.cancel()
+            self._inventory = None
+
+    def _antennas(self):
+        requested = [a for a in self.rospec.antennas if 0 < a <= self.sim.antennas]
+        if not requested:
+            # Antenna ID 0 means "all antennas"
+            requested = list(range(1, self.sim.antennas + 1))
+        return requested
+
+    def _report(self, reads):
+        return self._encoder.message(reads, self._next_id())
+
+    async def _run_inventory(self):
+        sim = self.sim
+        population = sim.population
+        rand = population.random
+        antennas = self._antennas()
+        report_n = self.rospec.report_n
+        report_timeout = (self.rospec.report_timeout_ms / 1000.0
+                          if self.rospec.report_timeout_ms else sim.report_interval)
+        started = last_tick = last_report = time.monotonic()
+        stop_at = (started + self.rospec.duration_ms / 1000.0
+                   if self.rospec.duration_ms else None)
+        owed = 0.0
+        pending = []
+
+        while True:
+            await asyncio.sleep(sim.tick)
+            now = time.monotonic()
+            if stop_at is not None and now >= stop_at:
+                break
+            owed += (now - last_tick) * sim.rate
+            last_tick = now
+            count = int(owed)
+            owed -= count
+
+            timestamp = now_us()
+            for index in rand.choices(range(len(population)), k=count):
+                pending.append((index, rand.choice(antennas), population.rssi(index),
+                                rand.randint(1, sim.channels), timestamp))
+
+            # Everything for this tick goes out in one write
+            chunks = []
+            sent = 0
+            if report_n:
+                while len(pending) - sent >= report_n:
+                    chunks.append(self._report(pending[sent:sent + report_n]))
+                    sent += report_n
+            if len(pending) > sent and now - last_report >= report_timeout:
+                chunks.append(self._report(pending[sent:]))
+                sent = len(pending)
+            if chunks:
+                del pending[:sent]
+                last_report = now
+                sim.reports_sent += len(chunks)
+                sim.tags_sent += sent
+                self.send(b"".join(chunks))
+                await self.writer.drain()
+        self._inventory = None
+
+
+class ReaderSimulator(object):
+    """Local LLRP reader that real clients can connect to for load tests.
+
+    Listens on `port` (and the next `readers - 1` ports, one simulated
+    reader each) and speaks enough LLRP for sllurp's LLRPClient to connect,
+    read capabilities, configure, add/enable a ROSpec and receive
+    RO_ACCESS_REPORTs. drop_connections() and stall_connections() inject
+    network failures for reconnect testing; `response_delay` seconds before
+    every answer stand in for a real reader's processing time.
+    """
+
+    def __init__(self, host="127.0.0.1", port=5084, readers=1, population=500,
+                 rate=1000.0, antennas=4, rssi_mean=-55.0, rssi_std=6.0,
+                 rssi_jitter=2.0, channels=50, power_levels=81,
+                 mode_identifier=1002, report_interval=0.2, tick=0.01, seed=None,
+                 response_delay=0.0):
+        self.host = host
+        self.port = port
+        self.readers = readers
+        self.rate = rate
+        self.antennas = antennas
+        self.channels = channels
+        self.report_interval = report_interval
+        self.tick = tick
+        self.response_delay = response_delay
+        self.population = TagPopulation(population, rssi_mean, rssi_std,
+                                        rssi_jitter, seed)
+        # 10.00 dBm upwards in 0.25 dB steps, in hundredths of a dBm
+        power_table = [1000 + 25 * i for i in range(power_levels)]
+        self.capabilities = encode_capabilities(antennas, power_table, mode_identifier)
+
+        self.servers = []
+        self.sessions = set()
+        self.states = {}    # port -> ReaderState
+        self.bytes_sent = 0
+        self.reports_sent = 0
+        self.tags_sent = 0
+
+    async def start(self):
+        for port in range(self.port, self.port + self.readers):
+            self.states[port] = ReaderState()
+            server = await asyncio.start_server(functools.partial(self._on_connect, port),
+                                                self.host, port)
+            self.servers.append(server)
+            logger.info("Simulated reader listening on %s:%d", self.host, port)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in self.servers))
+        finally:
+            self.close()
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+        for session in list(self.sessions):
+            session.writer.close()
+
+    def drop_connections(self):
+        """Reset every client connection, as a network failure would."""
+        for session in list(self.sessions):
+            session.writer.transport.abort()
+        return len(self.sessions)
+
+    def stall_connections(self, seconds):
+        """Stop all traffic to the connected clients for `seconds`."""
+        for session in list(self.sessions):
+            session.stall(seconds)
+        return len(self.sessions)
+
+    async def _on_connect(self, port, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        peer = writer.get_extra_info("peername")
+        logger.info("Client connected from %s", peer)
+        session = ReaderSession(reader, writer, self, self.states.get(port))
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            logger.info("Client %s disconnected", peer)
+
+    def stats(self):
+        return {
+            "connections": len(self.sessions),
+            "reports": self.reports_sent,
+            "tags": self.tags_sent,
+            "bytes": self.bytes_sent,
+        }
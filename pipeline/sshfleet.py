@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SSH_PORT = 22
+
+
+def parse_ssh_host(host, default_port=SSH_PORT):
+    if ":" in host:
+        host, port = host.rsplit(":", 1)
+        return host, int(port)
+    return host, default_port
+
+
+class SSHSession(object):
+    """A persistent SSH connection to one reader's CLI.
+
+    Connects on first use and keeps the transport open between commands
+    (with SSH keepalives), so each poll costs a channel open instead of a
+    TCP + key exchange + auth handshake. A connection found dead when a
+    command is started is re-established once; one that fails mid-command
+    is dropped, and the next command reconnects. Commands on one session
+    run one at a time.
+
+    paramiko is only imported on the first connect.
+    """
+
+    def __init__(self, host, username, password, timeout=10.0, keepalive=30):
+        self.host, self.port = parse_ssh_host(host)
+        self.name = host
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.connects = 0
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import paramiko
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(self.host, port=self.port, username=self.username,
+                       password=self.password, timeout=self.timeout,
+                       banner_timeout=self.timeout, auth_timeout=self.timeout)
+        client.get_transport().set_keepalive(self.keepalive)
+        self._client = client
+        self.connects += 1
+        logger.info("%s: SSH connection established", self.name)
+        return client
+
+    def _connected_client(self):
+        client = self._client
+        if client is not None:
+            transport = client.get_transport()
+            if transport is not None and transport.is_active():
+                return client
+            self._drop()
+        return self._connect()
+
+    def _drop(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+    def run(self, command, on_line):
+        """Run `command`, calling on_line(line) for each line of stdout as it
+        arrives; returns (lines, stderr text, exit status)."""
+        with self._lock:
+            try:
+                try:
+                    _, stdout, stderr = self._connected_client().exec_command(
+                        command, timeout=self.timeout)
+                except Exception:
+                    # Most likely a transport the reader closed since the
+                    # last poll: one fresh connection, then give up
+                    self._drop()
+                    _, stdout, stderr = self._connect().exec_command(
+                        command, timeout=self.timeout)
+                lines = 0
+                for line in stdout:
+                    on_line(line)
+                    lines += 1
+                error_output = stderr.read().decode(errors="replace")
+                return lines, error_output, stdout.channel.recv_exit_status()
+            except Exception:
+                self._drop()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+
+class SSHCollector(object):
+    """Runs one CLI command on many readers in parallel, on a schedule.
+
+    Every poll runs `command` on all sessions at once through a pool of
+    `workers` threads (default: one per session), so a poll of the fleet
+    takes as long as its slowest reader rather than the sum of them. Output
+    is handed to on_line(session, line) line by line while it streams in,
+    from the worker thread of that session; a session's lines never come
+    from two threads at once.
+    """
+
+    def __init__(self, sessions, command, on_line, workers=None):
+        self.sessions = list(sessions)
+        self.command = command
+        self.on_line = on_line
+        self.polls = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers or len(self.sessions) or 1,
+                                        thread_name_prefix="ssh-poll")
+
+    def _poll_one(self, session):
+        start = time.monotonic()
+        result = {"host": session.name, "lines": 0, "exit_status": None,
+                  "stderr": "", "error": None}
+        try:
+            result["lines"], result["stderr"], result["exit_status"] = session.run(
+                self.command, lambda line: self.on_line(session, line))
+        except Exception as e:
+            logger.warning("%s: %s failed: %s", session.name, self.command, e)
+            result["error"] = str(e) or e.__class__.__name__
+        result["seconds"] = time.monotonic() - start
+        return result
+
+    def poll(self):
+        """Poll every reader once; returns the per-reader results and wall time."""
+        start = time.monotonic()
+        futures = [self._pool.submit(self._poll_one, s) for s in self.sessions]
+        results = [f.result() for f in futures]
+        self.polls += 1
+        return {"poll": self.polls, "seconds": time.monotonic() - start,
+                "results": results}
+
+    def run(self, interval=0, polls=None, stop=None):
+        """Yield poll() results, starting one every `interval` seconds.
+
+        Stops after `polls` polls (None = until `stop`, a threading.Event, is
+        set). A poll that overruns its slot is followed by the next one
+        straight away, and the slots it overran are skipped rather than
+        made up in a burst.
+        """
+        stop = stop or threading.Event()
+        next_at = time.monotonic()
+        done = 0
+        while polls is None or done < polls:
+            yield self.poll()
+            done += 1
+            if polls is not None and done >= polls:
+                break
+            next_at += interval
+            now = time.monotonic()
+            if next_at < now:
+                next_at = now
+            if stop.wait(next_at - now):
+                break
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for session in self.sessions:
+            session.close()
@@ -0,0 +1,199 @@
+import argparse
+import json
+import signal
+import threading
+import time
+
+
+def load_config_file(path):
+    """Option values from a JSON object, keyed like the long options.
+
+    "log-file" and "log_file" both set --log-file.
+    """
+    with open(path) as f:
+        values = json.load(f)
+    if not isinstance(values, dict):
+        raise ValueError("%s: expected a JSON object of option values" % path)
+    return {key.replace("-", "_"): value for key, value in values.items()}
+
+
+def parse_args_with_config(parser, argv=None):
+    """parser.parse_args(), taking defaults from an optional --config file.
+
+    Options given on the command line win over the file, which wins over
+    the parser's own defaults.
+    """
+    parser.add_argument("--config", metavar="PATH",
+                        help="JSON file of option values (command-line options win)")
+    pre = argparse.ArgumentParser(add_help=False)
+    pre.add_argument("--config")
+    known, _ = pre.parse_known_args(argv)
+    if known.config:
+        try:
+            values = load_config_file(known.config)
+        except (OSError, ValueError) as e:
+            parser.error("cannot read config file: %s" % e)
+        dests = {action.dest for action in parser._actions}
+        unknown = sorted(set(values) - dests)
+        if unknown:
+            parser.error("unknown option(s) in %s: %s" % (known.config, ", ".join(unknown)))
+        parser.set_defaults(**values)
+    return parser.parse_args(argv)
+
+
+class ReaderReady(object):
+    """Tells when an LLRPReaderClient has finished its startup handshake.
+
+    Create it before connect(): it hooks the client's state, message and
+    disconnect callbacks. The reader is ready once it is inventorying when
+    the config starts inventory on connect, otherwise once the reader config
+    has been set (and, with reset_on_connect, the old ROSpecs cleared).
+    wait() returns as soon as that happens instead of sleeping a fixed time.
+    """
+
+    def __init__(self, reader):
+        # Imported here so the SSH tools can use this module without sllurp
+        from sllurp.llrp import LLRPReaderState
+
+        self.reader = reader
+        self.failed = False
+        self._event = threading.Event()
+        self._configured = False
+        config = reader.config
+        if config.start_inventory:
+            reader.add_state_callback(LLRPReaderState.STATE_INVENTORYING, self._on_ready)
+        else:
+            reader.add_message_callback("SET_READER_CONFIG_RESPONSE", self._on_configured)
+            if config.reset_on_connect:
+                reader.add_state_callback(LLRPReaderState.STATE_CONNECTED,
+                                          self._on_connected)
+        reader.add_disconnected_callback(self._on_disconnected)
+
+    def _on_ready(self, _reader, _state=None):
+        self._event.set()
+
+    def _on_configured(self, _reader, lmsg):
+        if not lmsg.isSuccess():
+            return
+        self._configured = True
+        if not self.reader.config.reset_on_connect:
+            self._event.set()
+
+    def _on_connected(self, _reader, _state):
+        # CONNECTED is also entered after GET_READER_CAPABILITIES; only the
+        # one after the config was set means the reset is done.
+        if self._configured:
+            self._event.set()
+
+    def _on_disconnected(self, _reader):
+        if not self._event.is_set():
+            self.failed = True
+            self._event.set()
+
+    def wait(self, timeout=None):
+        """True once ready; False on timeout or if the reader disconnected."""
+        return self._event.wait(timeout) and not self.failed
+
+
+class ReaderStartup(object):
+    """How one reader's startup went: see start_readers()."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.name = "%s:%s" % (reader._host, reader._port)
+        self.connect_s = None    # TCP connect
+        self.configure_s = None  # Connected to ready (config set, inventory started)
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        connect = "%.3fs" % self.connect_s if self.connect_s is not None else "-"
+        configure = "%.3fs" % self.configure_s if self.configure_s is not None else "-"
+        return "%-21s connect %7s | configure %7s | %s" % (
+            self.name, connect, configure, "ready" if self.ok else self.error)
+
+
+def start_readers(readers, ready_timeout=30.0):
+    """Connect LLRPReaderClients in parallel; one ReaderStartup per reader.
+
+    Each reader connects and waits for ReaderReady in its own thread, so a
+    slow or unreachable host only holds up itself and the others start
+    inventorying as soon as their own handshake is done. The TCP connect
+    is bounded by the client's `timeout`; a reader not ready within
+    `ready_timeout` seconds of connecting is dropped and reported, never
+    raised, so one bad reader cannot stop the rest.
+
+    Interrupted by Ctrl-C or a SIGTERM handler that raises, it disconnects
+    the readers that got connected (and any that connect afterwards) before
+    passing the exception on, so that none is left running.
+    """
+    results = [ReaderStartup(reader) for reader in readers]
+    stopping = threading.Event()
+    threads = [threading.Thread(target=_start_reader,
+                                args=(result, ready_timeout, stopping),
+                                name="start-%s" % result.name, daemon=True)
+               for result in results]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except BaseException:
+        stopping.set()
+        _stop_readers([result.reader for result in results])
+        raise
+    return results
+
+
+def _stop_readers(readers, timeout=5.0):
+    for reader in readers:
+        if reader.is_alive():
+            reader.disconnect()
+    for reader in readers:
+        reader.join(timeout)
+        if reader.is_alive():
+            reader.hard_disconnect()
+            reader.join(timeout)
+
+
+def _start_reader(result, ready_timeout, stopping):
+    reader = result.reader
+    ready = ReaderReady(reader)
+    start = time.monotonic()
+    try:
+        reader.connect()
+    except Exception as e:
+        result.error = "connect failed: %s" % (e or type(e).__name__)
+        return
+    if stopping.is_set():
+        # Connected after start_readers() was interrupted
+        reader.hard_disconnect()
+        return
+    connected = time.monotonic()
+    result.connect_s = connected - start
+    if ready.wait(ready_timeout):
+        result.configure_s = time.monotonic() - connected
+        return
+    if ready.failed:
+        result.error = "disconnected during setup"
+    else:
+        result.error = "not ready after %gs" % ready_timeout
+        # Shutting the socket down wakes the receive thread so it can end
+        reader.hard_disconnect()
+        reader.join(5)
+
+
+def wait_for_shutdown(is_alive, poll=1.0):
+    """Block until Ctrl-C, SIGTERM (service stop) or `is_alive()` going false."""
+    stop = threading.Event()
+    previous = signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while is_alive() and not stop.wait(poll):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, previous)
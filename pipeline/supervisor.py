@@ -0,0 +1,415 @@
+import logging
+import random
+import socket
+import threading
+import time
+
+from sllurp.llrp import LLRPClient, LLRPReaderState
+from sllurp.llrp_errors import ReaderConfigurationError
+
+from .metrics import BLACKOUT_SECONDS, RECONNECTS, reader_label
+
+logger = logging.getLogger(__name__)
+
+# How a reconnect got the reader going again
+RESUME_FAST = "fast"    # ENABLE_ROSPEC of the ROSpec left on the reader
+RESUME_FULL = "full"    # sllurp's whole connect sequence on a fresh client
+
+# Outcomes of one reconnect attempt
+_RESUMED = "resumed"
+_FAILED = "failed"          # No connection, refused, or lost again: back off
+_NO_RESUME = "no_resume"    # Connected, but the fast path did not take
+_STOPPED = "stopped"
+
+
+class Backoff(object):
+    """Exponential delays between reconnect attempts.
+
+    The first retry waits `initial` seconds, each one after that `factor`
+    times longer, up to `maximum`. Every delay is spread by +-`jitter` (a
+    fraction) so readers that dropped together do not retry in lockstep.
+    """
+
+    def __init__(self, initial=0.5, maximum=30.0, factor=2.0, jitter=0.2):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.failures = 0
+
+    def next_delay(self):
+        delay = self.initial * self.factor ** self.failures
+        if delay < self.maximum:
+            self.failures += 1
+        else:
+            delay = self.maximum
+        return delay * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def reset(self):
+        self.failures = 0
+
+
+class ReaderSupervisor(object):
+    """Keeps an LLRPReaderClient connected and, if it was, inventorying.
+
+    Create it before connect(), like ReaderReady: it hooks the client's
+    callbacks and sets its keepalive interval. start() connects and then
+    watches the connection from a daemon thread. A connection is dead when
+    the socket closes or nothing at all (reports, keepalives, events) has
+    arrived for `missed_keepalives` keepalive intervals; a dead connection
+    is closed and reconnected at once, then after Backoff delays.
+
+    A reconnect resumes one of two ways:
+
+    fast  the reused client still knows the ROSpec it added before the
+          loss, and the reader still has it, so ENABLE_ROSPEC is all that is
+          sent once the reader accepts the connection: reports flow again
+          after one round trip.
+    full  sllurp's own connect sequence on a fresh LLRPClient: capabilities,
+          config, the reset_on_connect cleanup, ADD/ENABLE_ROSPEC.
+
+    Fast is tried when the client was inventorying. The reader answering
+    the ENABLE_ROSPEC with an error (it rebooted, or another client reset
+    it) or not at all within `resume_timeout` falls back to full straight
+    away; sllurp has no GET_ROSPECS, so asking is the only way to know.
+
+    Every reconnect is appended to `reconnects` with its blackout: the time
+    from the last message received before the loss to the first tag report
+    after it (None until a report arrives, or if nothing was inventorying).
+    """
+
+    def __init__(self, reader, keepalive_interval=1.0, missed_keepalives=3,
+                 resume_timeout=2.0, configure_timeout=30.0, fast_resume=True,
+                 backoff=None, stable_after=60.0, max_attempts=None):
+        self.reader = reader
+        self.peername = reader_label(reader)
+        self.keepalive_interval = keepalive_interval
+        self.dead_after = keepalive_interval * missed_keepalives
+        self.resume_timeout = resume_timeout
+        self.configure_timeout = configure_timeout
+        self.fast_resume = fast_resume
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.stable_after = stable_after      # Connected this long resets the backoff
+        self.max_attempts = max_attempts      # Per loss; None retries forever
+        self.reconnects = []
+        self.failed_attempts = 0
+        self.last_message_at = None
+        self.connected_at = None
+
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._lost = False
+        self._lost_at = None
+        self._reason = None
+        self._accepted = False
+        self._refused = False
+        self._resumed = False
+        self._rejected = False
+        self._resuming = None       # RESUME_* while a reconnect attempt runs
+        self._attempt_id = 0
+        self._inventorying = False  # Whether a reconnect should resume inventory
+        self._pending = None        # (record, since) waiting for a first report
+        self._thread = None
+
+        if keepalive_interval:
+            # Also what fast resumes rely on: the reader keeps the setting
+            reader.config.keepalive_interval = int(keepalive_interval * 1000)
+        reader.add_disconnected_callback(self._on_disconnected)
+        reader.add_event_callback(self._on_event)
+        reader.add_message_callback("KEEPALIVE", self._on_message)
+        reader.add_message_callback("ENABLE_ROSPEC_RESPONSE", self._on_enable_response)
+        reader.add_tag_report_callback(self._on_reports)
+        if hasattr(reader, "add_tag_record_callback"):
+            reader.add_tag_record_callback(self._on_reports)
+        for _, state in LLRPReaderState.getStates():
+            if state != LLRPReaderState.STATE_DISCONNECTED:
+                reader.add_state_callback(state, self._on_state)
+
+    # -------- CONTROL -------- #
+    def start(self):
+        """Connect (raising like connect() does) and start watching."""
+        self.reader.connect()
+        self.connected_at = self.last_message_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="supervisor-%s" % self.peername)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop watching; the reader stays connected for disconnect()."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        """True until stop(), disconnect() or giving up on the reader."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        blackouts = [r["blackout_s"] for r in self.reconnects if r["blackout_s"] is not None]
+        return {
+            "connected": self.reader.is_alive() and not self._lost,
+            "reconnects": len(self.reconnects),
+            "fast": sum(1 for r in self.reconnects if r["resume"] == RESUME_FAST),
+            "full": sum(1 for r in self.reconnects if r["resume"] == RESUME_FULL),
+            "failed_attempts": self.failed_attempts,
+            "last_blackout_s": blackouts[-1] if blackouts else None,
+            "max_blackout_s": max(blackouts) if blackouts else None,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        text = ("{reconnects} reconnects ({fast} fast, {full} full) |"
+                " {failed_attempts} failed attempts").format(**s)
+        if s["last_blackout_s"] is not None:
+            text += " | blackout last {last_blackout_s:.2f}s, max {max_blackout_s:.2f}s".format(**s)
+        if not s["connected"]:
+            text += " | disconnected"
+        return text
+
+    # -------- CLIENT CALLBACKS (reader thread) -------- #
+    def _on_message(self, _reader, _lmsg):
+        self.last_message_at = time.monotonic()
+
+    def _on_reports(self, _reader, _reports):
+        now = self.last_message_at = time.monotonic()
+        if self._pending is not None:
+            self._first_report(now)
+
+    def _first_report(self, now):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        record, since = pending
+        record["blackout_s"] = now - since
+        BLACKOUT_SECONDS.labels(self.peername).observe(record["blackout_s"])
+        logger.info("%s: tag reports back after a %.2fs blackout",
+                    self.peername, record["blackout_s"])
+
+    def _on_event(self, _reader, event):
+        self.last_message_at = time.monotonic()
+        attempt = event.get("ConnectionAttemptEvent")
+        if attempt is None:
+            return
+        with self._cond:
+            if self._resuming is None:
+                return
+            if attempt.get("Status") != "Success":
+                logger.warning("%s: reader refused the connection: %s",
+                               self.peername, attempt.get("Status"))
+                self._refused = True
+            else:
+                self._accepted = True
+                if self._resuming == RESUME_FAST:
+                    self._enable_rospec()
+            self._cond.notify_all()
+
+    def _enable_rospec(self):
+        llrp = self.reader.llrp
+        attempt_id = self._attempt_id
+
+        def enabled(_state, is_success, *args):
+            # Deferreds of an attempt that timed out can fire on a later one
+            if is_success and attempt_id == self._attempt_id:
+                llrp.setState(LLRPReaderState.STATE_INVENTORYING)
+
+        # Sent before sllurp handles the event; it then ignores it, since
+        # the client is past CONNECTED
+        llrp.send_ENABLE_ROSPEC(None, llrp.rospec, onCompletion=enabled)
+
+    def _on_enable_response(self, _reader, lmsg):
+        if self._resuming == RESUME_FAST and not lmsg.isSuccess():
+            with self._cond:
+                self._rejected = True
+                self._cond.notify_all()
+
+    def _on_state(self, _reader, state):
+        inventorying = state == LLRPReaderState.STATE_INVENTORYING
+        with self._cond:
+            if self._resuming is None:
+                self._inventorying = inventorying
+            elif inventorying:
+                self._resumed = True
+                self._cond.notify_all()
+
+    def _on_disconnected(self, reader):
+        with self._cond:
+            if self._stopping or reader.disconnect_requested.is_set():
+                return
+            if not self._lost:
+                self._lost = True
+                self._lost_at = time.monotonic()
+            self._cond.notify_all()
+
+    # -------- WATCHDOG (supervisor thread) -------- #
+    def _run(self):
+        tick = min(1.0, self.keepalive_interval / 2.0) if self.keepalive_interval else 1.0
+        while True:
+            with self._cond:
+                if not (self._stopping or self._lost):
+                    self._cond.wait(tick)
+                if self._stopping:
+                    return
+                lost = self._lost
+            if self.reader.disconnect_requested.is_set():
+                return
+            if lost:
+                if not self._recover():
+                    return
+            else:
+                self._check_liveness()
+
+    def _check_liveness(self):
+        silent = time.monotonic() - self.last_message_at
+        if self.dead_after and silent > self.dead_after:
+            logger.warning("%s: nothing received for %.1fs, dropping the connection",
+                           self.peername, silent)
+            self._drop("no keepalive")
+        elif not self.reader.is_alive():
+            # The receive thread ended without reporting a disconnection
+            self.reader.hard_disconnect()
+            self._drop("receive thread ended")
+
+    def _drop(self, reason=None):
+        """Close the connection and count it as lost."""
+        # sllurp has no public handle on the socket. A shutdown, unlike
+        # hard_disconnect(), lets its receive thread see the end of the
+        # stream and wind down through its usual lost-connection path.
+        sock = self.reader._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self._cond:
+            if reason is not None:
+                self._reason = reason
+            if not self._lost:
+                self._lost = True
+                self._lost_at = time.monotonic()
+
+    def _recover(self):
+        """Reconnect after a loss; False if stopped or given up."""
+        lost_at = self._lost_at
+        since = self.last_message_at
+        reason = self._reason or "connection closed"
+        self._reason = None
+        if self.connected_at is not None and lost_at - self.connected_at >= self.stable_after:
+            self.backoff.reset()
+        want_inventory = self._inventorying
+        fast = (self.fast_resume and want_inventory
+                and getattr(self.reader.llrp, "rospec", None) is not None)
+        logger.warning("%s: connection lost (%s) after %.1fs of silence, reconnecting",
+                       self.peername, reason, lost_at - since)
+
+        config = self.reader.config
+        start_inventory = config.start_inventory
+        attempts = 0
+        try:
+            while True:
+                attempts += 1
+                mode = RESUME_FAST if fast else RESUME_FULL
+                outcome = self._attempt(mode, want_inventory)
+                if outcome == _RESUMED:
+                    break
+                if outcome == _STOPPED:
+                    return False
+                self.failed_attempts += 1
+                if outcome == _NO_RESUME and mode == RESUME_FAST:
+                    logger.info("%s: no ROSpec to resume, configuring the reader again",
+                                self.peername)
+                    fast = False
+                    continue
+                if self.max_attempts and attempts >= self.max_attempts:
+                    logger.error("%s: giving up after %d reconnect attempts",
+                                 self.peername, attempts)
+                    return False
+                delay = self.backoff.next_delay()
+                logger.info("%s: reconnect attempt %d failed, next in %.1fs",
+                            self.peername, attempts, delay)
+                with self._cond:
+                    if self._cond.wait_for(lambda: self._stopping, delay):
+                        return False
+        finally:
+            config.start_inventory = start_inventory
+
+        now = time.monotonic()
+        record = {
+            "at": time.time() - (now - lost_at),
+            "reason": reason,
+            "resume": mode,
+            "attempts": attempts,
+            "detect_s": lost_at - since,
+            "reconnect_s": now - lost_at,
+            "blackout_s": None,
+        }
+        self.reconnects.append(record)
+        RECONNECTS.labels(self.peername, mode).inc()
+        self.connected_at = now
+        if want_inventory:
+            self._pending = (record, since)
+        logger.info("%s: reconnected (%s resume, %d attempts) %.2fs after the loss",
+                    self.peername, mode, attempts, record["reconnect_s"])
+        return True
+
+    def _attempt(self, mode, want_inventory):
+        reader = self.reader
+        # The old receive thread must be gone before connect()
+        reader.join(5.0)
+        if reader.is_alive():
+            reader.hard_disconnect()
+            reader.join(1.0)
+        self._prepare(mode, want_inventory)
+        with self._cond:
+            self._lost = self._accepted = self._refused = False
+            self._resumed = self._rejected = False
+            self._resuming = mode
+            self._attempt_id += 1
+        try:
+            reader.connect()
+        except (OSError, ReaderConfigurationError) as e:
+            logger.debug("%s: connect failed: %s", self.peername, e)
+            return _FAILED
+        self.last_message_at = time.monotonic()
+
+        def done():
+            if self._stopping or self._lost or self._refused or self._rejected:
+                return True
+            return self._resumed if want_inventory else self._accepted
+
+        timeout = self.resume_timeout if mode == RESUME_FAST else self.configure_timeout
+        with self._cond:
+            self._cond.wait_for(done, timeout)
+            if self._stopping:
+                return _STOPPED
+            if self._lost or self._refused:
+                outcome = _FAILED
+            elif self._rejected or not done():
+                outcome = _NO_RESUME
+            else:
+                self._resuming = None
+                self._inventorying = want_inventory
+                return _RESUMED
+        self._drop()
+        return outcome
+
+    def _prepare(self, mode, want_inventory):
+        reader = self.reader
+        # A message cut short by the loss would garble the first new one
+        reader.partial_data = b""
+        reader.expected_bytes = 0
+        reset_stream = getattr(reader, "reset_stream", None)
+        if reset_stream is not None:
+            reset_stream()
+        if mode == RESUME_FAST:
+            # Keep the client: it holds the ROSpec and the reader's
+            # capabilities. Past CONNECTED it leaves the connection event
+            # to _on_event instead of starting its connect sequence.
+            reader.llrp.state = LLRPReaderState.STATE_CONNECTED
+        else:
+            # A fresh client drops the deferreds of a half-done exchange
+            reader.llrp = LLRPClient(reader.config, transport_tx_write=reader.send_data,
+                                     state_change_callback=reader._on_llrp_state_changed)
+            if want_inventory:
+                reader.config.start_inventory = True
@@ -0,0 +1,456 @@
+import glob
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+from collections import deque
+from queue import Empty, Full
+
+from .epc import epc_from_bytes
+from .metrics import QUEUE_DROPPED, QUEUE_REPLAYED, QUEUE_SPILLED
+
+logger = logging.getLogger(__name__)
+
+# Overflow policies
+POLICY_BLOCK = "block"                  # Block the producer (the LLRP thread)
+POLICY_DROP_OLDEST = "drop_oldest"      # Make room by dropping the oldest read
+POLICY_DROP_DUPLICATES = "drop_duplicates"  # Drop older reads of queued tags first
+POLICY_SPILL = "spill"                  # Append overflow to disk, replay it later
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_DUPLICATES, POLICY_SPILL)
+
+SPILL_RECORD = struct.Struct("!I")  # length prefix of each pickled item
+SPILL_PATTERN = "tagspill-%08d.seg"
+
+
+def tag_key(tag):
+    """Default duplicate key: one queued read per EPC."""
+    return tag["epc"]
+
+
+class TagQueue(object):
+    """Bounded FIFO between the LLRP callbacks and the consumer thread.
+
+    Drop-in for the queue.Queue the entry points used (put, get, get_nowait,
+    qsize, empty), so drain_batch() works unchanged. At most `maxsize` items
+    are held in memory; what happens to a put once it is full depends on
+    `policy`:
+
+    block            wait for the consumer, for up to `block_timeout` seconds
+                     (None = forever), then drop the new read; put_nowait()
+                     raises queue.Full like queue.Queue
+    drop_oldest      drop the oldest queued read
+    drop_duplicates  drop an older queued read of the new read's tag (by
+                     `key`), else of a tag queued more than once, else the
+                     oldest read; dropped reads are removed in bulk, so up to
+                     maxsize // 16 of them are held on top of `maxsize`
+    spill            append to segment files in `spill_dir`; they are replayed
+                     in order once the consumer has caught up, and segments
+                     left over by a previous run are replayed first
+
+    Drops, spills and replays are counted in stats() and in the
+    rfid_tag_queue_*_total metrics, labelled with the policy.
+    """
+
+    def __init__(self, maxsize=10000, policy=POLICY_BLOCK, block_timeout=None,
+                 key=tag_key, spill_dir=None, spill_segment_bytes=64 * 1024 ** 2,
+                 spill_max_bytes=None):
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of %s" % (POLICIES,))
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        if policy == POLICY_SPILL and not spill_dir:
+            raise ValueError("the spill policy needs a spill_dir")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.key = key
+        self.spill_dir = spill_dir
+        self.spill_segment_bytes = spill_segment_bytes
+        self.spill_max_bytes = spill_max_bytes
+
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        # drop_duplicates: queued reads per key, the keys queued more than
+        # once, and dropped reads not yet removed from _items: the oldest
+        # `_skip[key]` reads of a key there are dead. At most `_max_dead`
+        # are held before compacting.
+        self._key_counts = {} if policy == POLICY_DROP_DUPLICATES else None
+        self._dups = set()
+        self._skip = {}
+        self._dead = 0
+        self._max_dead = max(1, maxsize // 16)
+
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self._dropped_metric = QUEUE_DROPPED.labels(policy)
+        self._spilled_metric = QUEUE_SPILLED.labels(policy)
+        self._replayed_metric = QUEUE_REPLAYED.labels(policy)
+
+        # spill: segments waiting to be replayed, oldest first
+        self._segments = deque()
+        self._next_segment = 0
+        self._spill_pending = 0
+        self._spill_bytes = 0
+        self._spill_writer = None
+        self._spill_writer_size = 0
+        self._spill_reader = None
+        if policy == POLICY_SPILL and os.path.isdir(spill_dir):
+            self._recover_segments()
+
+    # -------- QUEUE API -------- #
+    def qsize(self):
+        """Reads waiting, in memory and spilled to disk."""
+        return len(self._items) - self._dead + self._spill_pending
+
+    def empty(self):
+        return not self.qsize()
+
+    def full(self):
+        return len(self._items) - self._dead >= self.maxsize
+
+    def put(self, item, block=True, timeout=None):
+        """Queue one read, applying the overflow policy if the queue is full.
+
+        `block` and `timeout` only matter for the block policy; `timeout`
+        defaults to `block_timeout`.
+        """
+        with self._lock:
+            self._put(item, block, self.block_timeout if timeout is None else timeout)
+
+    def put_many(self, items):
+        """Queue a whole report's worth of reads under one lock acquisition."""
+        with self._lock:
+            for item in items:
+                self._put(item, True, self.block_timeout)
+
+    def get(self, block=True, timeout=None):
+        deadline = None
+        if block and timeout is not None:
+            deadline = time.monotonic() + timeout
+        with self._not_empty:
+            while True:
+                if self.qsize():
+                    if not self._items:
+                        self._replay()
+                    # Empty still if every spilled record read back was
+                    # unreadable (a segment torn by a crash): wait again
+                    if self._items:
+                        return self._get()
+                    continue
+                if not block:
+                    raise Empty
+                if deadline is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    self._not_empty.wait(remaining)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "queued": len(self._items) - self._dead,
+            "maxsize": self.maxsize,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "spill_pending": self._spill_pending,
+            "spill_bytes": self._spill_bytes,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        text = "{queued}/{maxsize} queued ({policy}) | {dropped} dropped".format(**s)
+        if self.policy == POLICY_SPILL:
+            text += (" | {spilled} spilled, {replayed} replayed,"
+                     " {spill_pending} on disk").format(**s)
+        return text
+
+    def close(self):
+        """Close the spill files; unreplayed segments stay for the next run.
+
+        With the spill policy, reads still in memory are written ahead of
+        them, so the next run replays everything in the original order.
+        Other policies hold nothing on disk: drain the queue first.
+        """
+        with self._lock:
+            if self._spill_writer is not None:
+                self._spill_writer.close()
+                self._spill_writer = None
+            if self.policy != POLICY_SPILL:
+                return
+            head = b"".join(self._spill_record(pickle.dumps(item, pickle.HIGHEST_PROTOCOL))
+                            for item in self._items)
+            if self._spill_reader is not None:
+                # Rewrite the segment being replayed without the records
+                # already back in memory, or the next run would repeat them
+                rest = self._spill_reader.read()
+                self._spill_reader.close()
+                self._spill_reader = None
+            elif self._segments and head:
+                with open(self._segments[0], "rb") as f:
+                    rest = f.read()
+            elif head:
+                self._roll_segment()
+                self._spill_writer.close()
+                self._spill_writer = None
+                rest = b""
+            else:
+                return
+            path = self._segments[0]
+            with open(path + ".tmp", "wb") as f:
+                f.write(head)
+                f.write(rest)
+            os.replace(path + ".tmp", path)
+            self.spilled += len(self._items)
+            self._spilled_metric.inc(len(self._items))
+            self._items.clear()
+
+    # -------- INTERNALS (lock held) -------- #
+    def _put(self, item, block, timeout):
+        if self._spill_pending:
+            # Keep FIFO order: nothing overtakes what is already on disk
+            self._spill(item)
+            return
+        if (len(self._items) - self._dead >= self.maxsize
+                and not self._make_room(item, block, timeout)):
+            return
+        self._items.append(item)
+        if self._key_counts is not None:
+            key = self.key(item)
+            count = self._key_counts.get(key, 0) + 1
+            self._key_counts[key] = count
+            if count == 2:
+                self._dups.add(key)
+        self._not_empty.notify()
+
+    def _make_room(self, item, block, timeout):
+        """Free a slot for `item`; False if `item` was dropped or spilled."""
+        policy = self.policy
+        if policy == POLICY_BLOCK:
+            if not block:
+                raise Full
+            if timeout is None:
+                while len(self._items) >= self.maxsize:
+                    self._not_full.wait()
+                return True
+            deadline = time.monotonic() + timeout
+            while len(self._items) >= self.maxsize:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._count_drops(1)
+                    return False
+                self._not_full.wait(remaining)
+            return True
+        if policy == POLICY_DROP_OLDEST:
+            self._items.popleft()
+            self._count_drops(1)
+            return True
+        if policy == POLICY_DROP_DUPLICATES:
+            key = self.key(item)
+            if key in self._key_counts:
+                self._drop_older(key)
+            elif self._dups:
+                self._drop_older(next(iter(self._dups)))
+            else:
+                self._forget(self.key(self._pop_live()))
+                self._count_drops(1)
+            return True
+        self._spill(item)
+        return False
+
+    def _drop_older(self, key):
+        """Drop the oldest queued read of `key`.
+
+        It is only marked dead here, and skipped when it reaches the head
+        of the queue; _items is compacted once `_max_dead` reads are dead,
+        so each drop costs O(16) amortised rather than a rebuild apiece.
+        """
+        self._skip[key] = self._skip.get(key, 0) + 1
+        self._dead += 1
+        self._forget(key)
+        self._count_drops(1)
+        if self._dead >= self._max_dead:
+            self._compact()
+
+    def _compact(self):
+        kept = deque()
+        skip = self._skip
+        key = self.key
+        for item in self._items:
+            k = key(item)
+            n = skip.get(k)
+            if n:
+                skip[k] = n - 1
+            else:
+                kept.append(item)
+        self._items = kept
+        self._skip = {}
+        self._dead = 0
+
+    def _pop_live(self):
+        """Remove and return the oldest read that was not dropped."""
+        while True:
+            item = self._items.popleft()
+            if not self._dead:
+                return item
+            key = self.key(item)
+            skip = self._skip.get(key)
+            if not skip:
+                return item
+            if skip == 1:
+                del self._skip[key]
+            else:
+                self._skip[key] = skip - 1
+            self._dead -= 1
+
+    def _forget(self, key):
+        count = self._key_counts[key] - 1
+        if count:
+            self._key_counts[key] = count
+            if count == 1:
+                self._dups.discard(key)
+        else:
+            del self._key_counts[key]
+
+    def _get(self):
+        if self._key_counts is not None:
+            item = self._pop_live()
+            self._forget(self.key(item))
+        else:
+            item = self._items.popleft()
+            if self._spill_pending and len(self._items) <= self.maxsize // 2:
+                self._replay()
+        self._not_full.notify()
+        return item
+
+    def _count_drops(self, n):
+        if n:
+            self.dropped += n
+            self._dropped_metric.inc(n)
+
+    # -------- SPILL SEGMENTS -------- #
+    def _spill(self, item):
+        if self.spill_max_bytes is not None and self._spill_bytes >= self.spill_max_bytes:
+            self._count_drops(1)
+            return
+        data = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+        if (self._spill_writer is None
+                or self._spill_writer_size >= self.spill_segment_bytes):
+            self._roll_segment()
+        try:
+            self._spill_writer.write(self._spill_record(data))
+        except OSError:
+            logger.exception("Could not spill tag read to %s", self._segments[-1])
+            self._count_drops(1)
+            return
+        size = SPILL_RECORD.size + len(data)
+        self._spill_writer_size += size
+        self._spill_bytes += size
+        self._spill_pending += 1
+        self.spilled += 1
+        self._spilled_metric.inc()
+        self._not_empty.notify()
+
+    @staticmethod
+    def _spill_record(data):
+        return SPILL_RECORD.pack(len(data)) + data
+
+    def _roll_segment(self):
+        if self._spill_writer is not None:
+            self._spill_writer.close()
+        # Created on first use, not at startup
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, SPILL_PATTERN % self._next_segment)
+        self._next_segment += 1
+        self._spill_writer = open(path, "ab")
+        self._spill_writer_size = 0
+        self._segments.append(path)
+
+    def _replay(self):
+        """Move spilled reads back into memory, up to `maxsize`."""
+        if self._spill_writer is not None:
+            self._spill_writer.flush()
+        while self._spill_pending and len(self._items) < self.maxsize:
+            if self._spill_reader is None:
+                self._spill_reader = open(self._segments[0], "rb")
+            header = self._spill_reader.read(SPILL_RECORD.size)
+            if len(header) < SPILL_RECORD.size:
+                self._finish_segment()
+                continue
+            length, = SPILL_RECORD.unpack(header)
+            data = self._spill_reader.read(length)
+            self._spill_pending -= 1
+            self._spill_bytes -= SPILL_RECORD.size + length
+            try:
+                item = pickle.loads(data)
+            except Exception:
+                logger.exception("Dropping unreadable spilled tag read")
+                self._count_drops(1)
+                continue
+            epc = item.get("epc") if isinstance(item, dict) else None
+            if type(epc) is bytes:
+                # Unpickling made a fresh copy; share the interned one again
+                item["epc"] = epc_from_bytes(epc)
+            self._items.append(item)
+            self.replayed += 1
+            self._replayed_metric.inc()
+        if not self._spill_pending and self._segments:
+            # Everything is back in memory; start the next spill afresh
+            if self._spill_writer is not None:
+                self._spill_writer.close()
+                self._spill_writer = None
+            while self._segments:
+                self._finish_segment()
+
+    def _finish_segment(self):
+        if self._spill_reader is not None:
+            self._spill_reader.close()
+            self._spill_reader = None
+        path = self._segments.popleft()
+        if self._spill_writer is not None and not self._segments:
+            # Reader caught up with the segment still being written
+            self._spill_writer.close()
+            self._spill_writer = None
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning("Could not remove replayed spill segment %s", path)
+
+    def _recover_segments(self):
+        """Queue up complete records of segments a previous run left behind."""
+        paths = sorted(glob.glob(os.path.join(self.spill_dir, "tagspill-*.seg")))
+        for path in paths:
+            records, size = 0, 0
+            with open(path, "r+b") as f:
+                while True:
+                    header = f.read(SPILL_RECORD.size)
+                    if len(header) < SPILL_RECORD.size:
+                        break
+                    length, = SPILL_RECORD.unpack(header)
+                    if len(f.read(length)) < length:
+                        break
+                    records += 1
+                    size += SPILL_RECORD.size + length
+                # Cut off a record torn by a crash mid-write
+                f.truncate(size)
+            self._segments.append(path)
+            self._spill_pending += records
+            self._spill_bytes += size
+        if paths:
+            last = os.path.basename(paths[-1])
+            self._next_segment = int(last[len("tagspill-"):-len(".seg")]) + 1
+            logger.info("Replaying %d spilled tag reads from %d segments in %s",
+                        self._spill_pending, len(paths), self.spill_dir)
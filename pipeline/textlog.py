@@ -0,0 +1,143 @@
+import datetime
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+
+from .metrics import LOG_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# fsync policies
+FSYNC_NEVER = "never"        # Leave it to the OS (fastest)
+FSYNC_ON_FLUSH = "flush"     # fsync every time the buffer is flushed
+FSYNC_ALWAYS = "always"      # Flush and fsync on every write call (audit)
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_ON_FLUSH, FSYNC_ALWAYS)
+
+
+class TagLogWriter(object):
+    """Keeps the tag log open and writes it in buffered chunks.
+
+    Lines are buffered in memory and written once `flush_bytes` are pending
+    or `flush_interval` seconds have passed since the last flush. Call poll()
+    when idle so a quiet reader still gets its lines on disk, and close() on
+    shutdown.
+
+    The file is rotated when it grows past `max_bytes` and/or when the day
+    changes (`rotate_daily`). Closed segments are renamed with a timestamp
+    suffix and, with `compress`, gzipped in the background.
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_bytes=64 * 1024,
+                 max_bytes=None, rotate_daily=False, compress=False,
+                 fsync=FSYNC_NEVER):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("fsync must be one of %s" % (FSYNC_POLICIES,))
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._buffered = 0
+        self._file = None
+        self._size = 0
+        self._opened_on = None
+        self._last_flush = time.monotonic()
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "a")
+        self._size = self._file.tell()
+        self._opened_on = datetime.date.today()
+
+    # -------- WRITING -------- #
+    def write_lines(self, lines):
+        with self._lock:
+            for line in lines:
+                self._buffer.append(line)
+                self._buffered += len(line)
+            if (self.fsync == FSYNC_ALWAYS
+                    or self._buffered >= self.flush_bytes
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def poll(self):
+        """Flush if the time threshold has passed. Call this when idle."""
+        with self._lock:
+            if self._file is None:
+                return
+            if (self._buffer
+                    and time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+            elif self.rotate_daily and self._opened_on != datetime.date.today():
+                self._rotate()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush()
+            self._file.close()
+            self._file = None
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if self._file is None:
+            return
+        start = time.perf_counter()
+        wrote = bool(self._buffer)
+        if wrote:
+            self._file.write("".join(self._buffer))
+            self._size += self._buffered
+            self._buffer = []
+            self._buffered = 0
+        self._file.flush()
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._file.fileno())
+        if wrote:
+            LOG_FLUSH_SECONDS.observe(time.perf_counter() - start)
+        if self._should_rotate():
+            self._rotate()
+
+    # -------- ROTATION -------- #
+    def _should_rotate(self):
+        if self.max_bytes and self._size >= self.max_bytes:
+            return True
+        return self.rotate_daily and self._opened_on != datetime.date.today()
+
+    def _rotate(self):
+        self._file.close()
+        root, ext = os.path.splitext(self.path)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        closed = "%s.%s%s" % (root, stamp, ext)
+        suffix = 1
+        while os.path.exists(closed) or os.path.exists(closed + ".gz"):
+            closed = "%s.%s-%d%s" % (root, stamp, suffix, ext)
+            suffix += 1
+        os.replace(self.path, closed)
+        logger.info("Rotated tag log to %s", closed)
+        if self.compress:
+            threading.Thread(target=gzip_segment, args=(closed,),
+                             name="tag-log-gzip", daemon=True).start()
+        self._open()
+
+
+def gzip_segment(path):
+    """Compress a closed log segment to `path`.gz and remove the original."""
+    try:
+        with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+    except OSError:
+        logger.exception("Failed to compress %s", path)
@@ -0,0 +1,166 @@
+import threading
+import time
+
+from .epc import epc_from_report
+
+
+class ThroughputStats(object):
+    """Read and unique-tag throughput of an inventory run.
+
+    Feed it every sllurp tag report with record(). Reads are counted by
+    TagSeenCount (one per tag report entry if it is not enabled) into
+    `bucket`-second time buckets, so the summary can give the rate over any
+    `window`-second stretch of the run without keeping the reads themselves:
+    tags/s and new unique EPCs/s, both mean and sliding-window min, median
+    and peak. Reads are also broken down per antenna and per channel, and
+    the time it took to see the Nth unique EPC is kept for each N in
+    `nth_unique` (population tests).
+
+    The clock starts at start(), meant to be called when the first reader
+    enters INVENTORYING; later calls (other readers, a restarted inventory)
+    do not move it. Reads reported before it are timed from the first one.
+    The run ends at stop(), or at the last read if it was never called.
+    """
+
+    def __init__(self, window=1.0, bucket=0.1, nth_unique=()):
+        if window < bucket:
+            raise ValueError("window must be at least one bucket")
+        self.window = window
+        self.bucket = bucket
+        self.nth_unique = sorted(set(nth_unique))
+        self.started_at = None
+        self.stopped_at = None
+        self.last_read_at = None
+        self.reads = 0
+        self.reports = 0
+        self.per_antenna = {}
+        self.per_channel = {}
+        self.time_to_nth = {}   # N -> seconds from start to the Nth unique EPC
+        self._unique = set()
+        self._read_buckets = []
+        self._unique_buckets = []
+        self._lock = threading.Lock()
+
+    def start(self, now=None):
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = time.monotonic() if now is None else now
+
+    def stop(self, now=None):
+        """Mark the end of the run (defaults to the last read)."""
+        with self._lock:
+            self.stopped_at = time.monotonic() if now is None else now
+
+    def record(self, tags, now=None):
+        """Count one sllurp tag report (a list of tag dicts)."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = now
+            self.last_read_at = now
+            self.reports += 1
+            elapsed = max(0.0, now - self.started_at)
+            index = int(elapsed / self.bucket)
+            if index >= len(self._read_buckets):
+                grow = index + 1 - len(self._read_buckets)
+                self._read_buckets.extend([0] * grow)
+                self._unique_buckets.extend([0] * grow)
+            per_antenna = self.per_antenna
+            per_channel = self.per_channel
+            for tag in tags:
+                count = tag.get("TagSeenCount") or 1
+                self.reads += count
+                self._read_buckets[index] += count
+                antenna = tag.get("AntennaID")
+                per_antenna[antenna] = per_antenna.get(antenna, 0) + count
+                channel = tag.get("ChannelIndex")
+                per_channel[channel] = per_channel.get(channel, 0) + count
+                epc = epc_from_report(tag["EPC"])
+                if epc not in self._unique:
+                    self._unique.add(epc)
+                    self._unique_buckets[index] += 1
+                    if len(self._unique) in self.nth_unique:
+                        self.time_to_nth[len(self._unique)] = elapsed
+
+    @property
+    def unique(self):
+        return len(self._unique)
+
+    def _window_rates(self, buckets):
+        """Rate over every full window, sliding one bucket at a time."""
+        width = max(1, int(round(self.window / self.bucket)))
+        if len(buckets) < width:
+            return [sum(buckets) / (len(buckets) * self.bucket)] if buckets else []
+        total = sum(buckets[:width])
+        rates = [total / (width * self.bucket)]
+        for i in range(width, len(buckets)):
+            total += buckets[i] - buckets[i - width]
+            rates.append(total / (width * self.bucket))
+        return rates
+
+    @staticmethod
+    def _spread(rates):
+        if not rates:
+            return {"min": None, "median": None, "peak": None}
+        ordered = sorted(rates)
+        return {"min": ordered[0], "median": ordered[len(ordered) // 2],
+                "peak": ordered[-1]}
+
+    def summary(self):
+        with self._lock:
+            end = self.stopped_at or self.last_read_at
+            runtime = end - self.started_at if self.started_at is not None and end else 0.0
+            read_buckets = list(self._read_buckets)
+            unique_buckets = list(self._unique_buckets)
+            return {
+                "runtime_s": runtime,
+                "reports": self.reports,
+                "reads": self.reads,
+                "unique_epcs": len(self._unique),
+                "tags_per_s": self.reads / runtime if runtime else None,
+                "unique_per_s": len(self._unique) / runtime if runtime else None,
+                "window_s": self.window,
+                "window_tags_per_s": self._spread(self._window_rates(read_buckets)),
+                "window_unique_per_s": self._spread(self._window_rates(unique_buckets)),
+                # JSON object keys must be strings
+                "per_antenna": {str(k): v for k, v in sorted(
+                    self.per_antenna.items(), key=lambda kv: (kv[0] is None, kv[0] or 0))},
+                "per_channel": {str(k): v for k, v in sorted(
+                    self.per_channel.items(), key=lambda kv: (kv[0] is None, kv[0] or 0))},
+                "time_to_nth_unique_s": {str(n): self.time_to_nth.get(n)
+                                         for n in self.nth_unique},
+            }
+
+    def format_table(self):
+        s = self.summary()
+
+        def rate(value):
+            return "%10.1f" % value if value is not None else "%10s" % "n/a"
+
+        lines = [
+            "runtime      %8.2f s   %d reports" % (s["runtime_s"], s["reports"]),
+            "reads        %8d     %s /s" % (s["reads"], rate(s["tags_per_s"])),
+            "unique EPCs  %8d     %s /s" % (s["unique_epcs"], rate(s["unique_per_s"])),
+            "",
+            "%.1fs window      %10s %10s %10s" % (s["window_s"], "min", "median", "peak"),
+        ]
+        for label, spread in (("tags/s", s["window_tags_per_s"]),
+                              ("unique/s", s["window_unique_per_s"])):
+            lines.append("  %-15s %s %s %s" % (label, rate(spread["min"]),
+                                                 rate(spread["median"]), rate(spread["peak"])))
+        for title, counts in (("antenna", s["per_antenna"]), ("channel", s["per_channel"])):
+            if list(counts) == ["None"]:
+                continue  # Not in the tag content selector
+            lines.append("")
+            lines.append("%-8s %10s %7s" % (title, "reads", "share"))
+            for key, count in counts.items():
+                lines.append("%-8s %10d %6.1f%%" % (key, count,
+                                                    100.0 * count / s["reads"]))
+        if s["time_to_nth_unique_s"]:
+            lines.append("")
+            lines.append("%-8s %10s" % ("Nth EPC", "seconds"))
+            for n, seconds in s["time_to_nth_unique_s"].items():
+                lines.append("%-8s %10s" % (n, "%.3f" % seconds if seconds is not None
+                                            else "not seen"))
+        return "\n".join(lines)
@@ -0,0 +1,59 @@
+from pipeline.aggregator import TagAggregator
+
+
+def read(epc, antenna=1, rssi=-50, last_seen=0, channel=None, seen_count=None):
+    return {"epc": epc, "antenna": antenna, "rssi": rssi, "last_seen": last_seen,
+            "channel": channel, "seen_count": seen_count, "reader": None}
+
+
+def test_emits_once_per_window():
+    aggregator = TagAggregator(window=5.0)
+    assert aggregator.update(read(b"a"), now=0.0) is not None
+    assert aggregator.update(read(b"a"), now=4.9) is None
+    snapshot = aggregator.update(read(b"a"), now=5.0)
+    assert snapshot["seen_count"] == 3
+    assert aggregator.emitted == 2
+    assert aggregator.reads_in == 3
+
+
+def test_folds_rssi_channels_and_seen_counts():
+    aggregator = TagAggregator(window=0.0)
+    aggregator.update(read(b"a", rssi=-60, channel=3, last_seen=10), now=0.0)
+    snapshot = aggregator.update(read(b"a", rssi=-70, channel=5, last_seen=20, seen_count=4),
+                                 now=1.0)
+    assert snapshot["rssi"] == -60
+    assert snapshot["channel"] == 5
+    assert snapshot["channels"] == [3, 5]
+    assert snapshot["seen_count"] == 5
+    assert snapshot["first_seen"] == 10
+    assert snapshot["last_seen"] == 20
+
+
+def test_by_antenna_tracks_each_port():
+    aggregator = TagAggregator(by_antenna=True)
+    emitted = aggregator.update_many([read(b"a", 1), read(b"a", 2), read(b"a", 1)], now=0.0)
+    assert [tag["antenna"] for tag in emitted] == [1, 2]
+    assert len(aggregator) == 2
+    assert aggregator.get(b"a", 2).seen_count == 1
+
+
+def test_evicts_least_recently_read_tags():
+    aggregator = TagAggregator(max_tags=2)
+    aggregator.update_many([read(b"a"), read(b"b")], now=0.0)
+    aggregator.update(read(b"a"), now=1.0)
+    aggregator.update(read(b"c"), now=2.0)
+    assert aggregator.get(b"b") is None
+    assert aggregator.get(b"a") is not None
+    assert aggregator.evicted == 1
+
+
+def test_expired_tags_are_forgotten_and_new_again():
+    aggregator = TagAggregator(window=1000.0, ttl=10.0)
+    aggregator.update(read(b"a"), now=0.0)
+    aggregator.update(read(b"b"), now=5.0)
+    aggregator.update(read(b"b"), now=10.5)
+    assert aggregator.get(b"a") is None
+    assert len(aggregator) == 1
+    snapshot = aggregator.update(read(b"a"), now=11.0)
+    assert snapshot is not None
+    assert snapshot["seen_count"] == 1
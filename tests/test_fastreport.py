@@ -0,0 +1,94 @@
+import struct
+
+import pytest
+from sllurp.llrp import LLRPMessage, LLRPReaderConfig, LLRPReaderState
+
+from pipeline.fastreport import (
+    EPC_DATA, MAX_MESSAGE_SIZE, TAG_REPORT_DATA, FastReportClient, UnsupportedReport,
+    decode_tag_reports)
+from pipeline.records import tag_from_report
+from pipeline.simulator import (
+    DEFAULT_CONTENT_FLAGS, KEEPALIVE, RO_ACCESS_REPORT, TagPopulation, TagReportEncoder,
+    encode_message, encode_param)
+
+READER = "test:5084"
+FULL_CONTENT = 0b1111111111000000  # every TagReportContentSelector field
+
+
+def make_reads(count):
+    return [(i % 5, 1 + i % 4, -40 - i, 1 + i % 50, 1760000000000000 + i)
+            for i in range(count)]
+
+
+@pytest.fixture
+def population():
+    return TagPopulation(5, seed=1)
+
+
+@pytest.mark.parametrize("content_flags", [0, DEFAULT_CONTENT_FLAGS, FULL_CONTENT])
+def test_decode_matches_sllurp(population, content_flags):
+    message = TagReportEncoder(population.epcs, content_flags).message(make_reads(7), 1)
+    lmsg = LLRPMessage(msgbytes=message)
+    expected = [tag_from_report(tag, READER)
+                for tag in lmsg.msgdict["RO_ACCESS_REPORT"]["TagReportData"]]
+    assert decode_tag_reports(memoryview(message)[10:], READER) == expected
+
+
+def test_decode_epc_data_parameter():
+    epc = bytes(range(8))
+    # EPCData: bit length, then the EPC padded to whole bytes
+    epc_data = encode_param(EPC_DATA, struct.pack("!H", 64) + epc)
+    antenna = struct.pack("!BH", 0x80 | 1, 3)
+    records = decode_tag_reports(encode_param(TAG_REPORT_DATA, epc_data + antenna))
+    assert records[0]["epc"] == epc
+    assert records[0]["antenna"] == 3
+
+
+EPC_TV = struct.pack("!B12s", 0x80 | 13, b"e" * 12)
+
+
+@pytest.mark.parametrize("body", [
+    pytest.param(encode_param(243, b"\x00" * 4), id="not-tag-report-data"),
+    pytest.param(encode_param(TAG_REPORT_DATA, EPC_TV + b"\xe3\x00\x00"), id="unknown-tv"),
+    pytest.param(encode_param(TAG_REPORT_DATA, b"\x81\x00\x01"), id="no-epc"),
+    pytest.param(encode_param(TAG_REPORT_DATA, EPC_TV)[:-2], id="truncated"),
+])
+def test_decode_rejects_what_it_cannot_decode(body):
+    with pytest.raises((UnsupportedReport, struct.error)):
+        decode_tag_reports(body)
+
+
+@pytest.fixture
+def client():
+    client = FastReportClient("127.0.0.1", 5084, LLRPReaderConfig())
+    client.llrp.state = LLRPReaderState.STATE_INVENTORYING
+    return client
+
+
+def test_client_decodes_reports_split_across_reads(client, population):
+    encoder = TagReportEncoder(population.epcs)
+    data = encoder.message(make_reads(3), 1) + encoder.message(make_reads(2), 2)
+    received = []
+    client.add_tag_record_callback(lambda _client, records: received.extend(records))
+    for i in range(0, len(data), 7):
+        client.raw_data_received(data[i:i + 7])
+    assert [r["epc"] for r in received] == [population.epcs[i] for i in (0, 1, 2, 0, 1)]
+    assert client._buffer == b""
+
+
+def test_client_still_runs_message_callbacks(client, population):
+    messages = []
+    client.add_tag_record_callback(lambda _client, records: None)
+    client.add_message_callback("RO_ACCESS_REPORT", lambda _client, lmsg: messages.append(lmsg))
+    client.raw_data_received(TagReportEncoder(population.epcs).message(make_reads(4), 1))
+    assert len(messages) == 1
+    assert len(messages[0].msgdict["RO_ACCESS_REPORT"]["TagReportData"]) == 4
+
+
+@pytest.mark.parametrize("length", [0, 9, MAX_MESSAGE_SIZE + 1])
+def test_client_drops_the_connection_on_a_bad_length(client, length):
+    header = struct.pack("!HII", (1 << 10) | RO_ACCESS_REPORT, length, 2)
+    client.raw_data_received(header[:6])
+    with pytest.raises(ConnectionError):
+        client.raw_data_received(header[6:] + encode_message(KEEPALIVE, 3))
+    assert client._buffer == b""
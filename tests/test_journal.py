@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from pipeline.journal import (
+    HEADER, KIND_READ, JournalSegment, TagJournal, iter_journal, segment_names)
+
+
+def tag(n, epc=None, reader="r1:5084"):
+    return {"epc": epc or bytes([0xe2, 0x80]) + n.to_bytes(10, "big"), "antenna": 1 + n % 4,
+            "channel": 7, "rssi": -40 - n % 30, "seen_count": 1,
+            "first_seen": 1760000000000000 + n, "last_seen": 1760000000000000 + n,
+            "reader": reader}
+
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return str(tmp_path / "journal")
+
+
+def write_blocks(directory, blocks):
+    """One block per list of tags; the segment's path."""
+    journal = TagJournal(directory, flush_interval=3600)
+    for tags in blocks:
+        journal.write_tags(tags)
+        journal.flush()
+    journal.close()
+    return journal.path
+
+
+def test_round_trip(journal_dir):
+    tags = [tag(n) for n in range(10)]
+    tags.append({"epc": b"\x01" * 12, "antenna": None, "channel": None, "rssi": None,
+                 "seen_count": None, "first_seen": None, "last_seen": None, "reader": None})
+    tags.append(tag(11, reader="r2:5084"))
+    write_blocks(journal_dir, [tags[:5], tags[5:]])
+    assert list(iter_journal(journal_dir)) == tags
+
+
+def test_longer_epc_starts_a_wider_segment(journal_dir):
+    tags = [tag(0), tag(1, epc=b"\x02" * 16), tag(2)]
+    write_blocks(journal_dir, [tags])
+    assert len(segment_names(journal_dir)) == 2
+    assert list(iter_journal(journal_dir)) == tags
+
+
+def test_damaged_block_is_skipped(journal_dir):
+    blocks = [[tag(n) for n in range(i * 3, i * 3 + 3)] for i in range(3)]
+    path = write_blocks(journal_dir, blocks)
+    with JournalSegment(path) as segment:
+        second, _ = list(segment.blocks())[1]
+        # A byte of the second block's first read
+        offset = HEADER.size + second * segment.record_size + 8
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(b"\xff")
+
+    with JournalSegment(path) as segment:
+        assert list(segment) == blocks[0] + blocks[2]
+        assert segment.skipped == 4  # its header and three reads
+
+
+def test_torn_tail_is_skipped(journal_dir):
+    blocks = [[tag(n) for n in range(3)], [tag(n) for n in range(3, 6)]]
+    path = write_blocks(journal_dir, blocks)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 10)
+
+    with JournalSegment(path) as segment:
+        assert segment.torn_bytes
+        assert list(segment) == blocks[0]
+
+
+def test_unreadable_segment_is_skipped(journal_dir):
+    first = write_blocks(journal_dir, [[tag(0)]])
+    write_blocks(journal_dir, [[tag(1)]])
+    with open(first, "r+b") as f:
+        f.seek(20)
+        f.write(b"\xff")
+    assert list(iter_journal(journal_dir)) == [tag(1)]
+
+
+def test_reopening_continues_the_sequence(journal_dir):
+    write_blocks(journal_dir, [[tag(0)]])
+    write_blocks(journal_dir, [[tag(1)]])
+    names = segment_names(journal_dir)
+    assert [int(name[-10:-4]) for name in names] == [0, 1]
+    assert list(iter_journal(journal_dir)) == [tag(0), tag(1)]
+
+
+def test_array_views_the_records(journal_dir):
+    pytest.importorskip("numpy")
+    path = write_blocks(journal_dir, [[tag(n) for n in range(5)]])
+    with JournalSegment(path) as segment:
+        a = segment.array()
+        reads = a[a["kind"] == KIND_READ]
+        assert reads["rssi"].tolist() == [-40, -41, -42, -43, -44]
+        assert bytes(reads["epc"][0]) == tag(0)["epc"]
+        del a, reads
@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from pipeline.presence import ARRIVE, DEPART, PresenceEngine, parse_zones  # noqa: E402
+
+ZONES = {"dock": [1, 2], "aisle": [3]}
+
+
+def read(epc, antenna, rssi):
+    return {"epc": epc, "antenna": antenna, "rssi": rssi}
+
+
+def engine(**kwargs):
+    options = dict(enter_rssi=-65.0, exit_rssi=-72.0, alpha=0.5, timeout=3.0,
+                   sweep_interval=0.0)
+    options.update(kwargs)
+    return PresenceEngine(ZONES, **options)
+
+
+def brief(events):
+    return [(e["event"], e["epc"], e["zone"], e["antenna"]) for e in events]
+
+
+def test_parse_zones():
+    assert parse_zones("dock=1,2; aisle=3") == {"dock": [1, 2], "aisle": [3]}
+    assert parse_zones({"dock": ["1"]}) == {"dock": [1]}
+    with pytest.raises(ValueError):
+        parse_zones("dock")
+
+
+@pytest.mark.parametrize("zones, kwargs", [
+    ({}, {}),
+    ({"dock": [1], "aisle": [1]}, {}),
+    ({"dock": [1]}, {"enter_rssi": -70.0, "exit_rssi": -60.0}),
+    ({"dock": [1]}, {"enter_rssi": {2: -60.0}}),
+])
+def test_rejects_bad_configuration(zones, kwargs):
+    with pytest.raises(ValueError):
+        PresenceEngine(zones, **kwargs)
+
+
+def test_arrival_hysteresis_and_departure():
+    presence = engine()
+    assert presence.update([read(b"a", 1, -70)], now=0.0) == []
+    # Smoothed: -70 then (-70 + -60) / 2 = -65, the enter threshold
+    events = presence.update([read(b"a", 1, -60)], now=1.0)
+    assert brief(events) == [(ARRIVE, b"a", "dock", 1)]
+    assert events[0]["rssi"] == -65.0
+    # -68.5 is under the enter threshold but above the exit one: still there
+    assert presence.update([read(b"a", 1, -72)], now=2.0) == []
+    assert presence.zones_of(b"a") == ["dock"]
+    # Weak reads do not keep it in the zone
+    assert presence.update([read(b"a", 2, -90)], now=4.0) == []
+    events = presence.update([read(b"a", 2, -90)], now=5.5)
+    assert brief(events) == [(DEPART, b"a", "dock", 1)]
+    assert events[0]["last_seen"] == 2.0
+    assert events[0]["dwell"] == 1.0
+    assert presence.in_zone("dock") == []
+
+
+def test_one_arrival_per_zone_from_the_strongest_antenna():
+    presence = engine()
+    events = presence.update([read(b"a", 1, -60), read(b"a", 2, -50), read(b"a", 3, -55)],
+                             now=0.0)
+    assert sorted(brief(events)) == [(ARRIVE, b"a", "aisle", 3), (ARRIVE, b"a", "dock", 2)]
+
+
+def test_reads_outside_zones_and_without_rssi():
+    presence = engine()
+    events = presence.update([read(b"a", 9, -40), read(b"b", 3, None)], now=0.0)
+    assert brief(events) == [(ARRIVE, b"b", "aisle", 3)]
+    assert presence.ignored == 1
+
+
+def test_new_tags_past_max_tags_are_dropped():
+    presence = engine(max_tags=2, initial_tags=1)
+    presence.update([read(bytes([i]), 1, -50) for i in range(4)], now=0.0)
+    assert len(presence) == 2
+    assert presence.dropped == 2
+
+
+def test_idle_tags_free_their_row():
+    presence = engine(forget_after=10.0)
+    presence.update([read(b"a", 1, -90)], now=0.0)
+    assert len(presence) == 1
+    presence.poll(now=11.0)
+    assert len(presence) == 0
+
+
+def walk(population, batches, batch_size, seed=1):
+    """Batches of reads of tags moving past the antennas."""
+    rng = random.Random(seed)
+    for b in range(batches):
+        now = b * 0.5
+        reads = []
+        for _ in range(batch_size):
+            tag = rng.randrange(population)
+            antenna = 1 + (tag + b // 4) % 4
+            reads.append(read(bytes([tag]), antenna, rng.gauss(-66.0, 6.0)))
+        yield now, reads
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 300])
+def test_small_and_vector_paths_agree(batch_size):
+    small = engine(vector_min_batch=10 ** 9)
+    vector = engine(vector_min_batch=0)
+    for now, reads in walk(40, 60, batch_size):
+        expected = small.update(reads, now)
+        events = vector.update(reads, now)
+        assert brief(events) == brief(expected)
+        assert [e["rssi"] for e in events] == pytest.approx([e["rssi"] for e in expected])
+    assert small.stats() == vector.stats()
+    assert small.arrivals and small.departures
@@ -0,0 +1,104 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pipeline.recent import RecentReads, start_query_server
+
+T0 = 1760000000.0
+EPC_A = bytes.fromhex("e28011606000020d8f3b2c11")
+EPC_B = bytes.fromhex("e28011606000020d8f3b2c12")
+
+
+def read(epc, antenna, rssi=-50, reader=None, seen_count=None):
+    return {"epc": epc, "antenna": antenna, "rssi": rssi, "reader": reader,
+            "seen_count": seen_count}
+
+
+@pytest.fixture
+def recent():
+    store = RecentReads(horizon=60.0, bucket=5.0)
+    store.add_many([read(EPC_A, 1, -60), read(EPC_B, 2)], now=T0)
+    store.add_many([read(EPC_A, 1, -55), read(EPC_A, 2, -70, seen_count=3)], now=T0 + 20)
+    return store
+
+
+def test_antenna_reads(recent):
+    assert set(recent.antenna(1, 30, now=T0 + 21)) == {EPC_A}
+    tags = recent.antenna((1, 2), 30, now=T0 + 21)
+    assert set(tags) == {EPC_A, EPC_B}
+    assert tags[EPC_A] == {"count": 5, "first_seen": T0, "last_seen": T0 + 20, "rssi": -55}
+    # Only the last 10 s: EPC_B was read before that
+    assert set(recent.antenna(2, 10, now=T0 + 21)) == {EPC_A}
+
+
+def test_epc_ports(recent):
+    ports = recent.epc(EPC_A, 60, now=T0 + 21)
+    assert ports[(None, 1)]["count"] == 2
+    assert ports[(None, 1)]["rssi"] == -55
+    assert ports[(None, 2)]["count"] == 3
+    assert recent.epc(b"\x00" * 12, 60, now=T0 + 21) == {}
+
+
+def test_last_seen(recent):
+    assert recent.last_seen(EPC_A, now=T0 + 21) == T0 + 20
+    assert recent.last_seen(EPC_B, antennas=2, now=T0 + 21) == T0
+    assert recent.last_seen(EPC_B, antennas=1, now=T0 + 21) is None
+    assert recent.last_seen(EPC_B, 10, now=T0 + 21) is None
+
+
+def test_overview(recent):
+    assert recent.overview(60, now=T0 + 21) == {(None, 1): {"epcs": 1, "count": 2},
+                                                (None, 2): {"epcs": 2, "count": 4}}
+
+
+def test_reads_past_the_horizon_are_forgotten(recent):
+    recent.add(read(EPC_B, 3), now=T0 + 70)
+    assert recent.last_seen(EPC_A, now=T0 + 70) == T0 + 20
+    recent.add(read(EPC_B, 3), now=T0 + 100)
+    assert recent.last_seen(EPC_A, now=T0 + 100) is None
+    assert recent.epc(EPC_A, 60, now=T0 + 100) == {}
+    assert recent.stats(now=T0 + 100)["epcs"] == 1
+
+
+def test_bucket_entries_are_bounded():
+    store = RecentReads(horizon=10.0, bucket=5.0, max_keys=2)
+    store.add_many([read(bytes([i]) * 12, 1) for i in range(5)], now=T0)
+    assert len(store.antenna(1, 10, now=T0)) == 2
+    assert store.dropped == 3
+
+
+def test_rejects_horizon_shorter_than_a_bucket():
+    with pytest.raises(ValueError):
+        RecentReads(horizon=1.0, bucket=5.0)
+
+
+def get_json(port, path):
+    try:
+        with urllib.request.urlopen("http://127.0.0.1:%d%s" % (port, path), timeout=5) as r:
+            return r.status, json.load(r)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e) if e.code == 400 else None
+
+
+def test_query_server():
+    store = RecentReads()
+    store.add_many([read(EPC_A, 1, reader="r1"), read(EPC_A, 2, reader="r1")])
+    server = start_query_server(store, port=0)
+    port = server.server_address[1]
+    try:
+        status, document = get_json(port, "/recent/epc/%s?antenna=2" % EPC_A.hex())
+        assert status == 200
+        assert document["present"] is True
+        assert sorted(p["antenna"] for p in document["ports"]) == [1, 2]
+
+        status, document = get_json(port, "/recent/antenna/1")
+        assert [tag["epc"] for tag in document["tags"]] == [EPC_A.hex()]
+
+        status, document = get_json(port, "/recent?seconds=soon")
+        assert status == 400
+        assert get_json(port, "/nowhere")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+from db import schema
+
+LEGACY_TAGS = """
+CREATE TABLE tags (
+    id INTEGER PRIMARY KEY,
+    epc TEXT,
+    antenna INTEGER,
+    channel INTEGER,
+    seen_count INTEGER,
+    last_seen TEXT
+)
+"""
+
+
+def snapshot(conn):
+    """What a migration can change: the schema, the version and the rows."""
+    objects = conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY name").fetchall()
+    tables = [name for kind, name, _ in objects if kind == "table"]
+    rows = {name: conn.execute("SELECT * FROM %s ORDER BY 1" % name).fetchall()
+            for name in tables}
+    return objects, schema.get_version(conn), rows
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "tags.db"))
+    conn.execute(LEGACY_TAGS)
+    with conn:
+        conn.executemany("INSERT INTO tags (epc, antenna, channel, seen_count, last_seen)"
+                         " VALUES (?, ?, ?, ?, ?)",
+                         [("e2801160", 1, 3, 2, "1760000000000000"),
+                          ("e2801161", 2, 7, 1, "1760000000000100")])
+    yield conn
+    conn.close()
+
+
+def crash_after(step):
+    def failing(conn):
+        step(conn)
+        raise RuntimeError("crashed mid-migration")
+    return failing
+
+
+@pytest.mark.parametrize("failing_step", [0, 1])
+def test_failed_step_leaves_database_unchanged(legacy_db, monkeypatch, failing_step):
+    real = schema.MIGRATIONS
+    failing = list(real)
+    failing[failing_step] = crash_after(real[failing_step])
+    monkeypatch.setattr(schema, "MIGRATIONS", failing)
+    # Up to, but not including, the step that fails
+    monkeypatch.setattr(schema, "SCHEMA_VERSION", failing_step)
+    schema.migrate(legacy_db)
+    before = snapshot(legacy_db)
+
+    monkeypatch.setattr(schema, "SCHEMA_VERSION", len(real))
+    with pytest.raises(RuntimeError):
+        schema.migrate(legacy_db)
+    assert snapshot(legacy_db) == before
+    assert not legacy_db.in_transaction
+
+    # The next run applies the step cleanly
+    monkeypatch.setattr(schema, "MIGRATIONS", real)
+    assert schema.migrate(legacy_db) == len(real)
+    rows = legacy_db.execute("SELECT epc, antenna, last_seen FROM tag_reads ORDER BY id").fetchall()
+    assert rows == [(b"\xe2\x80\x11\x60", 1, 1760000000000000),
+                    (b"\xe2\x80\x11\x61", 2, 1760000000000100)]
+
+
+def test_migrate_restores_isolation_level(legacy_db):
+    legacy_db.isolation_level = "DEFERRED"
+    schema.migrate(legacy_db)
+    assert legacy_db.isolation_level == "DEFERRED"
+    assert schema.get_version(legacy_db) == schema.SCHEMA_VERSION
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from db.connection import close_connection, get_connection
+from db.queries import INSERT_TAG_READ
+from db.sharded import (
+    SHARD_BY_EPC, SHARD_BY_READER, ShardedTagDB, ShardedTagWriter, find_shards, shard_index,
+    shard_path, shard_paths)
+from db.writer import tag_row
+
+T0 = 1760000000000000
+
+
+def read(n, epc=None, antenna=1, reader="r1:5084"):
+    return {"epc": epc or bytes([0xe2, n % 7]), "antenna": antenna, "channel": 1,
+            "seen_count": 1, "rssi": -50, "first_seen": T0 + n, "last_seen": T0 + n,
+            "reader": reader}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "tags.db")
+
+
+def write_shards(db_path, tags, key=SHARD_BY_EPC, shards=3):
+    """Shard files as ShardedTagWriter would leave them, written in-process."""
+    paths = shard_paths(db_path, key, shards)
+    column = 0 if key == SHARD_BY_EPC else 7
+    try:
+        for path in paths:
+            get_connection(path)
+        for tag in tags:
+            row = tag_row(tag)
+            conn = get_connection(paths[shard_index(row[column], shards)])
+            with conn:
+                conn.execute(INSERT_TAG_READ, row)
+    finally:
+        for path in paths:
+            close_connection(path)
+    return paths
+
+
+@pytest.fixture
+def sharded_db(db_path):
+    tags = [read(n, antenna=1 + n % 2) for n in range(40)]
+    write_shards(db_path, tags)
+    db = ShardedTagDB(db_path)
+    yield db
+    db.close()
+
+
+def test_shard_names_and_layout(db_path):
+    assert shard_path(db_path, SHARD_BY_EPC, 1, 4).endswith("tags.epc-1-of-4.db")
+    paths = write_shards(db_path, [read(0)], key=SHARD_BY_READER, shards=2)
+    assert find_shards(db_path) == (SHARD_BY_READER, paths)
+
+
+def test_find_shards_reports_missing_and_mixed_layouts(db_path):
+    with pytest.raises(FileNotFoundError):
+        find_shards(db_path)
+    paths = write_shards(db_path, [read(0)], shards=2)
+    os.remove(paths[1])
+    with pytest.raises(FileNotFoundError):
+        find_shards(db_path)
+    write_shards(db_path, [read(0)], shards=2)
+    write_shards(db_path, [read(0)], key=SHARD_BY_READER, shards=2)
+    with pytest.raises(ValueError):
+        find_shards(db_path)
+
+
+def test_queries_merge_every_shard_oldest_first(sharded_db):
+    db = sharded_db
+    assert db.count() == 40
+    assert db.time_range() == (T0, T0 + 39)
+    rows = list(db.reads_between(T0 + 5, T0 + 25))
+    assert [row[6] for row in rows] == list(range(T0 + 5, T0 + 25))
+    rows = db.reads_by_antenna(2, T0, T0 + 40)
+    assert [row[6] for row in rows] == [T0 + n for n in range(1, 40, 2)]
+
+
+def test_epc_lookups_use_its_shard(sharded_db):
+    db = sharded_db
+    epc = bytes([0xe2, 3])
+    assert len(db._connections(epc)) == 1
+    rows = db.reads_by_epc(epc, T0, T0 + 40)
+    assert [row[6] for row in rows] == [T0 + n for n in range(3, 40, 7)]
+    assert db.last_seen(epc) == T0 + 38
+    assert db.last_seen(b"\x00") is None
+
+
+def test_writer_processes_store_every_read(db_path):
+    writer = ShardedTagWriter(db_path, shards=2, chunk_rows=16, flush_interval=0.2)
+    writer.start()
+    try:
+        writer.put_many(read(n, epc=n.to_bytes(12, "big")) for n in range(300))
+        # No row can be made of this one; the rest of the batch still goes
+        writer.put_many([{"antenna": 1}, read(300, epc=b"\x01" * 12)])
+    finally:
+        writer.close(timeout=30)
+    assert writer.stats()["rows"] == 301
+    assert all(writer.stats()["shard_rows"])
+    db = ShardedTagDB(db_path)
+    try:
+        assert db.count() == 301
+        assert db.last_seen((7).to_bytes(12, "big")) == T0 + 7
+    finally:
+        db.close()
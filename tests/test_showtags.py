@@ -0,0 +1,82 @@
+import pytest
+
+from db.connection import close_connection, get_connection
+from pipeline.showtags import ShowTagsParser, load_show_tags
+
+EPC_1 = "E28011606000020D8F3B2C11"
+EPC_2 = "E28011606000020D8F3B2C12"
+
+
+def parse(text, reader=None):
+    return list(ShowTagsParser(reader).parse(text.splitlines()))
+
+
+def test_table_with_separators():
+    records = parse(f"""Tag inventory
+EPC                      | Ant | RSSI     | Count | Last Seen
+{EPC_1} | 1   | -52 dBm  | 14    | 1760000000123456
+{EPC_2} | 3   | -61.5    | 2     | 1760000000123
+Total: 2 tags
+""", reader="r1")
+    assert records == [
+        {"epc": bytes.fromhex(EPC_1), "antenna": 1, "rssi": -52, "seen_count": 14,
+         "channel": None, "first_seen": None, "last_seen": 1760000000123456, "reader": "r1"},
+        {"epc": bytes.fromhex(EPC_2), "antenna": 3, "rssi": -61, "seen_count": 2,
+         "channel": None, "first_seen": None, "last_seen": 1760000000123000, "reader": "r1"},
+    ]
+
+
+def test_table_with_single_spaces():
+    records = parse(f"EPC Antenna RSSI\n{EPC_1} 2 -48\n")
+    assert [(r["epc"], r["antenna"], r["rssi"]) for r in records] == [
+        (bytes.fromhex(EPC_1), 2, -48)]
+
+
+def test_key_value_records_over_several_lines():
+    parser = ShowTagsParser()
+    lines = [f"EPC: {EPC_1}", "Antenna: 1", "RSSI: -50", "",
+             f"EPC: {EPC_2}", "Antenna: 2", f"EPC: {EPC_1}", "Antenna: 4"]
+    records = []
+    for line in lines:
+        records.extend(parser.feed(line))
+    # The last record is only complete at the end of the output
+    assert [r["antenna"] for r in records] == [1, 2]
+    records.extend(parser.flush())
+    assert [(r["epc"].hex().upper(), r["antenna"]) for r in records] == [
+        (EPC_1, 1), (EPC_2, 2), (EPC_1, 4)]
+    assert records[0]["rssi"] == -50
+
+
+def test_key_value_on_one_line():
+    records = parse(f"Tag: epc={EPC_1}, ant=2, count=5, time=2025-10-09T12:00:00Z")
+    assert records[0]["antenna"] == 2
+    assert records[0]["seen_count"] == 5
+    assert records[0]["last_seen"] == 1760011200000000
+
+
+def test_unrecognised_lines_are_skipped():
+    parser = ShowTagsParser()
+    assert list(parser.parse(["reader> show tags", "No tags found", "reader>"])) == []
+    assert parser.skipped == 3
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1760000000123456", 1760000000123456),
+    ("1760000000123", 1760000000123000),
+    ("1760000000.5", 1760000000500000),
+    ("2025-10-09T12:00:00+02:00", 1760004000000000),
+    ("yesterday", None),
+])
+def test_timestamps(value, expected):
+    assert parse(f"EPC={EPC_1} Last={value}")[0]["last_seen"] == expected
+
+
+def test_load_show_tags(tmp_path):
+    db_path = str(tmp_path / "tags.db")
+    lines = ["EPC, Antenna"] + [f"{EPC_1[:-4]}{n:04X}, {1 + n % 4}" for n in range(25)]
+    try:
+        parser = load_show_tags(lines, db_path, reader="r1", batch_size=10)
+        count, = get_connection(db_path).execute("SELECT COUNT(*) FROM tag_reads").fetchone()
+    finally:
+        close_connection(db_path)
+    assert parser.records == count == 25
@@ -0,0 +1,136 @@
+import os
+from queue import Empty, Full
+
+import pytest
+
+from pipeline.epc import epc_from_bytes
+from pipeline.tagqueue import (
+    POLICY_BLOCK, POLICY_DROP_DUPLICATES, POLICY_DROP_OLDEST, POLICY_SPILL, SPILL_RECORD,
+    TagQueue)
+
+
+def read(epc, n=0):
+    return {"epc": epc, "antenna": 1, "rssi": -50, "last_seen": n}
+
+
+def drain(queue):
+    items = []
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Empty:
+            return items
+
+
+def test_block_policy_raises_or_drops_when_full():
+    queue = TagQueue(maxsize=2, policy=POLICY_BLOCK, block_timeout=0.01)
+    queue.put(read(b"a"))
+    queue.put(read(b"b"))
+    with pytest.raises(Full):
+        queue.put_nowait(read(b"c"))
+    queue.put(read(b"c"))
+    assert [item["epc"] for item in drain(queue)] == [b"a", b"b"]
+    assert queue.dropped == 1
+
+
+def test_drop_oldest_keeps_the_newest_reads():
+    queue = TagQueue(maxsize=3, policy=POLICY_DROP_OLDEST)
+    queue.put_many(read(bytes([i])) for i in range(5))
+    assert [item["epc"] for item in drain(queue)] == [b"\x02", b"\x03", b"\x04"]
+    assert queue.dropped == 2
+
+
+def test_drop_duplicates_drops_older_reads_of_queued_tags():
+    queue = TagQueue(maxsize=3, policy=POLICY_DROP_DUPLICATES)
+    queue.put_many([read(b"a", 0), read(b"b", 1), read(b"c", 2), read(b"b", 3)])
+    assert queue.qsize() == 3
+    assert [(item["epc"], item["last_seen"]) for item in drain(queue)] == [
+        (b"a", 0), (b"c", 2), (b"b", 3)]
+
+
+def test_drop_duplicates_falls_back_to_the_oldest_read():
+    queue = TagQueue(maxsize=2, policy=POLICY_DROP_DUPLICATES)
+    queue.put_many([read(b"a"), read(b"b"), read(b"c")])
+    assert [item["epc"] for item in drain(queue)] == [b"b", b"c"]
+    assert queue.dropped == 1
+
+
+def test_drop_duplicates_bounds_dropped_reads_held():
+    maxsize = 64
+    queue = TagQueue(maxsize=maxsize, policy=POLICY_DROP_DUPLICATES)
+    for n in range(10000):
+        queue.put(read(bytes([n % 80]), n))
+        assert len(queue._items) <= maxsize + maxsize // 16
+    items = drain(queue)
+    assert len(items) == maxsize
+    assert [item["last_seen"] for item in items] == sorted(item["last_seen"] for item in items)
+    assert len({item["epc"] for item in items}) == maxsize
+
+
+def test_spill_replays_overflow_in_order(tmp_path):
+    spill_dir = str(tmp_path / "spill")
+    queue = TagQueue(maxsize=4, policy=POLICY_SPILL, spill_dir=spill_dir,
+                     spill_segment_bytes=200)
+    queue.put_many(read(bytes([i]), i) for i in range(50))
+    assert queue.qsize() == 50
+    assert queue.spilled == 46
+    assert [item["last_seen"] for item in drain(queue)] == list(range(50))
+    assert queue.replayed == 46
+    assert os.listdir(spill_dir) == []
+
+
+def test_spill_close_keeps_order_for_the_next_run(tmp_path):
+    spill_dir = str(tmp_path / "spill")
+    queue = TagQueue(maxsize=4, policy=POLICY_SPILL, spill_dir=spill_dir)
+    queue.put_many(read(bytes([i]), i) for i in range(20))
+    # Part way through a replay: some reads are back in memory, the rest on disk
+    taken = [queue.get()["last_seen"] for _ in range(6)]
+    queue.close()
+
+    queue = TagQueue(maxsize=4, policy=POLICY_SPILL, spill_dir=spill_dir)
+    assert queue.qsize() == 14
+    assert taken + [item["last_seen"] for item in drain(queue)] == list(range(20))
+
+
+def test_spill_recovery_cuts_off_a_torn_record(tmp_path):
+    spill_dir = str(tmp_path / "spill")
+    queue = TagQueue(maxsize=1, policy=POLICY_SPILL, spill_dir=spill_dir)
+    queue.put_many(read(bytes([i]), i) for i in range(4))
+    queue.close()
+    path = os.path.join(spill_dir, sorted(os.listdir(spill_dir))[0])
+    with open(path, "ab") as f:
+        f.write(SPILL_RECORD.pack(100) + b"torn")
+
+    queue = TagQueue(maxsize=1, policy=POLICY_SPILL, spill_dir=spill_dir)
+    assert [item["last_seen"] for item in drain(queue)] == [0, 1, 2, 3]
+
+
+def test_spill_get_survives_unreadable_records(tmp_path):
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    junk = b"not a pickle"
+    (spill_dir / "tagspill-00000000.seg").write_bytes(
+        (SPILL_RECORD.pack(len(junk)) + junk) * 3)
+
+    queue = TagQueue(maxsize=2, policy=POLICY_SPILL, spill_dir=str(spill_dir))
+    with pytest.raises(Empty):
+        queue.get(timeout=0.05)
+    assert queue.dropped == 3
+    assert queue.qsize() == 0
+
+
+def test_replayed_epcs_are_interned(tmp_path):
+    queue = TagQueue(maxsize=1, policy=POLICY_SPILL, spill_dir=str(tmp_path))
+    epc = epc_from_bytes(b"\xe2\x80\x11\x60")
+    queue.put_many([read(epc), read(bytes(bytearray(epc)))])
+    first, second = drain(queue)
+    assert first["epc"] is second["epc"] is epc
+
+
+def test_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        TagQueue(policy="lifo")
+    with pytest.raises(ValueError):
+        TagQueue(maxsize=0)
+    with pytest.raises(ValueError):
+        TagQueue(policy=POLICY_SPILL)
@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+import pytest
+
+from db.writer import BatchedTagWriter, tag_row
+
+
+def read(n, **fields):
+    tag = {"epc": bytes([0xe2, n]), "antenna": 1, "channel": 3, "seen_count": 1,
+           "rssi": -50, "first_seen": 1760000000000000 + n,
+           "last_seen": 1760000000000000 + n, "reader": "r1:5084"}
+    tag.update(fields)
+    return tag
+
+
+def stored(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT epc, antenna, channel, seen_count, rssi, first_seen,"
+                            " last_seen, reader FROM tag_reads ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "tags.db")
+
+
+def test_commits_in_batches_and_flushes_on_close(db_path):
+    writer = BatchedTagWriter(db_path, batch_size=10, flush_interval=0.5)
+    writer.start()
+    writer.put_many(read(n) for n in range(25))
+    deadline = time.monotonic() + 10
+    while writer.rows_written < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Two full batches, then the last five on the timer or at close()
+    writer.close()
+    assert stored(db_path) == [tag_row(read(n)) for n in range(25)]
+    assert (writer.rows_written, writer.commits) == (25, 3)
+
+
+def test_tag_row_defaults_last_seen_to_now():
+    row = tag_row({"epc": b"\x01"})
+    assert row[:6] == (b"\x01", None, None, None, None, None)
+    assert row[6] > 1700000000000000
+    assert row[7] is None
+
+
+def test_invalid_reads_are_dropped_not_fatal(db_path):
+    writer = BatchedTagWriter(db_path, batch_size=100)
+    writer.start()
+    writer.put_many([read(0), {"antenna": 1}, read(1, antenna=2 ** 64), read(2),
+                     read(3, rssi=object())])
+    writer.close()
+    assert [row[0] for row in stored(db_path)] == [b"\xe2\x00", b"\xe2\x02"]
+    assert writer.rows_written == 2